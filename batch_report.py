@@ -0,0 +1,173 @@
+"""
+批量报告生成
+
+并行渲染多个项目的报告，每完成一份就写入 ZIP 并立即输出，
+不等全部完成、也不在内存或磁盘上拼出完整的 ZIP。
+单个项目失败（例如 data_json 损坏）不会中断整批，
+所有条目的结果汇总写入 ZIP 末尾的 _batch_report.json。
+"""
+
+import contextlib
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Union
+
+# 批量渲染并发数
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+BATCH_REPORT_NAME = "_batch_report.json"
+
+
+@dataclass
+class BatchItem:
+    project_id: int
+    name: str
+    code: str
+    data_json: str
+    # 不渲染、直接记为失败的原因（如请求的项目不存在）
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchResult:
+    project_id: int
+    name: str
+    status: str = "ok"
+    filename: Optional[str] = None
+    error: Optional[str] = None
+
+
+def safe_filename(text: str) -> str:
+    """去掉文件名中不允许的字符"""
+    text = re.sub(r'[\\/:*?"<>|\s]+', "_", text).strip("._")
+    return text or "report"
+
+
+class _StreamBuffer:
+    """zipfile 的写入目标：只追加、不可 seek，由调用方取走已写入的数据"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# render 的返回值：文件路径，或在 with 语句中给出路径的对象（如缓存租约，写入 ZIP 后释放）
+Rendered = Union[str, ContextManager[str]]
+
+
+def opened(rendered: Rendered) -> ContextManager[str]:
+    return contextlib.nullcontext(rendered) if isinstance(rendered, str) else rendered
+
+
+def _discard(future):
+    """已经渲染好但不再写入的结果，释放其占用"""
+    if future.done() and not future.cancelled() and future.exception() is None:
+        with opened(future.result()):
+            pass
+
+
+def _render_item(item: BatchItem, kind: str, render: Callable[[dict, str], Rendered]) -> Rendered:
+    if item.error:
+        raise LookupError(item.error)
+    try:
+        data = json.loads(item.data_json or "{}")
+    except ValueError as e:
+        raise ValueError(f"data_json 解析失败: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("data_json 不是 JSON 对象")
+    return render(data, kind)
+
+
+def iter_batch_zip(
+    items: Iterable[BatchItem],
+    kind: str,
+    render: Callable[[dict, str], Rendered],
+    workers: int = BATCH_WORKERS,
+    on_result: Optional[Callable[[BatchResult], None]] = None,
+    submit: Optional[Callable[..., Future]] = None,
+) -> Iterator[bytes]:
+    """
+    并行渲染 items，按完成顺序把每份报告写入 ZIP 并逐块输出。
+    render(data, kind) 返回生成好的文件路径，或给出路径的租约（见 Rendered）。
+    submit(fn, *args) 返回 Future，用于把渲染交给共享的线程池（如服务端的渲染池）；
+    不传时使用本次专用的线程池。同时提交的渲染不超过 workers 个，其余等有结果写出后再提交，
+    中途关闭（客户端断开）时取消尚未开始的渲染。
+    """
+    buffer = _StreamBuffer()
+    results: List[BatchResult] = []
+    used_names = set()
+    own_executor = None
+    if submit is None:
+        own_executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+        submit = own_executor.submit
+    queue = iter(items)
+    running: Dict[Future, BatchItem] = {}
+
+    def fill():
+        while len(running) < max(1, workers):
+            item = next(queue, None)
+            if item is None:
+                return
+            running[submit(_render_item, item, kind, render)] = item
+
+    try:
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            fill()
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    result = BatchResult(project_id=item.project_id, name=item.name)
+                    try:
+                        with opened(future.result()) as path:
+                            base = safe_filename(f"{item.code or item.project_id}_{item.name}")
+                            arcname = f"{base}.{kind}"
+                            if arcname in used_names:
+                                arcname = f"{base}_{item.project_id}.{kind}"
+                            used_names.add(arcname)
+                            # PDF 本身已经压缩过，直接存储
+                            compress = zipfile.ZIP_STORED if kind == "pdf" else zipfile.ZIP_DEFLATED
+                            zf.write(path, arcname, compress_type=compress)
+                        result.filename = arcname
+                    except Exception as e:
+                        result.status = "error"
+                        result.error = str(e)
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+                    yield buffer.drain()
+                fill()
+
+            summary = {
+                "total": len(results),
+                "succeeded": sum(1 for r in results if r.status == "ok"),
+                "failed": sum(1 for r in results if r.status != "ok"),
+                "items": [
+                    {"project_id": r.project_id, "name": r.name, "status": r.status,
+                     "filename": r.filename, "error": r.error}
+                    for r in sorted(results, key=lambda r: r.project_id)
+                ],
+            }
+            zf.writestr(BATCH_REPORT_NAME, json.dumps(summary, ensure_ascii=False, indent=2))
+        yield buffer.drain()
+    finally:
+        # 取消还没开始的渲染；已经完成或正在进行的，结果出来后释放
+        for future in running:
+            future.cancel()
+            future.add_done_callback(_discard)
+        if own_executor is not None:
+            own_executor.shutdown(wait=False, cancel_futures=True)
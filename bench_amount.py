@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+金额大写基准测试：对比原 server.amount_to_chinese（逐位拼接后修补）与 chinese_amount 的查表实现
+
+正确性由 test_chinese_amount.py 检查，这里只计时。
+
+用法: python3 bench_amount.py [金额数] [计时次数]
+"""
+
+import random
+import sys
+import time
+
+from chinese_amount import amount_to_chinese, amounts_to_chinese, fen_to_chinese
+
+
+def legacy_amount_to_chinese(amount: float) -> str:
+    """原 server.py 中的实现，仅用于对比"""
+    if amount == 0:
+        return "零元整"
+    chinese_numbers = ["零", "壹", "贰", "叁", "肆", "伍", "陆", "柒", "捌", "玖"]
+    units = ["", "拾", "佰", "仟"]
+    big_units = ["", "万", "亿", "兆"]
+    amount_fen = int(round(amount * 100))
+    yuan = amount_fen // 100
+    jiao = (amount_fen % 100) // 10
+    fen = amount_fen % 10
+    if yuan == 0:
+        result = "零"
+    else:
+        yuan_str = str(yuan)
+        length = len(yuan_str)
+        result = ""
+        for i, digit in enumerate(yuan_str):
+            digit_int = int(digit)
+            pos = length - i - 1
+            if digit_int != 0:
+                result += chinese_numbers[digit_int]
+                result += units[pos % 4]
+            else:
+                if result and result[-1] != "零":
+                    result += "零"
+            if pos % 4 == 0 and pos > 0:
+                unit_index = pos // 4
+                if unit_index < len(big_units):
+                    result += big_units[unit_index]
+                    if result.endswith("零" + big_units[unit_index]):
+                        result = result[:-1-len(big_units[unit_index])] + big_units[unit_index]
+    result = result.rstrip("零")
+    result += "元"
+    if jiao == 0 and fen == 0:
+        result += "整"
+    else:
+        if jiao != 0:
+            result += chinese_numbers[jiao] + "角"
+        if fen != 0:
+            result += chinese_numbers[fen] + "分"
+    return result
+
+
+def bench(label, convert, amounts, rounds):
+    convert(amounts[:100])  # 预热
+    start = time.perf_counter()
+    for _ in range(rounds):
+        convert(amounts)
+    elapsed = (time.perf_counter() - start) / rounds / len(amounts)
+    print(f"{label:<28} {elapsed * 1e6:8.2f} µs/个")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    rng = random.Random(1)
+    # 报告中的金额（万元，两位小数），与调整项表格规模相当的重复
+    amounts = [round(rng.uniform(0, 100000), 2) * 10000 for _ in range(count)]
+    repeated = amounts[:50] * 40
+
+    def uncached(values):
+        fen_to_chinese.cache_clear()
+        amount_to_chinese.cache_clear()
+        return amounts_to_chinese(values)
+
+    print(f"计时: {len(amounts)} 个金额，每种方式 {rounds} 轮")
+    old = bench("原实现", lambda values: [legacy_amount_to_chinese(v) for v in values], amounts, rounds)
+    cold = bench("查表（无缓存命中）", uncached, amounts, rounds)
+    bench("查表（逐个调用，已缓存）", lambda values: [amount_to_chinese(v) for v in values], amounts, rounds)
+    hot = bench("查表 批量（金额重复）", amounts_to_chinese, repeated, rounds)
+    print(f"无缓存提速 {old / cold:.1f} 倍，缓存命中提速 {old / hot:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+预览转换基准测试：用本地的替身转换器对比 /api/preview 的延迟
+
+替身是一个模拟 soffice 的脚本：每次启动先等待 --startup 秒（模拟 LibreOffice 冷启动），
+每次转换等待 --convert 秒，输出一页空白 PDF。
+- 逐次启动：SubprocessConverter 每次预览都启动一次替身（与原来的 soffice --convert-to 相同）
+- 常驻实例池：ConverterPool 的实例换成常驻的替身进程（通过标准输入输出下发任务），
+  轮询分配、任务计数回收、超时重启都走 converter.py 中的实现
+
+每次请求的数据都不同，不会命中预览缓存；分段预览关闭，每次都整份转换。
+数据库、预览缓存和转换出的文件都写在临时目录里，结束时删除。
+
+用法: python3 bench_converter.py [请求数] [--startup 秒] [--convert 秒] [--workers 实例数]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+STANDIN_SCRIPT = r'''
+import os, sys, time
+
+import pypdfium2 as pdfium
+
+STARTUP = float(os.environ.get("STANDIN_STARTUP", "2"))
+CONVERT = float(os.environ.get("STANDIN_CONVERT", "0.15"))
+
+
+def convert(src, dst):
+    time.sleep(CONVERT)
+    pdf = pdfium.PdfDocument.new()
+    pdf.new_page(595, 842)
+    pdf.save(dst)
+    pdf.close()
+
+
+time.sleep(STARTUP)
+args = sys.argv[1:]
+if "--serve" in args:
+    # 常驻模式：每行 "源文件\t目标文件"，转换完成后回复一行
+    print("ready", flush=True)
+    for line in sys.stdin:
+        src, dst = line.rstrip("\n").split("\t")
+        try:
+            convert(src, dst)
+            print("ok", flush=True)
+        except Exception as e:
+            print(f"error {e}", flush=True)
+else:
+    # 与 soffice --headless --convert-to pdf --outdir 目录 源文件 相同的参数
+    out_dir = args[args.index("--outdir") + 1]
+    src = args[-1]
+    convert(src, os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + ".pdf"))
+'''
+
+
+def make_standin(tmp_dir: str) -> str:
+    script = os.path.join(tmp_dir, "standin_soffice.py")
+    with open(script, "w", encoding="utf-8") as f:
+        f.write(STANDIN_SCRIPT)
+    launcher = os.path.join(tmp_dir, "soffice")
+    with open(launcher, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    os.chmod(launcher, 0o755)
+    return launcher
+
+
+def standin_pool(soffice: str, workers: int, work_dir: str):
+    """实例换成常驻替身进程的 ConverterPool"""
+    from converter import ConversionError, ConverterPool, OfficeWorker
+
+    class StandInWorker(OfficeWorker):
+        def start(self):
+            self.process = subprocess.Popen(
+                [self.soffice_path, "--serve"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            )
+            if self.process.stdout.readline().strip() != "ready":
+                raise ConversionError(f"替身实例 {self.index} 启动失败")
+            self.jobs = 0
+            self.desktop = self.process
+
+        def _convert(self, src_path: str, dst_path: str):
+            self.process.stdin.write(f"{src_path}\t{dst_path}\n")
+            self.process.stdin.flush()
+            reply = self.process.stdout.readline().strip()
+            if reply != "ok":
+                raise ConversionError(reply or "替身实例已退出")
+
+    pool = ConverterPool(size=workers, soffice_path=soffice, work_dir=work_dir)
+    pool.workers = [StandInWorker(i, soffice, None, work_dir) for i in range(max(1, workers))]
+    return pool
+
+
+def bench(label: str, client, server, converter, rounds: int):
+    # 常驻实例在计时之前启动，与服务启动时预热相同
+    converter.start()
+    server.converter = converter
+    times = []
+    try:
+        for i in range(rounds):
+            data = {"project_name": f"替身转换基准 {label} {i} {time.time()}"}
+            start = time.perf_counter()
+            r = client.post("/api/preview", json={"data": data})
+            times.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                raise SystemExit(f"{label}: /api/preview 返回 {r.status_code}: {r.text[:200]}")
+    finally:
+        converter.shutdown()
+    times.sort()
+    p50 = times[len(times) // 2]
+    print(f"{label:<16} p50 {p50 * 1000:8.1f} ms   "
+          f"min {times[0] * 1000:8.1f} ms   max {times[-1] * 1000:8.1f} ms")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description="替身转换器下的预览延迟")
+    parser.add_argument("rounds", type=int, nargs="?", default=8, help="每种方式的请求数")
+    parser.add_argument("--startup", type=float, default=2.0, help="替身启动耗时（秒），模拟 LibreOffice 冷启动")
+    parser.add_argument("--convert", type=float, default=0.15, help="替身单次转换耗时（秒）")
+    parser.add_argument("--workers", type=int, default=2, help="常驻实例数")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_converter_")
+    os.environ["STANDIN_STARTUP"] = str(args.startup)
+    os.environ["STANDIN_CONVERT"] = str(args.convert)
+    os.environ["SECTION_PREVIEW"] = "0"
+    # 在导入 server 之前设置：数据库、上传、缓存等目录都建在临时目录里
+    os.environ["DATA_DIR"] = tmp_dir
+
+    from fastapi.testclient import TestClient
+
+    import server
+    from converter import SubprocessConverter
+
+    soffice = make_standin(tmp_dir)
+
+    print(f"替身转换器: 启动 {args.startup:g} s，转换 {args.convert:g} s；每种方式 {args.rounds} 次预览")
+    try:
+        with TestClient(server.app) as client:
+            cold = bench("逐次启动", client, server, SubprocessConverter(soffice), args.rounds)
+            warm = bench(f"常驻实例池 ×{args.workers}", client, server,
+                         standin_pool(soffice, args.workers, os.path.join(tmp_dir, "pool")), args.rounds)
+        print(f"p50 延迟降低 {(1 - warm / cold) * 100:.1f}%（{cold * 1000:.0f} ms -> {warm * 1000:.0f} ms）")
+    finally:
+        server.engine.dispose()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
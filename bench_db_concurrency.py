@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+数据库并发压测：模拟多个 uvicorn worker（多进程）× 多线程，同时保存项目数据和上传文件，
+检查是否出现 "database is locked" 等错误，以及文件引用计数是否一致。
+
+默认使用临时目录里的 SQLite 数据库，不影响 database.db；可以用 DATABASE_URL 指定其他数据库。
+上传的测试文件在结束时随测试项目一起删除。
+
+用法: python3 bench_db_concurrency.py [进程数] [每进程线程数] [每线程轮数]
+有错误或数据不一致时退出码为 1。
+"""
+
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+PROJECTS = 8
+
+
+def run_worker(proc_idx, threads, rounds, project_ids, results):
+    from fastapi.testclient import TestClient
+
+    import server
+
+    latencies = {"save": [], "upload": []}
+    errors = []
+    lock = threading.Lock()
+
+    def request(kind, send):
+        """服务端未处理的异常（如 OperationalError: database is locked）原样记入错误，不只是一个 500"""
+        start = time.perf_counter()
+        try:
+            r = send()
+            error = None if r.status_code == 200 else f"{kind} {r.status_code}: {r.text[:200]}"
+        except Exception as e:
+            error = f"{kind} {type(e).__name__}: {str(e)[:200]}"
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[kind].append(elapsed)
+            if error:
+                errors.append(error)
+
+    def hammer(thread_idx):
+        client = TestClient(server.app)
+        rng = random.Random(proc_idx * 1000 + thread_idx)
+        for i in range(rounds):
+            project_id = rng.choice(project_ids)
+            data = {"project_name": f"压测 {proc_idx}-{thread_idx}-{i}", "amount": rng.random() * 1e6}
+            request("save", lambda: client.put(f"/api/projects/{project_id}/save", json={"data": data}))
+
+            # 一部分上传内容重复，覆盖引用计数增加的路径
+            content = os.urandom(4096) if rng.random() < 0.7 else b"duplicate content"
+            request("upload", lambda: client.post(
+                f"/api/projects/{project_id}/upload",
+                files={"file": (f"f{i}.bin", content, "application/octet-stream")},
+                data={"category": "其他"},
+            ))
+
+    pool = [threading.Thread(target=hammer, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put((latencies, errors))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else 0.0
+
+
+def run(procs: int, threads: int, rounds: int, verbose: bool = True) -> dict:
+    """
+    在临时数据库上压测，返回 {"latencies", "errors", "locked", "consistent", "elapsed"}。
+    locked 为包含 "database is locked" 的错误数；test_db_concurrency.py 用它做自动化检查。
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    tmp_dir = tempfile.mkdtemp(prefix="bench_db_")
+    # 在导入 server 之前设置：数据库、上传文件等都放在临时目录里（子进程继承环境变量）
+    os.environ["DATA_DIR"] = tmp_dir
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, func, select
+
+    import server
+    from blob_store import FileBlob
+
+    server.create_db_and_tables()
+    client = TestClient(server.app)
+    project_ids = [
+        client.post("/api/projects", json={"name": f"并发压测 {i}", "code": "BENCH"}).json()["id"]
+        for i in range(PROJECTS)
+    ]
+
+    log(f"数据库: {server.engine.url.render_as_string(hide_password=True)}")
+    log(f"{procs} 个进程 × {threads} 个线程 × {rounds} 轮（每轮一次保存 + 一次上传）")
+
+    try:
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        start = time.perf_counter()
+        workers = [ctx.Process(target=run_worker, args=(i, threads, rounds, project_ids, results))
+                   for i in range(procs)]
+        for w in workers:
+            w.start()
+        collected = [results.get() for _ in workers]
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = {"save": [], "upload": []}
+        errors = []
+        for lat, errs in collected:
+            for key in latencies:
+                latencies[key].extend(lat[key])
+            errors.extend(errs)
+
+        total = sum(len(v) for v in latencies.values())
+        log(f"总请求 {total}，耗时 {elapsed:.1f} s，{total / elapsed:.0f} 请求/秒")
+        for key, values in latencies.items():
+            log(f"  {key:<8} p50 {percentile(values, 0.5):8.1f} ms   "
+                f"p99 {percentile(values, 0.99):8.1f} ms   max {percentile(values, 1.0):8.1f} ms")
+
+        # 校验：文件记录数 = 成功上传数，引用计数之和 = 引用内容寻址文件的记录数
+        with Session(server.engine) as session:
+            file_rows = session.exec(
+                select(func.count()).select_from(server.ProjectFile)
+                .where(server.ProjectFile.project_id.in_(project_ids))
+            ).one()
+            blob_rows = session.exec(
+                select(func.count()).select_from(server.ProjectFile).where(server.ProjectFile.blob_sha256.is_not(None))
+            ).one()
+            ref_total = session.exec(select(func.coalesce(func.sum(FileBlob.ref_count), 0))).one()
+        uploads_ok = len(latencies["upload"]) - sum(1 for e in errors if e.startswith("upload"))
+        consistent = file_rows == uploads_ok and blob_rows == ref_total
+        log(f"文件记录 {file_rows}（成功上传 {uploads_ok}），引用计数合计 {ref_total}（记录 {blob_rows}）"
+            f" -> {'一致' if consistent else '不一致'}")
+
+        if errors:
+            log(f"错误 {len(errors)} 个，例如:")
+            for e in errors[:5]:
+                log(f"  {e}")
+        else:
+            log("没有错误")
+    finally:
+        for project_id in project_ids:
+            client.delete(f"/api/projects/{project_id}")
+        server.engine.dispose()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {
+        "latencies": latencies,
+        "errors": errors,
+        "locked": sum(1 for e in errors if "database is locked" in e),
+        "consistent": consistent,
+        "elapsed": elapsed,
+    }
+
+
+def main():
+    procs = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    result = run(procs, threads, rounds)
+    sys.exit(0 if result["consistent"] and not result["errors"] else 1)
+
+if __name__ == "__main__":
+    main()
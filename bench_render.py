@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+报告渲染基准测试：对比每次构造 DocxTemplate 与模板注册表（一次解析，多次渲染）的 CPU 耗时
+
+用法: python3 bench_render.py [次数]
+"""
+
+import io
+import os
+import sys
+import time
+
+from docxtpl import DocxTemplate
+
+from template_registry import TemplateRegistry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BASE_DIR, "report_template.docx")
+
+CONTEXT = {
+    "project_name": "江南大道及两侧楼宇景观亮化提升工程",
+    "report_date": "2026年01月04日",
+    "report_code": "杭滨咨(2026)结审第001号",
+    "client_name": "杭州市滨江区城市建设投资集团有限公司",
+    "contractor_name": "浙江省一建建设集团有限公司",
+    "start_date": "2024年05月01日",
+    "end_date": "2025年05月01日",
+    "contract_amount": 1500.00,
+    "final_approved_amount": 14750000.00,
+    "final_approved_amount_chinese": "壹仟肆佰柒拾伍万元整",
+    "quality_status": "经审核，\a符合合同约定",
+    "adjustments": [
+        {"content": "C30混凝土工程量按实调减", "amount": 12.50},
+        {"content": "亮化灯具品牌更换核减差价", "amount": 8.30},
+        {"content": "取消部分不必要的装饰挂件", "amount": 5.20},
+    ],
+}
+
+
+def bench(label, render_once, rounds):
+    render_once()  # 预热
+    times = []
+    cpu_start = time.process_time()
+    for _ in range(rounds):
+        start = time.perf_counter()
+        render_once()
+        times.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    times.sort()
+    print(f"{label:<24} CPU/次 {cpu / rounds * 1000:8.1f} ms   "
+          f"p50 {times[len(times) // 2] * 1000:8.1f} ms   "
+          f"p95 {times[int(len(times) * 0.95)] * 1000:8.1f} ms")
+    return cpu / rounds
+
+
+def render_docxtemplate():
+    tpl = DocxTemplate(TEMPLATE_PATH)
+    tpl.render(dict(CONTEXT))
+    tpl.save(io.BytesIO())
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    registry = TemplateRegistry()
+    registry.register("结算审核", TEMPLATE_PATH)
+
+    def render_registry():
+        registry.get("结算审核").render_to(dict(CONTEXT), io.BytesIO())
+
+    print(f"模板: {TEMPLATE_PATH}，每种方式渲染 {rounds} 次")
+    old = bench("DocxTemplate 每次构造", render_docxtemplate, rounds)
+    new = bench("模板注册表", render_registry, rounds)
+    print(f"CPU 耗时降低 {(1 - new / old) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+全文搜索压测：在临时数据库里生成大量项目（项目数据 + 附件逐页文本），
+测量建索引耗时和 /api/search 的查询延迟。
+
+用法: python3 bench_search.py [项目数] [每个项目的附件页数] [每个查询的重复次数]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+QUERIES = ["亮化灯具品牌更换", "混凝土", "江南大道", "监理", "C30", "合同工期 核减", "灯"]
+
+WORDS = [
+    "工程量", "按实调减", "混凝土", "钢筋", "土方开挖", "亮化", "灯具", "品牌", "更换", "核减差价", "签证",
+    "设计变更", "联系单", "竣工图", "隐蔽工程", "监理", "建设单位", "施工单位", "合同工期", "综合单价",
+    "管线电缆", "配电箱", "变压器", "控制系统", "道路", "绿化", "给排水", "桥梁", "市政", "照明",
+]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return "".join(rng.choice(WORDS) for _ in range(words)) + "。"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else 0.0
+
+
+def main():
+    projects = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_search_")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session
+
+    import server
+
+    server.create_db_and_tables()
+    rng = random.Random(0)
+
+    start = time.perf_counter()
+    with Session(server.engine) as session:
+        for i in range(projects):
+            project = server.Project(name=f"{rng.choice(['江南大道', '滨江', '西兴', '长河'])}工程{i}", code=f"P{i:05d}")
+            session.add(project)
+            session.flush()
+            data = {
+                "project_name": project.name,
+                "project_description": sentence(rng, 30),
+                "adjustments": [{"content": sentence(rng, 6), "amount": rng.random() * 100} for _ in range(3)],
+                "other_notes": sentence(rng, 10),
+            }
+            server.search_index.index_project(session, project.id, project.name, project.code)
+            server.search_index.index_data(session, project.id, data, replace_all=True)
+            server.search_index.index_file(
+                session, project.id, i + 1, f"结算书{i}.pdf",
+                [(page, sentence(rng, 120)) for page in range(1, pages + 1)],
+            )
+            if i % 500 == 499:
+                session.commit()
+        session.commit()
+    elapsed = time.perf_counter() - start
+    print(f"{projects} 个项目 × {pages} 页附件，建索引 {elapsed:.1f} s（{projects / elapsed:.0f} 项目/秒）")
+
+    client = TestClient(server.app)
+    for query in QUERIES:
+        latencies = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            r = client.get("/api/search", params={"q": query, "limit": 20})
+            latencies.append(time.perf_counter() - t)
+        body = r.json()
+        print(f"  {query:<12} 命中 {body['total']:>7}   服务端 {body['elapsed_ms']:7.2f} ms   "
+              f"p50 {percentile(latencies, 0.5):7.2f} ms   p99 {percentile(latencies, 0.99):7.2f} ms")
+
+    server.engine.dispose()
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
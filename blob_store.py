@@ -0,0 +1,262 @@
+"""
+内容寻址的上传文件存储
+
+上传的文件按 SHA-256 存放在 uploads/blobs/ab/abcdef... 下，同样内容只存一份。
+FileBlob 表记录引用计数：每个 ProjectFile 引用一次，最后一个引用删除时才删除物理文件。
+
+上传请求直接从 request.stream() 流式解析 multipart，边写临时文件边计算哈希，
+超过大小限制时立即中止，不会先把整个文件收下来再检查。
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, select
+
+# 单个上传文件大小上限
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(512 * 1024 * 1024)))
+# 普通表单字段大小上限
+FORM_FIELD_MAX_BYTES = 64 * 1024
+
+
+class FileBlob(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    size: int = 0
+    path: str
+    ref_count: int = 0
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds upload limit of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class BlobWriter:
+    """边写临时文件边计算 SHA-256，超过上限抛出 UploadTooLarge"""
+
+    def __init__(self, tmp_path: str, max_bytes: int):
+        self.tmp_path = tmp_path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._hash.update(data)
+        self._file.write(data)
+
+    def close(self) -> str:
+        """关闭文件，返回内容哈希"""
+        self._file.close()
+        return self._hash.hexdigest()
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class BlobStore:
+    def __init__(self, root: str, engine):
+        self.root = root
+        self.engine = engine
+        self.tmp_dir = os.path.join(root, "tmp")
+        # 同一进程内串行化引用计数的增减和物理文件的放置/删除
+        self._lock = threading.Lock()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def writer(self, max_bytes: int = UPLOAD_MAX_BYTES) -> BlobWriter:
+        return BlobWriter(os.path.join(self.tmp_dir, uuid.uuid4().hex), max_bytes)
+
+    def acquire(self, sha256: str, size: int, tmp_path: Optional[str] = None) -> FileBlob:
+        """
+        增加一次引用。内容已存在时丢弃 tmp_path；否则把 tmp_path 移入存储。
+        在独立的事务中提交，调用方随后再写 ProjectFile。
+        第一条 UPDATE 即开始写事务，与其他进程的 release_many 互斥：记录不存在时放入的文件不会被对方删除。
+        """
+        path = self.path_for(sha256)
+        with self._lock, Session(self.engine) as session:
+            for _ in range(2):
+                result = session.execute(
+                    update(FileBlob)
+                    .where(FileBlob.sha256 == sha256)
+                    .values(ref_count=FileBlob.ref_count + 1)
+                )
+                if result.rowcount:
+                    session.commit()
+                    break
+                if tmp_path is None:
+                    raise FileNotFoundError(f"Blob {sha256} not found")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                tmp_path = None
+                session.add(FileBlob(sha256=sha256, size=size, path=path, ref_count=1))
+                try:
+                    session.commit()
+                    break
+                except IntegrityError:
+                    # 其他进程刚好插入了同一内容，改为增加引用
+                    session.rollback()
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return session.get(FileBlob, sha256)
+
+    def release(self, sha256: str) -> List[str]:
+        """减少一次引用，最后一个引用释放时删除物理文件"""
+        return self.release_many([sha256])
+
+    def release_many(self, sha256s: Iterable[str]) -> List[str]:
+        """
+        批量减少引用（同一内容出现几次就减几次），在一个事务中完成，最后删除不再被引用的物理文件。
+        返回被删除的内容哈希。
+        """
+        counts = Counter(sha for sha in sha256s if sha)
+        if not counts:
+            return []
+        # 减少次数相同的内容合并成一条 UPDATE
+        by_count: Dict[int, List[str]] = defaultdict(list)
+        for sha256, n in counts.items():
+            by_count[n].append(sha256)
+
+        with self._lock, Session(self.engine) as session:
+            for n, group in by_count.items():
+                session.execute(
+                    update(FileBlob)
+                    .where(FileBlob.sha256.in_(group), FileBlob.ref_count > 0)
+                    .values(ref_count=FileBlob.ref_count - n)
+                )
+            orphaned = list(session.exec(
+                select(FileBlob.sha256).where(FileBlob.sha256.in_(list(counts)), FileBlob.ref_count <= 0)
+            ).all())
+            if not orphaned:
+                session.commit()
+                return orphaned
+            session.execute(delete(FileBlob).where(FileBlob.sha256.in_(orphaned)))
+            # 在提交之前、仍持有写锁（SQLite）或行锁时把文件移走：其他进程的 acquire 要等这个事务结束，
+            # 之后看到记录已删除，会放入新的文件，不会被这里删掉。
+            # 先移到 tmp/ 而不是直接删除，提交失败时还能放回原处
+            moved = []
+            try:
+                for sha256 in orphaned:
+                    trash = os.path.join(self.tmp_dir, f"{sha256}.{uuid.uuid4().hex}.released")
+                    try:
+                        os.replace(self.path_for(sha256), trash)
+                    except FileNotFoundError:
+                        continue
+                    moved.append((sha256, trash))
+                session.commit()
+            except BaseException:
+                session.rollback()
+                for sha256, trash in moved:
+                    os.replace(trash, self.path_for(sha256))
+                raise
+        for _, trash in moved:
+            try:
+                os.remove(trash)
+            except FileNotFoundError:
+                pass
+        return orphaned
+
+
+async def receive_multipart_upload(
+    request: Request, store: BlobStore, max_bytes: int = UPLOAD_MAX_BYTES
+) -> Tuple[Dict[str, str], Optional[BlobWriter], Optional[str], Optional[str]]:
+    """
+    流式解析 multipart/form-data 请求。
+    文件字段 "file" 写入 BlobWriter，其余字段作为文本返回。
+    返回 (表单字段, writer, 原始文件名, 内容哈希)。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    # 声明的长度已经超限时直接拒绝，不读取请求体
+    content_length = request.headers.get("content-length")
+    if content_length and int(content_length) > max_bytes + FORM_FIELD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds upload limit of {max_bytes} bytes")
+
+    fields: Dict[str, str] = {}
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "name": None, "value": b""}
+    result = {"writer": None, "filename": None}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["name"] = None
+        state["value"] = b""
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        state["name"] = disposition.get(b"name", b"").decode("utf-8")
+        if b"filename" in disposition and state["name"] == "file":
+            result["filename"] = disposition[b"filename"].decode("utf-8")
+            result["writer"] = store.writer(max_bytes)
+
+    def on_part_data(data, start, end):
+        if state["name"] == "file" and result["writer"] is not None:
+            result["writer"].write(data[start:end])
+        else:
+            state["value"] += data[start:end]
+            if len(state["value"]) > FORM_FIELD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Form field too large")
+
+    def on_part_end():
+        if state["name"] and state["name"] != "file":
+            fields[state["name"]] = state["value"].decode("utf-8")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                parser.write(chunk)
+        parser.finalize()
+    except UploadTooLarge as e:
+        if result["writer"] is not None:
+            result["writer"].abort()
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        if result["writer"] is not None:
+            result["writer"].abort()
+        raise
+
+    writer = result["writer"]
+    digest = writer.close() if writer is not None else None
+    return fields, writer, result["filename"], digest
@@ -0,0 +1,122 @@
+"""
+金额大写（人民币）
+
+按 4 位一组查表：0-9999 每组的读法在导入时生成一次，转换时只需按 万/亿/兆 拼接各组，
+组之间的"零"由规则直接决定（本组不足千位、或中间隔着全零的组时补一个"零"），不再事后修补字符串。
+同一金额（精确到分）的结果会被缓存，报告里反复出现的金额和调整项表格只计算一次。
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Iterable, List, Optional, Union
+
+DIGITS = "零壹贰叁肆伍陆柒捌玖"
+# 组内的位（个、拾、佰、仟）
+_PLACES = ("", "拾", "佰", "仟")
+# 每组的单位
+GROUP_UNITS = ("", "万", "亿", "兆")
+# 能表示的最大金额（元）
+MAX_YUAN = 10 ** (4 * len(GROUP_UNITS)) - 1
+
+# 金额单位：元、万元
+YUAN = 1
+WAN = 10000
+
+# 缓存的金额数（按分计）
+_CACHE_SIZE = 4096
+
+Amount = Union[int, float, str, Decimal]
+
+
+def _group_text(n: int) -> str:
+    """1-9999 的读法，组内连续的零只读一个，末尾的零不读（1010 -> 壹仟零壹拾）"""
+    result = []
+    zero = False
+    for place in range(3, -1, -1):
+        digit = n // 10 ** place % 10
+        if digit == 0:
+            zero = bool(result)
+            continue
+        if zero:
+            result.append("零")
+            zero = False
+        result.append(DIGITS[digit] + _PLACES[place])
+    return "".join(result)
+
+
+_GROUPS = [""] + [_group_text(n) for n in range(1, 10000)]
+
+
+def to_fen(amount: Amount, unit: int = YUAN) -> int:
+    """金额换算为分（unit 为金额单位，万元传 WAN），四舍五入；按十进制处理，避免 0.285 * 100 = 28.499... 之类的误差"""
+    try:
+        value = Decimal(str(amount).replace(",", "").replace("¥", "").strip())
+    except InvalidOperation:
+        raise ValueError(f"无效金额: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"无效金额: {amount!r}")
+    return int((value * unit * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def _yuan_text(yuan: int) -> str:
+    groups = []
+    while yuan:
+        groups.append(yuan % 10000)
+        yuan //= 10000
+    result = []
+    # 高位到低位；pending_zero 表示上一个非零组之后隔着全零的组，或本组不足千位
+    pending_zero = False
+    for index in range(len(groups) - 1, -1, -1):
+        group = groups[index]
+        if group == 0:
+            pending_zero = bool(result)
+            continue
+        if result and (pending_zero or group < 1000):
+            result.append("零")
+        result.append(_GROUPS[group] + GROUP_UNITS[index])
+        pending_zero = False
+    return "".join(result)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def fen_to_chinese(fen: int) -> str:
+    """以分为单位的金额转为大写"""
+    if fen < 0:
+        return "负" + fen_to_chinese(-fen)
+    yuan, rest = divmod(fen, 100)
+    if yuan > MAX_YUAN:
+        raise ValueError(f"金额过大: {yuan} 元")
+    jiao, fen = divmod(rest, 10)
+    result = (_yuan_text(yuan) or "零") + "元"
+    if jiao == 0 and fen == 0:
+        return result + "整"
+    if jiao:
+        result += DIGITS[jiao] + "角"
+    if fen:
+        result += DIGITS[fen] + "分"
+    return result
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def amount_to_chinese(amount: Amount, unit: int = YUAN) -> str:
+    """
+    将金额转换为中文大写
+    例如：14800000.00 -> 壹仟肆佰捌拾万元整，100000001 -> 壹亿零壹元整
+    """
+    return fen_to_chinese(to_fen(amount, unit))
+
+
+def amounts_to_chinese(amounts: Iterable[Amount], unit: int = YUAN, invalid: Optional[str] = None) -> List[str]:
+    """
+    批量转换（如调整项表格的每一行），相同金额只算一次。
+    指定 invalid 时无效金额返回 invalid，否则抛出异常
+    """
+    result = []
+    for amount in amounts:
+        try:
+            result.append(amount_to_chinese(amount, unit))
+        except (ValueError, TypeError):
+            if invalid is None:
+                raise
+            result.append(invalid)
+    return result
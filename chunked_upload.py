@@ -0,0 +1,291 @@
+"""
+分片断点续传
+
+大文件（如全套纸质扫描的几百 MB PDF）按固定大小分片上传：
+1. init：声明文件名、大小、分类，服务端预分配目标文件，返回 upload_id
+2. PUT chunk：每个分片直接写入目标文件的对应偏移，可并行、可重传
+3. complete：所有分片到齐后计算哈希，把文件原地移入内容寻址存储；
+   先用条件 UPDATE 把会话标记为 completing，并发的 complete 只有一个能继续，其余返回 409
+写入分片时对目标文件加共享锁 (flock)，加锁后重新读取 completing；complete 标记之后加排他锁，
+等正在写入的分片（包括其他进程里的）全部结束才计算哈希和移动文件，标记之后到达的分片被拒绝。
+
+已收到的分片记录在 uploadchunk 表中，断线后客户端查询状态即可只补传缺失的分片。
+SHA-256 在分片按顺序到达时顺带计算；乱序到达的分片只在补齐前缀时从磁盘读一次。
+长时间没有活动的会话由后台线程清理。
+"""
+
+import contextlib
+import hashlib
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, select
+
+try:
+    import fcntl
+except ImportError: # Windows：没有 flock，只靠 completing 标记
+    fcntl = None
+
+# 默认分片大小
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# 分片大小允许范围
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# 断点续传文件大小上限
+CHUNKED_UPLOAD_MAX_BYTES = int(os.environ.get("CHUNKED_UPLOAD_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+# 会话多久没有活动视为放弃（秒）
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", str(24 * 3600)))
+UPLOAD_SWEEP_INTERVAL = int(os.environ.get("UPLOAD_SWEEP_INTERVAL", "600"))
+
+
+class UploadSession(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
+    project_id: int = Field(foreign_key="project.id")
+    filename: str
+    category: str = "其他"
+    size: int
+    chunk_size: int
+    total_chunks: int
+    # 正在登记为项目文件（complete 进行中）
+    completing: bool = False
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+
+class UploadChunk(SQLModel, table=True):
+    upload_id: str = Field(foreign_key="uploadsession.id", primary_key=True)
+    idx: int = Field(primary_key=True)
+    size: int
+
+
+class ChunkError(Exception):
+    """分片不合法（序号越界、长度不对等）"""
+
+
+class _Hasher:
+    """按顺序累积 SHA-256，记录已经计算到第几个分片"""
+
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.next_idx = 0
+        self.lock = threading.Lock()
+
+
+def session_status(upload: UploadSession, received: List[int]) -> dict:
+    received_set = set(received)
+    return {
+        "upload_id": upload.id,
+        "project_id": upload.project_id,
+        "filename": upload.filename,
+        "category": upload.category,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": upload.total_chunks,
+        "received_chunks": sorted(received_set),
+        "missing_chunks": [i for i in range(upload.total_chunks) if i not in received_set],
+        "received_bytes": sum(upload.chunk_size if i < upload.total_chunks - 1 else
+                              upload.size - upload.chunk_size * (upload.total_chunks - 1)
+                              for i in received_set),
+    }
+
+
+class ChunkedUploads:
+    def __init__(self, root: str, engine):
+        self.root = root
+        self.engine = engine
+        self._hashers: Dict[str, _Hasher] = {}
+        self._hashers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.root, upload_id + ".part")
+
+    def create(self, session: Session, project_id: int, filename: str, size: int,
+               category: str, chunk_size: Optional[int] = None) -> UploadSession:
+        if size < 0 or size > CHUNKED_UPLOAD_MAX_BYTES:
+            raise ChunkError(f"File size must be between 0 and {CHUNKED_UPLOAD_MAX_BYTES} bytes")
+        chunk_size = min(max(chunk_size or UPLOAD_CHUNK_SIZE, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+        total_chunks = max(1, -(-size // chunk_size))
+        upload = UploadSession(
+            project_id=project_id, filename=filename, category=category,
+            size=size, chunk_size=chunk_size, total_chunks=total_chunks,
+        )
+        # 预分配目标文件，分片直接写入各自的偏移
+        with open(self.part_path(upload.id), "wb") as f:
+            f.truncate(size)
+        session.add(upload)
+        session.commit()
+        session.refresh(upload)
+        return upload
+
+    def received(self, session: Session, upload_id: str) -> List[int]:
+        return list(session.exec(select(UploadChunk.idx).where(UploadChunk.upload_id == upload_id)).all())
+
+    def expected_length(self, upload: UploadSession, idx: int) -> int:
+        if idx < 0 or idx >= upload.total_chunks:
+            raise ChunkError(f"Chunk index out of range (0-{upload.total_chunks - 1})")
+        if idx < upload.total_chunks - 1:
+            return upload.chunk_size
+        return upload.size - upload.chunk_size * (upload.total_chunks - 1)
+
+    def _hasher(self, upload_id: str) -> _Hasher:
+        with self._hashers_lock:
+            hasher = self._hashers.get(upload_id)
+            if hasher is None:
+                hasher = self._hashers[upload_id] = _Hasher()
+            return hasher
+
+    def _open_locked(self, upload_id: str, flags: int, exclusive: bool) -> int:
+        """打开目标文件并加锁（写分片用共享锁，complete 用排他锁），关闭文件即释放"""
+        try:
+            fd = os.open(self.part_path(upload_id), flags)
+        except FileNotFoundError:
+            # 已经完成（文件移入存储）或已被删除
+            raise ChunkError("Upload not found")
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return fd
+
+    def write_chunk(self, upload: UploadSession, idx: int, data: bytes):
+        """把分片写入目标文件对应偏移，并记录到数据库（重复上传同一分片是幂等的）"""
+        if upload.completing:
+            raise ChunkError("Upload is being completed")
+        expected = self.expected_length(upload, idx)
+        if len(data) != expected:
+            raise ChunkError(f"Chunk {idx} must be {expected} bytes, got {len(data)}")
+
+        fd = self._open_locked(upload.id, os.O_WRONLY, exclusive=False)
+        try:
+            with Session(self.engine) as session:
+                # upload 是写入前读取的；持锁后重新检查，complete 标记之后到达的分片在这里被拒绝
+                completing = session.exec(
+                    select(UploadSession.completing).where(UploadSession.id == upload.id)
+                ).first()
+                if completing is None:
+                    raise ChunkError("Upload not found")
+                if completing:
+                    raise ChunkError("Upload is being completed")
+
+                os.pwrite(fd, data, idx * upload.chunk_size)
+
+                session.add(UploadChunk(upload_id=upload.id, idx=idx, size=len(data)))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    session.rollback()
+                session.execute(
+                    update(UploadSession).where(UploadSession.id == upload.id).values(updated_at=datetime.now())
+                )
+                session.commit()
+                received = set(self.received(session, upload.id))
+
+            self._advance_hash(upload, idx, data, received)
+        finally:
+            os.close(fd)
+
+    def _advance_hash(self, upload: UploadSession, idx: int, data: bytes, received: set):
+        """顺序到达的分片直接用内存中的数据计算哈希，之后补齐已到达的后续分片"""
+        hasher = self._hasher(upload.id)
+        with hasher.lock:
+            if idx != hasher.next_idx:
+                return
+            hasher.sha.update(data)
+            hasher.next_idx += 1
+            if hasher.next_idx in received:
+                with open(self.part_path(upload.id), "rb") as f:
+                    while hasher.next_idx in received:
+                        f.seek(hasher.next_idx * upload.chunk_size)
+                        hasher.sha.update(f.read(self.expected_length(upload, hasher.next_idx)))
+                        hasher.next_idx += 1
+
+    def claim(self, session: Session, upload_id: str) -> bool:
+        """把会话标记为 completing；已被其他请求标记（或会话已不存在）时返回 False"""
+        result = session.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload_id, UploadSession.completing == False)  # noqa: E712
+            .values(completing=True, updated_at=datetime.now())
+        )
+        session.commit()
+        return result.rowcount == 1
+
+    @contextlib.contextmanager
+    def writes_finished(self, upload_id: str) -> Iterator[None]:
+        """claim 之后使用：等正在写入的分片全部结束，期间不会再有分片写入"""
+        fd = self._open_locked(upload_id, os.O_RDONLY, exclusive=True)
+        try:
+            yield
+        finally:
+            os.close(fd)
+
+    def unclaim(self, session: Session, upload_id: str):
+        """complete 失败（如分片不全）时取消标记，客户端可以补传后重试"""
+        session.rollback()
+        session.execute(
+            update(UploadSession).where(UploadSession.id == upload_id).values(completing=False)
+        )
+        session.commit()
+
+    def finish(self, session: Session, upload: UploadSession) -> Tuple[str, str]:
+        """确认所有分片到齐，返回 (内容哈希, 文件路径)"""
+        received = set(self.received(session, upload.id))
+        missing = [i for i in range(upload.total_chunks) if i not in received]
+        if missing:
+            raise ChunkError(f"Missing chunks: {missing[:20]}")
+
+        hasher = self._hasher(upload.id)
+        with hasher.lock:
+            if hasher.next_idx < upload.total_chunks:
+                # 服务重启或分片落在其他进程时，哈希状态不完整，从磁盘补算
+                with open(self.part_path(upload.id), "rb") as f:
+                    f.seek(hasher.next_idx * upload.chunk_size)
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        hasher.sha.update(chunk)
+                hasher.next_idx = upload.total_chunks
+            digest = hasher.sha.hexdigest()
+        return digest, self.part_path(upload.id)
+
+    def discard(self, session: Session, upload_id: str):
+        """删除会话记录和未完成的文件"""
+        session.execute(delete(UploadChunk).where(UploadChunk.upload_id == upload_id))
+        session.execute(delete(UploadSession).where(UploadSession.id == upload_id))
+        session.commit()
+        with self._hashers_lock:
+            self._hashers.pop(upload_id, None)
+        try:
+            os.remove(self.part_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self) -> int:
+        """清理长时间没有活动的会话"""
+        cutoff = datetime.now() - timedelta(seconds=UPLOAD_SESSION_TTL)
+        with Session(self.engine) as session:
+            stale = session.exec(select(UploadSession.id).where(UploadSession.updated_at < cutoff)).all()
+            for upload_id in stale:
+                self.discard(session, upload_id)
+        return len(stale)
+
+    def _loop(self):
+        while not self._stop.wait(UPLOAD_SWEEP_INTERVAL):
+            try:
+                removed = self.sweep()
+                if removed:
+                    print(f"ChunkedUploads: 清理了 {removed} 个过期的上传会话")
+            except Exception as e:
+                print(f"ChunkedUploads sweep error: {e}")
+
+    def start(self):
+        self.sweep()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="upload-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
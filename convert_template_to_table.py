@@ -1,15 +1,22 @@
 #!/usr/bin/env python3
 """
 将模板中的项目名称字段转换为表格格式
-使用 python-docx 库自动修改 Word 文档
+使用 python-docx 库自动修改 Word 文档（插入表格是结构性修改，不在 template_maintenance.py 的变换里）
+
+用法: python3 convert_template_to_table.py [模板路径]
 """
 
+import os
+import sys
+
 from docx import Document
 from docx.shared import Pt, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 def remove_table_borders(table):
     """移除表格所有边框"""
     tbl = table._tbl
@@ -30,10 +37,9 @@ def remove_table_borders(table):
 
     tblPr.append(tblBorders)
 
-def convert_template():
+def convert_template(template_path=os.path.join(BASE_DIR, "report_template.docx")):
     """转换模板文件"""
-    template_path = "/Users/crj/Documents/code/baogao_code/report_template.docx"
-    backup_path = "/Users/crj/Documents/code/baogao_code/report_template_backup.docx"
+    backup_path = os.path.splitext(template_path)[0] + "_backup.docx"
 
     print("🔍 正在读取模板文件...")
     doc = Document(template_path)
@@ -99,7 +105,7 @@ def convert_template():
 
 if __name__ == "__main__":
     try:
-        convert_template()
+        convert_template(*sys.argv[1:2])
         print("\n✨ 转换完成！请重启服务并测试生成报告")
     except Exception as e:
         print(f"❌ 转换失败: {e}")
@@ -0,0 +1,321 @@
+"""
+LibreOffice 常驻转换池
+
+每次预览都启动一个新的 soffice 进程，冷启动要好几秒。
+这里维护 N 个常驻的 headless LibreOffice 实例，通过 UNO 连接下发转换任务：
+- 任务交给空闲的实例（从轮询位置开始找），都在忙时等第一个空出来的实例，
+  不会排在某个慢任务后面而让其他空闲实例闲着
+- 实例崩溃或卡死时自动重启
+- 每个实例处理一定数量的任务后主动回收，避免内存泄漏
+- 默认走命名管道，管道名带上进程号：多个 uvicorn worker 各自的实例互不冲突，
+  不会像固定端口那样后启动的进程连到别人的实例上
+
+如果当前 Python 环境没有 `uno` 模块（LibreOffice 自带的 Python 绑定），
+自动退回到逐次调用 `soffice --convert-to pdf` 的旧方式。
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    HAS_UNO = True
+except ImportError:
+    uno = None
+    HAS_UNO = False
+
+
+def _default_soffice_path() -> str:
+    """按优先级查找 soffice 可执行文件"""
+    for name in ("soffice", "libreoffice"):
+        path = shutil.which(name)
+        if path:
+            return path
+    mac_path = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+    if os.path.exists(mac_path):
+        return mac_path
+    return "soffice"
+
+
+# --- 配置（均可通过环境变量覆盖）---
+SOFFICE_PATH = os.environ.get("SOFFICE_PATH") or _default_soffice_path()
+CONVERTER_WORKERS = int(os.environ.get("CONVERTER_WORKERS", "2"))
+# 命名管道前缀，实际管道名为 前缀_进程号_实例序号
+CONVERTER_PIPE_PREFIX = os.environ.get("CONVERTER_PIPE_PREFIX", "report_converter")
+# 设置后改用 TCP 端口（基础端口 + 实例序号），只适合单进程部署（如调试时从外部连接实例）
+CONVERTER_BASE_PORT = int(os.environ["CONVERTER_BASE_PORT"]) if os.environ.get("CONVERTER_BASE_PORT") else None
+# 单个实例处理多少个任务后回收重启
+CONVERTER_MAX_JOBS = int(os.environ.get("CONVERTER_MAX_JOBS", "200"))
+# 单次转换超时（秒），超时视为卡死
+CONVERTER_TIMEOUT = float(os.environ.get("CONVERTER_TIMEOUT", "30"))
+# 实例启动等待时间（秒）
+CONVERTER_STARTUP_TIMEOUT = float(os.environ.get("CONVERTER_STARTUP_TIMEOUT", "20"))
+
+
+class ConversionError(Exception):
+    """PDF 转换失败"""
+
+
+def _property(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class OfficeWorker:
+    """一个常驻的 headless LibreOffice 实例"""
+
+    def __init__(self, index: int, soffice_path: str, port: Optional[int], work_dir: str):
+        self.index = index
+        self.soffice_path = soffice_path
+        self.port = port
+        self.connection = ""
+        # 每个实例使用独立的用户配置目录，否则多个实例会互相抢锁
+        self.profile_dir = os.path.join(work_dir, f"lo_profile_{index}")
+        self.process: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.jobs = 0
+        self.lock = threading.Lock()
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def _connection(self) -> str:
+        """UNO 连接描述；管道名在启动时按当前进程号生成（fork 出的 worker 进程也不会重名）"""
+        if self.port is not None:
+            return f"socket,host=127.0.0.1,port={self.port}"
+        return f"pipe,name={CONVERTER_PIPE_PREFIX}_{os.getpid()}_{self.index}"
+
+    def start(self):
+        self.connection = self._connection()
+        cmd = [
+            self.soffice_path,
+            "--headless",
+            "--invisible",
+            "--nologo",
+            "--nodefault",
+            "--norestore",
+            "--nolockcheck",
+            f"-env:UserInstallation=file://{self.profile_dir}",
+            f"--accept={self.connection};urp;StarOffice.ComponentContext",
+        ]
+        env = os.environ.copy()
+        env["HOME"] = self.profile_dir
+        os.makedirs(self.profile_dir, exist_ok=True)
+        try:
+            self.process = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env
+            )
+        except OSError as e:
+            raise ConversionError(f"无法启动 LibreOffice ({self.soffice_path}): {e}")
+        self.jobs = 0
+        self.desktop = self._connect()
+
+    def _connect(self):
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx
+        )
+        url = f"uno:{self.connection};urp;StarOffice.ComponentContext"
+        deadline = time.monotonic() + CONVERTER_STARTUP_TIMEOUT
+        while True:
+            if not self.alive():
+                raise ConversionError(f"LibreOffice 实例 {self.index} 启动失败")
+            try:
+                ctx = resolver.resolve(url)
+                return ctx.ServiceManager.createInstanceWithContext(
+                    "com.sun.star.frame.Desktop", ctx
+                )
+            except Exception:
+                if time.monotonic() > deadline:
+                    raise ConversionError(f"LibreOffice 实例 {self.index} 启动超时")
+                time.sleep(0.2)
+
+    def stop(self):
+        self.desktop = None
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def restart(self):
+        print(f"Converter: 重启 LibreOffice 实例 {self.index} (已处理 {self.jobs} 个任务)")
+        self.stop()
+        self.start()
+
+    def _convert(self, src_path: str, dst_path: str):
+        doc = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(src_path), "_blank", 0, (_property("Hidden", True),)
+        )
+        if doc is None:
+            raise ConversionError("LibreOffice 无法打开文档")
+        try:
+            doc.storeToURL(
+                uno.systemPathToFileUrl(dst_path),
+                (_property("FilterName", "writer_pdf_Export"),),
+            )
+        finally:
+            doc.close(True)
+
+    def convert(self, src_path: str, dst_path: str, timeout: float):
+        """在当前实例上执行一次转换，调用方需持有 self.lock"""
+        if not self.alive() or self.desktop is None:
+            self.restart()
+        elif self.jobs >= CONVERTER_MAX_JOBS:
+            self.restart()
+
+        # UNO 调用本身不支持超时，放到辅助线程里执行，超时后杀掉实例
+        result = {}
+
+        def target():
+            try:
+                self._convert(src_path, dst_path)
+            except Exception as e:
+                result["error"] = e
+
+        t = threading.Thread(target=target, daemon=True)
+        t.start()
+        t.join(timeout)
+        self.jobs += 1
+
+        if t.is_alive():
+            # 卡死：杀掉进程让 UNO 调用失败退出，下次使用时重启
+            self.stop()
+            raise ConversionError(f"PDF 转换超时（>{timeout}s）")
+        if "error" in result:
+            # 连接断开通常意味着实例崩溃，下次使用时重启
+            if not self.alive():
+                self.stop()
+            raise ConversionError(f"PDF 转换失败: {result['error']}")
+
+
+class ConverterPool:
+    """常驻 LibreOffice 实例池，任务交给空闲的实例"""
+
+    def __init__(
+        self,
+        size: int = CONVERTER_WORKERS,
+        soffice_path: str = SOFFICE_PATH,
+        base_port: Optional[int] = CONVERTER_BASE_PORT,
+        work_dir: Optional[str] = None,
+    ):
+        self.soffice_path = soffice_path
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="converter_")
+        self.workers: List[OfficeWorker] = [
+            OfficeWorker(i, soffice_path, base_port + i if base_port is not None else None, self.work_dir)
+            for i in range(max(1, size))
+        ]
+        self._next = 0
+        # 有实例空出来时通知等待的任务
+        self._freed = threading.Condition()
+
+    def start(self):
+        for worker in self.workers:
+            with worker.lock:
+                try:
+                    worker.start()
+                except ConversionError as e:
+                    # 启动失败的实例在第一次使用时重试
+                    print(f"Converter: {e}")
+                    worker.stop()
+
+    def shutdown(self):
+        for worker in self.workers:
+            with worker.lock:
+                worker.stop()
+
+    def _acquire(self) -> OfficeWorker:
+        """从轮询位置开始找一个空闲实例并占用；都在忙时等待"""
+        with self._freed:
+            while True:
+                for i in range(len(self.workers)):
+                    index = (self._next + i) % len(self.workers)
+                    worker = self.workers[index]
+                    if worker.lock.acquire(blocking=False):
+                        self._next = index + 1
+                        return worker
+                self._freed.wait()
+
+    def _release(self, worker: OfficeWorker):
+        worker.lock.release()
+        with self._freed:
+            self._freed.notify()
+
+    def convert(self, src_path: str, out_dir: str, timeout: float = CONVERTER_TIMEOUT) -> str:
+        dst_path = os.path.join(out_dir, os.path.splitext(os.path.basename(src_path))[0] + ".pdf")
+        worker = self._acquire()
+        try:
+            worker.convert(os.path.abspath(src_path), os.path.abspath(dst_path), timeout)
+        finally:
+            self._release(worker)
+        if not os.path.exists(dst_path):
+            raise ConversionError("PDF file not generated")
+        return dst_path
+
+
+class SubprocessConverter:
+    """无 UNO 绑定时的后备方案：每次启动一个 soffice 进程"""
+
+    def __init__(self, soffice_path: str = SOFFICE_PATH):
+        self.soffice_path = soffice_path
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def convert(self, src_path: str, out_dir: str, timeout: float = CONVERTER_TIMEOUT) -> str:
+        # 每次转换用单独的配置目录：共用一个配置目录时，并发的 soffice 会争用其中的锁文件
+        profile_dir = tempfile.mkdtemp(prefix="soffice_profile_")
+        # 设置环境变量，解决 macOS 下可能的配置加载问题
+        env = os.environ.copy()
+        env["HOME"] = profile_dir
+
+        cmd = [
+            self.soffice_path,
+            f"-env:UserInstallation=file://{profile_dir}",
+            "--headless",
+            "--convert-to", "pdf",
+            "--outdir", out_dir,
+            src_path,
+        ]
+        try:
+            process = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise ConversionError(f"PDF 转换超时（>{timeout}s）")
+        except OSError as e:
+            raise ConversionError(f"无法启动 LibreOffice ({self.soffice_path}): {e}")
+        finally:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+        if process.returncode != 0:
+            print(f"LibreOffice Error: {process.stderr}")
+            print(f"LibreOffice Stdout: {process.stdout}")
+            raise ConversionError("PDF Conversion failed")
+
+        dst_path = os.path.join(out_dir, os.path.splitext(os.path.basename(src_path))[0] + ".pdf")
+        if not os.path.exists(dst_path):
+            raise ConversionError("PDF file not generated")
+        return dst_path
+
+
+def create_converter():
+    """根据运行环境选择转换器"""
+    if HAS_UNO and CONVERTER_WORKERS > 0:
+        return ConverterPool()
+    print("Converter: 未找到 uno 模块，使用逐次启动 soffice 的方式转换")
+    return SubprocessConverter()
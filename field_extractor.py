@@ -0,0 +1,279 @@
+"""
+从上传文件的逐页文本中提取报告字段（规则版）
+
+每条规则指定：字段、适用的文件夹分类、标签（如 "中标价"、"开工日期"）、值的类型和基础置信度。
+标签后面跟着的值按类型解析：
+- amount：金额，统一换算为万元（"元"除以 10000；没写单位时按标签里的"（万元）"或默认按元）
+- date：日期，统一为前端使用的 "YYYY年MM月DD日"
+- days：天数
+- org：单位名称，以"公司"、"集团"等结尾时置信度更高
+- text：一行内的文本
+- choice：固定选项之一（如招标方式）
+
+规则在导入时编译一次；提取时逐页匹配，同一字段在多处得到相同的值时合并并提高置信度。
+OCR 得到的文本置信度打折扣，分类不匹配的通用规则置信度较低。
+"""
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# OCR 文本的置信度系数
+OCR_CONFIDENCE_FACTOR = 0.85
+# 摘录上下文长度（字符）
+SNIPPET_CONTEXT = 20
+
+
+@dataclass
+class FieldRule:
+    field: str
+    labels: Tuple[str, ...]
+    kind: str
+    confidence: float
+    # 适用的文件夹分类，为空表示所有分类
+    categories: Tuple[str, ...] = ()
+    # kind 为 choice 时的可选值
+    choices: Tuple[str, ...] = ()
+
+
+@dataclass
+class Candidate:
+    field: str
+    value: Any
+    confidence: float
+    file_id: int
+    filename: str
+    category: str
+    page: int
+    snippet: str
+    source: str = "text"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "value": self.value,
+            "confidence": round(self.confidence, 3),
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "category": self.category,
+            "page": self.page,
+            "snippet": self.snippet,
+            "source": self.source,
+        }
+
+
+_BIDDING_METHODS = ("公开招标", "邀请招标", "竞争性谈判", "竞争性磋商", "单一来源", "询价", "直接发包")
+# 表格里相邻的标签，出现在值的位置时说明本标签的值为空
+_ORG_LABELS = ("施工单位", "建设单位", "监理单位", "设计单位", "代建单位", "委托单位", "咨询企业")
+
+FIELD_RULES: List[FieldRule] = [
+    # 中标通知书
+    FieldRule("bidding_price_winning", ("中标价", "中标价格", "中标金额", "中标总价"), "amount", 0.9, ("中标通知书",)),
+    FieldRule("contractor_name", ("中标人", "中标单位"), "org", 0.85, ("中标通知书",)),
+    FieldRule("builder_name", ("招标人",), "org", 0.75, ("中标通知书", "招标文件")),
+    FieldRule("duration_days", ("工期", "中标工期"), "days", 0.7, ("中标通知书",)),
+    FieldRule("bidding_method", ("招标方式",), "choice", 0.8, ("中标通知书", "招标文件"), _BIDDING_METHODS),
+    # 招标文件
+    FieldRule("bidding_price_control", ("招标控制价", "最高投标限价", "控制价"), "amount", 0.85, ("招标文件",)),
+    # 开工报告
+    FieldRule("start_date", ("实际开工日期", "开工日期", "开工时间"), "date", 0.9, ("开工报告",)),
+    FieldRule("start_date", ("计划开工日期",), "date", 0.6, ("开工报告", "合同")),
+    # 竣工报告、竣工验收证书
+    FieldRule("end_date", ("实际竣工日期", "竣工日期", "竣工时间", "竣工验收日期", "完工日期"), "date", 0.9,
+              ("竣工报告", "竣工验收证书")),
+    FieldRule("end_date", ("计划竣工日期",), "date", 0.6, ("合同",)),
+    # 合同
+    FieldRule("contract_amount", ("签约合同价", "合同价", "合同金额", "合同总价", "合同价款"), "amount", 0.9, ("合同",)),
+    FieldRule("duration_days", ("合同工期", "总工期", "工期"), "days", 0.8, ("合同",)),
+    FieldRule("contractor_name", ("承包人",), "org", 0.85, ("合同",)),
+    FieldRule("builder_name", ("发包人",), "org", 0.85, ("合同",)),
+    # 工程结算书
+    FieldRule("submit_amount_wan", ("送审金额", "送审价", "送审结算金额", "结算金额", "结算总价"), "amount", 0.85,
+              ("工程结算书",)),
+    FieldRule("submit_amount_wan", ("工程造价", "合计"), "amount", 0.5, ("工程结算书",)),
+    # 所有分类通用（置信度较低）
+    FieldRule("contractor_name", ("施工单位",), "org", 0.7),
+    FieldRule("builder_name", ("建设单位",), "org", 0.7),
+    FieldRule("supervisor_name", ("监理单位",), "org", 0.7),
+    FieldRule("designer_name", ("设计单位",), "org", 0.7),
+    FieldRule("agent_name", ("代建单位",), "org", 0.7),
+    FieldRule("project_name", ("工程名称", "项目名称"), "text", 0.6),
+    FieldRule("start_date", ("开工日期", "开工时间"), "date", 0.6),
+    FieldRule("end_date", ("竣工日期", "竣工时间"), "date", 0.6),
+    FieldRule("duration_days", ("合同工期",), "days", 0.6),
+    FieldRule("contract_amount", ("合同金额", "合同价"), "amount", 0.6),
+    FieldRule("submit_amount_wan", ("送审金额", "送审结算金额"), "amount", 0.6),
+]
+
+
+# --- 规则编译 ---
+def _label_pattern(label: str) -> str:
+    # 扫描件和 PDF 文字层里，汉字之间常夹有空格（如 "工 程 名 称"）
+    return r"\s*".join(re.escape(ch) for ch in label)
+
+
+# 标签与值之间：可选的单位说明、冒号、"为"
+_SEPARATOR = r"\s*(?:[（(]\s*(?P<label_unit>万元|元)\s*[)）])?\s*(?:[:：]|为|是)?\s*"
+# 名称和文本类字段必须有冒号或空白分隔，且标签前不能紧接汉字，
+# 避免匹配到正文里的 "施工单位编报的……"、"单位工程名称"
+_STRICT_SEPARATOR = r"(?:\s*[:：]\s*|\s+)"
+_STRICT_PREFIX = r"(?<![\u4e00-\u9fa5])"
+_VALUE_PATTERNS = {
+    "amount": r"(?:人民币)?\s*[¥￥]?\s*(?P<value>\d[\d,，]*(?:\.\d+)?)\s*(?P<unit>万元|万|元)?",
+    "date": r"(?P<y>\d{4})\s*[年\-./]\s*(?P<m>\d{1,2})\s*[月\-./]\s*(?P<d>\d{1,2})\s*日?",
+    "days": r"(?P<value>\d{1,4})\s*(?:个)?\s*(?:日历天|天|日)",
+    "org": r"(?P<value>[^\s:：，,。；;、（(*][^\s:：，,。；;、]{1,59})",
+    "text": r"(?P<value>[^\s:：；;、（(*][^\n:：；;]{1,79}?)(?=\s{2,}|\n|$|[；;。])",
+}
+_ORG_SUFFIX = re.compile(r"(有限公司|有限责任公司|股份公司|集团|公司|研究院|设计院|中心|局|委员会|事务所)$")
+
+
+@dataclass
+class _CompiledRule:
+    rule: FieldRule
+    regex: "re.Pattern"
+
+
+@dataclass
+class _RuleSet:
+    # 分类 -> 适用于该分类的规则（含通用规则）
+    by_category: Dict[str, List[_CompiledRule]] = field(default_factory=dict)
+    generic: List[_CompiledRule] = field(default_factory=list)
+
+    def for_category(self, category: str) -> List[_CompiledRule]:
+        return self.by_category.get(category, self.generic)
+
+
+def compile_rules(rules: Iterable[FieldRule]) -> _RuleSet:
+    ruleset = _RuleSet()
+    compiled = []
+    for rule in rules:
+        labels = "|".join(_label_pattern(label) for label in sorted(rule.labels, key=len, reverse=True))
+        if rule.kind == "choice":
+            value = "(?P<value>" + "|".join(re.escape(c) for c in rule.choices) + ")"
+            pattern = f"(?:{labels}){_SEPARATOR}[^\\n]{{0,20}}?{value}"
+        elif rule.kind in ("org", "text"):
+            pattern = f"{_STRICT_PREFIX}(?:{labels}){_STRICT_SEPARATOR}{_VALUE_PATTERNS[rule.kind]}"
+        else:
+            pattern = f"(?:{labels}){_SEPARATOR}{_VALUE_PATTERNS[rule.kind]}"
+        compiled.append(_CompiledRule(rule, re.compile(pattern, re.MULTILINE)))
+    ruleset.generic = [c for c in compiled if not c.rule.categories]
+    categories = {category for c in compiled for category in c.rule.categories}
+    for category in categories:
+        ruleset.by_category[category] = [c for c in compiled if category in c.rule.categories] + ruleset.generic
+    return ruleset
+
+
+RULES = compile_rules(FIELD_RULES)
+
+
+# --- 值解析 ---
+def _parse_value(rule: FieldRule, match: "re.Match") -> Tuple[Optional[Any], float]:
+    """返回 (规范化后的值, 置信度调整量)，无法解析时值为 None"""
+    if rule.kind == "amount":
+        number = float(match.group("value").replace(",", "").replace("，", ""))
+        unit = match.group("unit") or match.group("label_unit")
+        if unit in ("万元", "万"):
+            return round(number, 6), 0.0
+        # 没写单位时按元处理，置信度降低
+        return round(number / 10000, 6), (0.0 if unit == "元" else -0.2)
+    if rule.kind == "date":
+        year, month, day = int(match.group("y")), int(match.group("m")), int(match.group("d"))
+        if not (1 <= month <= 12 and 1 <= day <= 31):
+            return None, 0.0
+        return f"{year:04d}年{month:02d}月{day:02d}日", 0.0
+    if rule.kind == "days":
+        return int(match.group("value")), 0.0
+    value = match.group("value").strip()
+    if rule.kind == "org":
+        # 单位名称后面紧跟着的下一个标签不属于名称
+        value = re.split(r"(?:地址|电话|法定代表人|负责人)", value)[0]
+        if len(value) < 2 or value.startswith(_ORG_LABELS):
+            return None, 0.0
+        return value, (0.1 if _ORG_SUFFIX.search(value) else -0.2)
+    if rule.kind == "text" and set(value) <= set("*＊ "):
+        return None, 0.0
+    return value, 0.0
+
+
+def _snippet(text: str, start: int, end: int) -> str:
+    return text[max(0, start - SNIPPET_CONTEXT):end + SNIPPET_CONTEXT].replace("\n", " ").strip()
+
+
+def extract_page(
+    text: str, category: str, file_id: int, filename: str, page: int,
+    source: str = "text", ruleset: _RuleSet = RULES,
+) -> List[Candidate]:
+    candidates = []
+    factor = OCR_CONFIDENCE_FACTOR if source == "ocr" else 1.0
+    for compiled in ruleset.for_category(category):
+        rule = compiled.rule
+        for match in compiled.regex.finditer(text):
+            value, adjust = _parse_value(rule, match)
+            if value is None:
+                continue
+            confidence = min(1.0, max(0.05, (rule.confidence + adjust) * factor))
+            candidates.append(Candidate(
+                field=rule.field,
+                value=value,
+                confidence=confidence,
+                file_id=file_id,
+                filename=filename,
+                category=category,
+                page=page,
+                snippet=_snippet(text, match.start(), match.end()),
+                source=source,
+            ))
+    return candidates
+
+
+def rank_candidates(candidates: Iterable[Candidate], max_per_field: int = 5) -> Dict[str, Dict[str, Any]]:
+    """
+    按字段汇总：相同的值合并，置信度按独立证据合并 1 - Π(1 - c)，
+    每个字段返回最可信的值和若干候选（每个值保留置信度最高的出处）。
+    """
+    by_field: Dict[str, Dict[Any, List[Candidate]]] = defaultdict(lambda: defaultdict(list))
+    for candidate in candidates:
+        by_field[candidate.field][candidate.value].append(candidate)
+
+    result = {}
+    for field_name, by_value in by_field.items():
+        ranked = []
+        for value, group in by_value.items():
+            # 同一页重复出现不算独立证据
+            best_per_page: Dict[Tuple[int, int], float] = {}
+            for c in group:
+                key = (c.file_id, c.page)
+                best_per_page[key] = max(best_per_page.get(key, 0.0), c.confidence)
+            remaining = 1.0
+            for confidence in best_per_page.values():
+                remaining *= 1.0 - confidence
+            best = max(group, key=lambda c: c.confidence)
+            entry = best.to_dict()
+            entry["confidence"] = round(1.0 - remaining, 3)
+            entry["occurrences"] = len(group)
+            ranked.append(entry)
+        ranked.sort(key=lambda e: e["confidence"], reverse=True)
+        result[field_name] = {
+            "value": ranked[0]["value"],
+            "confidence": ranked[0]["confidence"],
+            "candidates": ranked[:max_per_field],
+        }
+    return result
+
+
+def suggest_fields(
+    pages: Iterable[Tuple[int, str, str, int, str, str]],
+    min_confidence: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    pages 为 (file_id, filename, category, page, text, source)。
+    返回 {"data": 字段 -> 建议值, "fields": 字段 -> 候选详情}。
+    """
+    candidates: List[Candidate] = []
+    for file_id, filename, category, page, text, source in pages:
+        if text:
+            candidates.extend(extract_page(text, category, file_id, filename, page, source))
+    fields = rank_candidates(candidates)
+    data = {name: info["value"] for name, info in fields.items() if info["confidence"] >= min_confidence}
+    return {"data": data, "fields": fields}
@@ -0,0 +1,182 @@
+"""
+文件下载：条件请求 + 分段请求
+
+上传的扫描件动辄几十 MB，浏览器内置的 PDF 阅读器（PDF.js）会先请求文件头，
+再按需用 Range 请求读取各页。这里统一处理：
+- ETag / Last-Modified，If-None-Match / If-Modified-Since 命中时返回 304
+- 单段 Range 返回 206，不可满足时返回 416；If-Range 不匹配时返回完整文件
+- ASGI 服务器支持 zerocopysend 扩展时交给 sendfile 零拷贝发送，
+  否则在线程池中用 pread 按块读取，不把整个文件读进内存
+"""
+
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+
+# 非零拷贝模式下每次读取的块大小
+FILE_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(st: os.stat_result, digest: Optional[str] = None) -> str:
+    """内容寻址的文件直接用内容哈希做强 ETag，其余文件用修改时间和大小"""
+    if digest:
+        return f'"{digest}"'
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match 用弱比较：忽略双方的 W/ 前缀
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # 同时存在时以 If-None-Match 为准
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析 Range 头，返回 [start, end] 闭区间。
+    格式不认识或是多段请求时返回 None（按 RFC 9110 忽略 Range，返回完整文件）；
+    范围不可满足时抛出 416。
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # bytes=-500：最后 500 字节
+        length = int(last)
+        if length == 0 or size == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """发送文件的 [offset, offset + length) 区间"""
+
+    def __init__(self, path: str, offset: int, length: int, status_code: int, headers: dict,
+                 media_type: str, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.send_body = send_body
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self._send(scope, send)
+        finally:
+            # 客户端中途断开时也要执行（如释放缓存租约）
+            if self.background is not None:
+                await self.background()
+
+    async def _send(self, scope, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+                return
+
+            fd = f.fileno()
+            position = self.offset
+            remaining = self.length
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(FILE_CHUNK_SIZE, remaining), position)
+                if not chunk:
+                    break
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # 发送过程中文件被截断，结束响应，由客户端按长度不符处理
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def serve_file(
+    request: Request,
+    path: str,
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    digest: Optional[str] = None,
+    attachment: bool = False,
+    conditional: bool = True,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    按请求头返回 200 / 206 / 304 / 416。
+    digest 为内容哈希时作为强 ETag；conditional=False 时（如 POST 请求）只输出校验头，不做条件判断。
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = file_etag(st, digest)
+    media_type = media_type or mimetypes.guess_type(filename or path)[0] or "application/octet-stream"
+    response_headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+    }
+    if headers:
+        response_headers.update(headers)
+    if filename:
+        disposition = "attachment" if attachment else "inline"
+        response_headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quote(filename)}"
+
+    if conditional and _not_modified(request, etag, st.st_mtime):
+        response_headers.pop("Content-Disposition", None)
+        return Response(status_code=304, headers=response_headers)
+
+    send_body = request.method != "HEAD"
+    range_header = request.headers.get("range")
+    if conditional and range_header:
+        # If-Range 与当前版本不一致时，说明文件已变化，返回完整文件
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            byte_range = _parse_range(range_header, st.st_size)
+            if byte_range is not None:
+                start, end = byte_range
+                response_headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+                return RangeFileResponse(path, start, end - start + 1, 206, response_headers, media_type, send_body)
+
+    return RangeFileResponse(path, 0, st.st_size, 200, response_headers, media_type, send_body)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Form, Input, InputNumber, DatePicker, Button, Card, Typography, Space, Divider, message, Row, Col, Alert, Steps, Segmented, Spin, List, Upload, Empty, Collapse, Select, Badge, Modal } from 'antd';
 import { MinusCircleOutlined, PlusOutlined, DownloadOutlined, FileTextOutlined, CloudUploadOutlined, CheckCircleOutlined, EyeOutlined, InfoCircleOutlined, ReloadOutlined, SaveOutlined, ArrowLeftOutlined, InboxOutlined, FilePdfOutlined, DeleteOutlined, FolderOutlined, FolderOpenOutlined, ThunderboltOutlined, SyncOutlined, CheckCircleFilled } from '@ant-design/icons';
 import { useParams, useNavigate } from 'react-router-dom';
@@ -7,12 +7,32 @@ import dayjs from 'dayjs';
 import locale from 'antd/es/date-picker/locale/zh_CN';
 import 'dayjs/locale/zh-cn';
 import PreviewReport from './PreviewReport';
-import { API_ENDPOINTS, getProjectAPI, getFileAPI } from './config';
+import { API_BASE_URL, API_ENDPOINTS, getProjectAPI, getFileAPI, getJobAPI } from './config';
 
 const { Title, Text } = Typography;
 const { TextArea } = Input;
 const { Dragger } = Upload;
 
+// 自动保存的防抖间隔（毫秒）
+const AUTOSAVE_DELAY = 3000;
+
+// 文件文本提取状态
+const EXTRACTION_LABELS: Record<string, string> = {
+  pending: '等待提取',
+  running: '提取中',
+  done: '已提取',
+  failed: '提取失败',
+};
+
+// 扫描页识别状态
+const OCR_LABELS: Record<string, string> = {
+  pending: '等待识别',
+  running: '识别中',
+  done: '已识别',
+  partial: '部分识别',
+  failed: '识别失败',
+};
+
 const ProjectDetail: React.FC = () => {
   const { id } = useParams<{ id: string }>();
   const navigate = useNavigate();
@@ -32,12 +52,19 @@ const ProjectDetail: React.FC = () => {
   const [scanningCount, setScanningCount] = useState(0);
 
   const [rightPanelMode, setRightPanelMode] = useState<'preview' | 'status'>('preview');
-  const [pdfUrl, setPdfUrl] = useState<string | null>(null);
+  // 预览按页显示图片：第一页先出来，其余页面滚动到时再加载
+  const [previewPages, setPreviewPages] = useState<{ key: string; pages: number; url: string; pdf_url: string } | null>(null);
   const [form] = Form.useForm();
   
   // 实时监听表单数据，用于预览
   const watchedValues = Form.useWatch([], form);
 
+  // 自动保存：记录服务端的数据版本和最近一次保存的内容，只发送变化的字段
+  const versionRef = useRef<number | null>(null);
+  const lastSavedRef = useRef<Record<string, any>>({});
+  const autosavePausedRef = useRef(false);
+  const [autoSavedAt, setAutoSavedAt] = useState<string | null>(null);
+
   // 获取文件夹分类列表
   useEffect(() => {
     const fetchCategories = async () => {
@@ -62,6 +89,9 @@ const ProjectDetail: React.FC = () => {
         const res = await axios.get(getProjectAPI(Number(id)).detail);
         setProjectData(res.data);
         setFiles(res.data.files);
+        versionRef.current = res.data.version;
+        lastSavedRef.current = res.data.data;
+        autosavePausedRef.current = false;
         
         // 填充表单
         const formData = { ...res.data.data };
@@ -101,6 +131,47 @@ const ProjectDetail: React.FC = () => {
     audit_fee_deduction: parseFloat(values.audit_fee_deduction || 0),
   });
 
+  // 完整保存之后同步版本号和已保存内容
+  const markSaved = (version: number, data: Record<string, any>) => {
+    versionRef.current = version;
+    lastSavedRef.current = data;
+  };
+
+  // 自动保存：用 JSON Merge Patch 只提交变化的顶层字段
+  const autoSave = async () => {
+    if (versionRef.current === null || autosavePausedRef.current) return;
+    const current = formatData(form.getFieldsValue());
+    const patch: Record<string, any> = {};
+    Object.keys(current).forEach(key => {
+      if (current[key] !== undefined && JSON.stringify(current[key]) !== JSON.stringify(lastSavedRef.current[key])) {
+        patch[key] = current[key];
+      }
+    });
+    if (Object.keys(patch).length === 0) return;
+
+    try {
+      const res = await axios.patch(getProjectAPI(Number(id)).data, patch, {
+        headers: { 'Content-Type': 'application/merge-patch+json', 'If-Match': `"${versionRef.current}"` },
+      });
+      markSaved(res.data.version, { ...lastSavedRef.current, ...patch });
+      setAutoSavedAt(dayjs().format('HH:mm:ss'));
+    } catch (error: any) {
+      if (error.response?.status === 412) {
+        // 项目在别处被修改过，停止自动保存，避免覆盖
+        autosavePausedRef.current = true;
+        message.warning('项目数据已在其他地方修改，自动保存已暂停，请刷新页面后再编辑');
+      } else {
+        console.error('自动保存失败', error);
+      }
+    }
+  };
+
+  useEffect(() => {
+    if (!watchedValues || versionRef.current === null) return;
+    const timer = setTimeout(autoSave, AUTOSAVE_DELAY);
+    return () => clearTimeout(timer);
+  }, [watchedValues]);
+
   // 保存数据
   const handleSave = async () => {
     setSaving(true);
@@ -108,7 +179,8 @@ const ProjectDetail: React.FC = () => {
       // 保存草稿不验证必填项，直接获取表单值
       const values = form.getFieldsValue();
       const formattedData = formatData(values);
-      await axios.put(getProjectAPI(Number(id)).save, { data: formattedData });
+      const res = await axios.put(getProjectAPI(Number(id)).save, { data: formattedData });
+      markSaved(res.data.version, formattedData);
       message.success('草稿保存成功');
     } catch (error: any) {
       console.error('保存失败:', error);
@@ -128,11 +200,9 @@ const ProjectDetail: React.FC = () => {
       const formattedData = formatData(values);
       
       const response = await axios.post(API_ENDPOINTS.preview, { data: formattedData }, {
-        responseType: 'blob',
+        params: { pages: true },
       });
-
-      const url = window.URL.createObjectURL(new Blob([response.data], { type: 'application/pdf' }));
-      setPdfUrl(url);
+      setPreviewPages(response.data);
     } catch (error) {
       console.error('预览失败', error);
     } finally {
@@ -140,6 +210,25 @@ const ProjectDetail: React.FC = () => {
     }
   };
 
+  // 等待报告任务完成（通过 SSE 接收进度）
+  const waitForJob = (jobId: string) => new Promise<void>((resolve, reject) => {
+    const source = new EventSource(getJobAPI(jobId).events);
+    source.addEventListener('progress', (event) => {
+      const job = JSON.parse((event as MessageEvent).data);
+      if (job.status === 'succeeded') {
+        source.close();
+        resolve();
+      } else if (job.status === 'failed' || job.status === 'cancelled') {
+        source.close();
+        reject(new Error(job.error || job.message));
+      }
+    });
+    source.onerror = () => {
+      source.close();
+      reject(new Error('任务进度连接中断'));
+    };
+  });
+
   // 生成并下载 Word
   const handleGenerate = async () => {
     setGenerating(true);
@@ -148,15 +237,15 @@ const ProjectDetail: React.FC = () => {
       const formattedData = formatData(values);
 
       // 先自动保存一次
-      await axios.put(getProjectAPI(Number(id)).save, { data: formattedData });
+      const saveRes = await axios.put(getProjectAPI(Number(id)).save, { data: formattedData });
+      markSaved(saveRes.data.version, formattedData);
 
-      const response = await axios.post(API_ENDPOINTS.generate, { data: formattedData }, {
-        responseType: 'blob',
-      });
+      // 创建后台任务，完成后直接通过链接下载，不再在页面里缓存整个文件
+      const res = await axios.post(API_ENDPOINTS.jobs, { kind: 'docx', project_id: Number(id) });
+      await waitForJob(res.data.id);
 
-      const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');
-      link.href = url;
+      link.href = getJobAPI(res.data.id).result;
       link.setAttribute('download', `${values.project_name || 'report'}_审核报告.docx`);
       document.body.appendChild(link);
       link.click();
@@ -436,7 +525,9 @@ const ProjectDetail: React.FC = () => {
           <Title level={4} style={{ margin: 0 }}>{projectData?.name}</Title>
         </Space>
         <Space>
+          {autoSavedAt && <Text type="secondary" style={{ fontSize: 12 }}>已自动保存 {autoSavedAt}</Text>}
           <Button icon={<SaveOutlined />} loading={saving} onClick={handleSave}>保存草稿</Button>
+          <Button icon={<FolderOutlined />} href={getProjectAPI(Number(id)).export}>导出档案</Button>
           <Button type="primary" icon={<DownloadOutlined />} loading={generating} onClick={handleGenerate}>生成报告</Button>
         </Space>
       </div>
@@ -578,6 +669,10 @@ const ProjectDetail: React.FC = () => {
                          <List.Item
                            style={{ padding: '8px 0' }}
                            actions={[
+                             <EyeOutlined
+                               style={{ fontSize: 12 }}
+                               onClick={() => window.open(getFileAPI(item.id).content, '_blank')}
+                             />,
                              <DeleteOutlined
                                style={{ color: 'red', fontSize: 12 }}
                                onClick={() => handleDeleteFile(item.id)}
@@ -587,7 +682,13 @@ const ProjectDetail: React.FC = () => {
                            <List.Item.Meta
                              avatar={<FilePdfOutlined style={{ fontSize: 14 }} />}
                              title={<Text ellipsis={{ tooltip: item.filename }} style={{ fontSize: 12 }}>{item.filename}</Text>}
-                             description={<Text type="secondary" style={{ fontSize: 11 }}>{dayjs(item.uploaded_at).format('MM-DD HH:mm')}</Text>}
+                             description={
+                               <Text type="secondary" style={{ fontSize: 11 }}>
+                                 {dayjs(item.uploaded_at).format('MM-DD HH:mm')}
+                                 {item.extraction_status && EXTRACTION_LABELS[item.extraction_status] && ` · ${EXTRACTION_LABELS[item.extraction_status]}`}
+                                 {item.ocr_status && OCR_LABELS[item.ocr_status] && ` · ${OCR_LABELS[item.ocr_status]}`}
+                               </Text>
+                             }
                            />
                          </List.Item>
                        )}
@@ -810,12 +911,23 @@ const ProjectDetail: React.FC = () => {
                     <Spin size="large" />
                     <div style={{ marginTop: 16 }}>正在生成 PDF 预览...</div>
                   </div>
-                ) : pdfUrl ? (
-                  <iframe 
-                    src={pdfUrl} 
-                    style={{ width: '100%', height: '100%', border: 'none', display: 'block' }} 
-                    title="PDF Preview"
-                  />
+                ) : previewPages ? (
+                  <div style={{ height: '100%', overflowY: 'auto', padding: 12 }}>
+                    {Array.from({ length: previewPages.pages }, (_, i) => (
+                      <img
+                        key={`${previewPages.key}-${i}`}
+                        src={`${API_BASE_URL}${previewPages.url}/${i + 1}?width=1200`}
+                        loading={i === 0 ? 'eager' : 'lazy'}
+                        alt={`第 ${i + 1} 页`}
+                        style={{ width: '100%', aspectRatio: 'auto 210 / 297', display: 'block', margin: '0 auto 12px', background: 'white' }}
+                      />
+                    ))}
+                    <div style={{ textAlign: 'center' }}>
+                      <a href={`${API_BASE_URL}${previewPages.pdf_url}`} target="_blank" rel="noreferrer" style={{ color: '#ddd' }}>
+                        打开 PDF
+                      </a>
+                    </div>
+                  </div>
                 ) : (
                   <div style={{ height: '100%', display: 'flex', justifyContent: 'center', alignItems: 'center', color: '#ccc' }}>
                     <Text style={{ color: '#ccc' }}>点击“刷新预览”查看效果</Text>
@@ -1,6 +1,6 @@
 import React, { useEffect, useState } from 'react';
-import { Card, Button, Table, Modal, Form, Input, message, Typography, Space, Popconfirm } from 'antd';
-import { PlusOutlined, FolderOpenOutlined, DeleteOutlined, RightOutlined } from '@ant-design/icons';
+import { Card, Button, Table, Modal, Form, Input, message, Typography, Space, Popconfirm, Upload } from 'antd';
+import { PlusOutlined, FolderOpenOutlined, DeleteOutlined, RightOutlined, ImportOutlined } from '@ant-design/icons';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import dayjs from 'dayjs';
@@ -16,18 +16,38 @@ interface Project {
   updated_at: string;
 }
 
+interface ProjectPage {
+  items: Project[];
+  total: number;
+  next_cursor: string | null;
+}
+
+const PAGE_SIZE = 20;
+
 const ProjectList: React.FC = () => {
   const [projects, setProjects] = useState<Project[]>([]);
+  const [total, setTotal] = useState(0);
+  const [keyword, setKeyword] = useState('');
+  // 游标分页：cursors[i] 是第 i 页的起始游标，第一页为 null
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
+  const [page, setPage] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [isModalVisible, setIsModalVisible] = useState(false);
+  const [importing, setImporting] = useState(false);
   const [form] = Form.useForm();
   const navigate = useNavigate();
 
-  const fetchProjects = async () => {
+  const fetchProjects = async (pageIndex = page, pageCursors = cursors, q = keyword) => {
     setLoading(true);
     try {
-      const res = await axios.get(API_ENDPOINTS.projects);
-      setProjects(res.data);
+      const params: Record<string, any> = { limit: PAGE_SIZE };
+      if (pageCursors[pageIndex]) params.cursor = pageCursors[pageIndex];
+      if (q) params.q = q;
+      const res = await axios.get<ProjectPage>(API_ENDPOINTS.projects, { params });
+      setProjects(res.data.items);
+      setTotal(res.data.total);
+      setNextCursor(res.data.next_cursor);
     } catch (error) {
       message.error('加载项目列表失败');
     } finally {
@@ -39,13 +59,40 @@ const ProjectList: React.FC = () => {
     fetchProjects();
   }, []);
 
+  // 回到第一页重新加载（新建、搜索之后）
+  const reloadFirstPage = (q = keyword) => {
+    setCursors([null]);
+    setPage(0);
+    fetchProjects(0, [null], q);
+  };
+
+  const handleSearch = (value: string) => {
+    const q = value.trim();
+    setKeyword(q);
+    reloadFirstPage(q);
+  };
+
+  const goNext = () => {
+    if (!nextCursor) return;
+    const newCursors = [...cursors.slice(0, page + 1), nextCursor];
+    setCursors(newCursors);
+    setPage(page + 1);
+    fetchProjects(page + 1, newCursors);
+  };
+
+  const goPrev = () => {
+    if (page === 0) return;
+    setPage(page - 1);
+    fetchProjects(page - 1);
+  };
+
   const handleCreate = async (values: any) => {
     try {
       await axios.post(API_ENDPOINTS.projects, values);
       message.success('项目创建成功');
       setIsModalVisible(false);
       form.resetFields();
-      fetchProjects();
+      reloadFirstPage();
     } catch (error: any) {
       console.error(error);
       // 显示具体错误信息，方便排查
@@ -54,6 +101,22 @@ const ProjectList: React.FC = () => {
     }
   };
 
+  // 导入档案 ZIP：文件夹名对应文件分类，导入后进入新项目
+  const handleImport = async (file: File) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    setImporting(true);
+    try {
+      const res = await axios.post(API_ENDPOINTS.importProject, formData);
+      message.success('导入成功');
+      navigate(`/project/${res.data.id}`);
+    } catch (error: any) {
+      message.error(error.response?.data?.detail || '导入失败');
+    } finally {
+      setImporting(false);
+    }
+  };
+
   const handleDelete = async (id: number) => {
     try {
       await axios.delete(getProjectAPI(id).delete);
@@ -110,19 +173,40 @@ const ProjectList: React.FC = () => {
           <Title level={3} style={{ margin: 0 }}>项目管理</Title>
           <Text type="secondary">管理您的工程造价咨询项目</Text>
         </div>
-        <Button type="primary" icon={<PlusOutlined />} onClick={() => setIsModalVisible(true)}>
-          新建项目
-        </Button>
+        <Space>
+          <Upload accept=".zip" showUploadList={false} beforeUpload={(file) => { handleImport(file); return false; }}>
+            <Button icon={<ImportOutlined />} loading={importing}>导入档案</Button>
+          </Upload>
+          <Button type="primary" icon={<PlusOutlined />} onClick={() => setIsModalVisible(true)}>
+            新建项目
+          </Button>
+        </Space>
       </div>
 
       <Card bordered={false} bodyStyle={{ padding: 0 }}>
+        <div style={{ padding: 16 }}>
+          <Input.Search
+            placeholder="搜索项目名称或编号"
+            allowClear
+            onSearch={handleSearch}
+            style={{ maxWidth: 360 }}
+          />
+        </div>
         <Table 
           columns={columns} 
           dataSource={projects} 
           rowKey="id" 
           loading={loading}
-          pagination={{ pageSize: 10 }} 
+          pagination={false}
         />
+        <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', padding: 16 }}>
+          <Text type="secondary">共 {total} 个项目</Text>
+          <Space>
+            <Button onClick={goPrev} disabled={page === 0 || loading}>上一页</Button>
+            <Text>第 {page + 1} 页</Text>
+            <Button onClick={goNext} disabled={!nextCursor || loading}>下一页</Button>
+          </Space>
+        </div>
       </Card>
 
       <Modal
@@ -8,17 +8,30 @@ export const API_ENDPOINTS = {
   projects: `${API_BASE_URL}/api/projects`,
   preview: `${API_BASE_URL}/api/preview`,
   generate: `${API_BASE_URL}/api/generate`,
+  jobs: `${API_BASE_URL}/api/jobs`,
+  importProject: `${API_BASE_URL}/api/projects/import`,
 };
 
 // 辅助函数：生成项目相关的 API 路径
 export const getProjectAPI = (id: number) => ({
   detail: `${API_BASE_URL}/api/projects/${id}`,
   save: `${API_BASE_URL}/api/projects/${id}/save`,
+  data: `${API_BASE_URL}/api/projects/${id}/data`,
   upload: `${API_BASE_URL}/api/projects/${id}/upload`,
   delete: `${API_BASE_URL}/api/projects/${id}`,
+  export: `${API_BASE_URL}/api/projects/${id}/export`,
 });
 
 // 辅助函数：生成文件相关的 API 路径
 export const getFileAPI = (id: number) => ({
+  content: `${API_BASE_URL}/api/files/${id}/content`,
   delete: `${API_BASE_URL}/api/files/${id}`,
 });
+
+// 辅助函数：生成报告任务相关的 API 路径
+export const getJobAPI = (id: string) => ({
+  detail: `${API_BASE_URL}/api/jobs/${id}`,
+  events: `${API_BASE_URL}/api/jobs/${id}/events`,
+  result: `${API_BASE_URL}/api/jobs/${id}/result`,
+  cancel: `${API_BASE_URL}/api/jobs/${id}/cancel`,
+});
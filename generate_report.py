@@ -1,46 +1,130 @@
-from docxtpl import DocxTemplate
-import datetime
-
-def generate_test_report():
-    # 1. 加载模板 (确保你已经修改并保存了 report_template.docx)
-    tpl = DocxTemplate('/Users/crj/Documents/code/baogao_code/report_template.docx')
-    
-    # 2. 准备模拟数据 (这些数据未来将由 AI 从合同和结算书中提取)
-    context = {
-        "project_name": "江南大道及两侧楼宇景观亮化提升工程",
-        "report_date": "2026年01月04日",
-        "report_code": "杭滨咨(2026)结审第001号",
-        "client_name": "杭州市滨江区城市建设投资集团有限公司",
-        "project_description": "本工程主要包括江南大道（西兴路-火炬大道）及周边楼宇的亮化设计与施工，涉及灯具安装 1200 套，控制系统升级等内容。",
-        "builder_name": "杭州市滨江区城市建设投资集团有限公司",
-        "designer_name": "中国联合工程有限公司",
-        "contractor_name": "浙江省一建建设集团有限公司",
-        "supervisor_name": "杭州市建设工程监理有限公司",
-        "agent_name": "杭州市滨江区代建中心",
-        "duration_days": "365",
-        "start_date": "2024年05月01日",
-        "end_date": "2025年05月01日",
-        "contract_amount": "1500.25",
-        "submit_amount_wan": "1550.80",
-        "audit_amount": "14,800,000.00",
-        "final_approved_amount": "14,750,000.00",
-        "reduction_amount": "758,000.00",
-        "adjustments": [
-            {"content": "C30混凝土工程量按实调减", "amount": "12.50"},
-            {"content": "亮化灯具品牌更换核减差价", "amount": "8.30"},
-            {"content": "取消部分不必要的装饰挂件", "amount": "5.20"}
-        ]
-    }
-    
-    # 3. 渲染模板
+#!/usr/bin/env python3
+"""
+报告生成命令行工具
+
+批量生成（结果写入一个 ZIP，每个项目失败与否记录在 _batch_report.json 中）：
+    python3 generate_report.py --ids 1 2 3 -o reports.zip
+    python3 generate_report.py --updated-after 2026-01-01 --kind pdf -o 月结报告.zip
+
+生成一份示例报告（用于检查模板）：
+    python3 generate_report.py --sample -o generated_report_test.docx
+"""
+
+import argparse
+import shutil
+import sys
+from datetime import datetime
+
+from sqlmodel import Session
+
+import server
+from batch_report import iter_batch_zip, BATCH_WORKERS
+
+# 示例数据 (这些数据未来将由 AI 从合同和结算书中提取)
+SAMPLE_CONTEXT = {
+    "project_name": "江南大道及两侧楼宇景观亮化提升工程",
+    "report_date": "2026年01月04日",
+    "report_code": "杭滨咨(2026)结审第001号",
+    "client_name": "杭州市滨江区城市建设投资集团有限公司",
+    "project_description": "本工程主要包括江南大道（西兴路-火炬大道）及周边楼宇的亮化设计与施工，涉及灯具安装 1200 套，控制系统升级等内容。",
+    "builder_name": "杭州市滨江区城市建设投资集团有限公司",
+    "designer_name": "中国联合工程有限公司",
+    "contractor_name": "浙江省一建建设集团有限公司",
+    "supervisor_name": "杭州市建设工程监理有限公司",
+    "agent_name": "杭州市滨江区代建中心",
+    "duration_days": "365",
+    "start_date": "2024年05月01日",
+    "end_date": "2025年05月01日",
+    "contract_amount": "1500.25",
+    "submit_amount_wan": "1550.80",
+    "audit_amount": "14,800,000.00",
+    "final_approved_amount": "14,750,000.00",
+    "reduction_amount": "758,000.00",
+    "adjustments": [
+        {"content": "C30混凝土工程量按实调减", "amount": "12.50"},
+        {"content": "亮化灯具品牌更换核减差价", "amount": "8.30"},
+        {"content": "取消部分不必要的装饰挂件", "amount": "5.20"}
+    ]
+}
+
+
+def parse_date(text: str) -> datetime:
+    return datetime.fromisoformat(text)
+
+
+def generate_sample(output: str, template: str):
+    path = server.generate_docx_file(dict(SAMPLE_CONTEXT), "sample", template)
+    shutil.move(path, output)
+    print(f"成功生成报告：{output}")
+
+
+def generate_batch(args) -> int:
+    with Session(server.engine) as session:
+        items = server.select_batch_items(
+            session,
+            project_ids=args.ids,
+            created_after=args.created_after,
+            created_before=args.created_before,
+            updated_after=args.updated_after,
+            updated_before=args.updated_before,
+        )
+    if not any(item.error is None for item in items):
+        print("❌ 没有符合条件的项目")
+        return 1
+
+    if args.kind == "pdf":
+        server.converter.start()
+
+    failed = 0
+
+    def on_result(result):
+        nonlocal failed
+        if result.status == "ok":
+            print(f"✅ [{result.project_id}] {result.name} -> {result.filename}")
+        else:
+            failed += 1
+            print(f"❌ [{result.project_id}] {result.name}: {result.error}")
+
+    def render(data: dict, kind: str):
+        return server.render_cached(data, kind, args.template)
+
+    print(f"🚀 共 {len(items)} 个项目，开始生成...")
     try:
-        tpl.render(context)
-        # 4. 保存结果
-        output_path = '/Users/crj/Documents/code/baogao_code/generated_report_test.docx'
-        tpl.save(output_path)
-        print(f"成功生成报告：{output_path}")
-    except Exception as e:
-        print(f"渲染出错: {e}")
+        with open(args.output, "wb") as f:
+            for chunk in iter_batch_zip(items, args.kind, render, workers=args.workers, on_result=on_result):
+                f.write(chunk)
+    finally:
+        server.converter.shutdown()
+
+    print(f"📦 已写入 {args.output}（成功 {len(items) - failed}，失败 {failed}）")
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="工程造价咨询报告生成工具")
+    parser.add_argument("--ids", type=int, nargs="+", help="项目 ID 列表")
+    parser.add_argument("--created-after", type=parse_date, help="创建时间下限，如 2026-01-01")
+    parser.add_argument("--created-before", type=parse_date, help="创建时间上限（不含）")
+    parser.add_argument("--updated-after", type=parse_date, help="更新时间下限")
+    parser.add_argument("--updated-before", type=parse_date, help="更新时间上限（不含）")
+    parser.add_argument("--kind", choices=["docx", "pdf"], default="docx", help="输出格式")
+    parser.add_argument("--template", default=None, help="报告模板名称，默认结算审核")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="并行渲染数")
+    parser.add_argument("--sample", action="store_true", help="用示例数据生成一份报告")
+    parser.add_argument("-o", "--output", help="输出文件路径")
+    args = parser.parse_args()
+
+    if args.sample:
+        generate_sample(args.output or "generated_report_test.docx", args.template)
+        return 0
+
+    if not (args.ids or args.created_after or args.created_before or args.updated_after or args.updated_before):
+        parser.error("请指定 --ids 或时间筛选条件")
+
+    args.output = args.output or f"批量报告_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+    server.create_db_and_tables()
+    return generate_batch(args)
+
 
 if __name__ == "__main__":
-    generate_test_report()
+    sys.exit(main())
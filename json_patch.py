@@ -0,0 +1,286 @@
+"""
+项目数据的增量更新
+
+支持两种补丁格式：
+- JSON Patch (RFC 6902)：application/json-patch+json，操作列表 add/remove/replace/move/copy/test
+- JSON Merge Patch (RFC 7386)：application/merge-patch+json，一个对象，null 表示删除
+
+data_json 是一个 JSON 对象。应用补丁时先把顶层拆成 键 -> 原始 JSON 片段，
+只解析和重新序列化补丁涉及的顶层字段，其余字段（如很长的 adjustments_description）原样拼回，
+自动保存时不必每次解析、序列化整个文档。
+"""
+
+import copy
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Set, Tuple
+
+MERGE_PATCH = "application/merge-patch+json"
+JSON_PATCH = "application/json-patch+json"
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class PatchError(Exception):
+    """补丁格式错误或无法应用（路径不存在等）"""
+
+
+class PatchTestFailed(PatchError):
+    """JSON Patch 的 test 操作不成立"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _skip_value(text: str, pos: int) -> int:
+    """跳过一个 JSON 值，返回其后的位置；字符串和嵌套结构只做括号匹配，不构造 Python 对象"""
+    ch = text[pos]
+    if ch == '"':
+        return json.decoder.scanstring(text, pos + 1)[1]
+    if ch in "[{":
+        depth = 0
+        while pos < len(text):
+            ch = text[pos]
+            if ch == '"':
+                pos = json.decoder.scanstring(text, pos + 1)[1]
+                continue
+            if ch in "[{":
+                depth += 1
+            elif ch in "]}":
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            pos += 1
+        raise ValueError("Unterminated JSON value")
+    # 数字、true/false/null
+    return _decoder.raw_decode(text, pos)[1]
+
+
+def split_top_level(text: str) -> "OrderedDict[str, str]":
+    """把 JSON 对象拆成 顶层键 -> 值的原始 JSON 文本"""
+    fragments: "OrderedDict[str, str]" = OrderedDict()
+    pos = _skip_ws(text, 0)
+    if pos >= len(text) or text[pos] != "{":
+        raise ValueError("Document is not a JSON object")
+    pos = _skip_ws(text, pos + 1)
+    if pos < len(text) and text[pos] == "}":
+        return fragments
+    while True:
+        if pos >= len(text) or text[pos] != '"':
+            raise ValueError(f"Expected key at {pos}")
+        key, pos = json.decoder.scanstring(text, pos + 1)
+        pos = _skip_ws(text, pos)
+        if pos >= len(text) or text[pos] != ":":
+            raise ValueError(f"Expected ':' at {pos}")
+        pos = _skip_ws(text, pos + 1)
+        end = _skip_value(text, pos)
+        fragments[key] = text[pos:end]
+        pos = _skip_ws(text, end)
+        if pos < len(text) and text[pos] == ",":
+            pos = _skip_ws(text, pos + 1)
+            continue
+        if pos < len(text) and text[pos] == "}":
+            return fragments
+        raise ValueError(f"Expected ',' or '}}' at {pos}")
+
+
+def join_top_level(fragments: "OrderedDict[str, str]") -> str:
+    return "{" + ", ".join(f"{_dumps(key)}: {value}" for key, value in fragments.items()) + "}"
+
+
+# --- JSON Pointer (RFC 6901) ---
+def parse_pointer(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [part.replace("~1", "/").replace("~0", "~") for part in pointer[1:].split("/")]
+
+
+def _array_index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(doc: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        if isinstance(doc, dict):
+            if token not in doc:
+                raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_array_index(doc, token, allow_end=False)]
+        else:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+    return doc
+
+
+def _add(doc: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = _resolve(doc, tokens[:-1])
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        parent[last] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, last, allow_end=True), value)
+    else:
+        raise PatchError(f"Cannot add to non-container at /{'/'.join(tokens[:-1])}")
+    return doc
+
+
+def _remove(doc: Any, tokens: List[str]) -> Tuple[Any, Any]:
+    if not tokens:
+        raise PatchError("Cannot remove the document root")
+    parent = _resolve(doc, tokens[:-1])
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+        return doc, parent.pop(last)
+    if isinstance(parent, list):
+        return doc, parent.pop(_array_index(parent, last, allow_end=False))
+    raise PatchError(f"Path not found: /{'/'.join(tokens)}")
+
+
+_OPERATIONS = ("add", "remove", "replace", "move", "copy", "test")
+
+
+def validate_operations(operations: Any):
+    """检查 JSON Patch 操作的结构（不涉及文档内容），格式错误抛出 PatchError"""
+    if not isinstance(operations, list):
+        raise PatchError("JSON Patch body must be an array of operations")
+    for op in operations:
+        if not isinstance(op, dict) or "op" not in op or "path" not in op:
+            raise PatchError("Each operation needs 'op' and 'path'")
+        name = op["op"]
+        if name not in _OPERATIONS:
+            raise PatchError(f"Unknown operation: {name!r}")
+        if not isinstance(op["path"], str):
+            raise PatchError("'path' must be a string")
+        if name in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"'{name}' operation needs 'value'")
+        if name in ("move", "copy"):
+            if "from" not in op:
+                raise PatchError(f"'{name}' operation needs 'from'")
+            if not isinstance(op["from"], str):
+                raise PatchError("'from' must be a string")
+
+
+def apply_json_patch(doc: Any, operations: List[Dict[str, Any]]) -> Any:
+    """按 RFC 6902 依次应用操作，任何一步失败都抛出 PatchError（调用方不提交，即整体原子）"""
+    validate_operations(operations)
+    for op in operations:
+        name = op["op"]
+        tokens = parse_pointer(op["path"])
+        if name == "add":
+            doc = _add(doc, tokens, copy.deepcopy(op["value"]))
+        elif name == "remove":
+            doc, _ = _remove(doc, tokens)
+        elif name == "replace":
+            _resolve(doc, tokens)
+            if tokens:
+                doc, _ = _remove(doc, tokens)
+            doc = _add(doc, tokens, copy.deepcopy(op["value"]))
+        elif name in ("move", "copy"):
+            source = parse_pointer(op["from"])
+            if name == "move":
+                if tokens[:len(source)] == source and tokens != source:
+                    raise PatchError("Cannot move a value into its own child")
+                doc, value = _remove(doc, source)
+            else:
+                value = copy.deepcopy(_resolve(doc, source))
+            doc = _add(doc, tokens, value)
+        elif name == "test":
+            if _resolve(doc, tokens) != op["value"]:
+                raise PatchTestFailed(f"Test failed at {op['path']}")
+    return doc
+
+
+def apply_merge_patch(target: Any, patch: Any) -> Any:
+    """RFC 7386：对象逐键合并，null 删除键，其他类型整体替换"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = apply_merge_patch(target.get(key), value)
+    return target
+
+
+def touched_keys(kind: str, patch: Any) -> Set[str]:
+    """补丁涉及的顶层键；返回空集合表示补丁作用于整个文档"""
+    if kind == MERGE_PATCH:
+        if not isinstance(patch, dict):
+            return set()
+        return set(patch)
+    keys: Set[str] = set()
+    for op in patch:
+        # 只有 move/copy 的 from 有意义（也只有它们的 from 经过检查），其他操作带的 from 忽略
+        pointers = [op["path"]]
+        if op["op"] in ("move", "copy"):
+            pointers.append(op["from"])
+        for pointer in pointers:
+            tokens = parse_pointer(pointer)
+            if not tokens:
+                return set()
+            keys.add(tokens[0])
+    return keys
+
+
+def patch_document(data_json: str, kind: str, patch: Any) -> Tuple[str, Dict[str, Any], List[str]]:
+    """
+    对 data_json 应用补丁，返回 (新的 JSON 文本, 新增或修改的顶层字段, 删除的顶层键)。
+    补丁作用于根时整份文档重新解析和序列化，第二项为完整的新文档。
+    """
+    if kind not in (JSON_PATCH, MERGE_PATCH):
+        raise PatchError(f"Unsupported patch type: {kind}")
+    if kind == JSON_PATCH:
+        # 先检查操作结构，touched_keys 才能放心读取 path/from
+        validate_operations(patch)
+
+    try:
+        fragments = split_top_level(data_json or "{}")
+    except ValueError:
+        # 旧数据不是合法对象时，从空对象开始
+        fragments = OrderedDict()
+
+    keys = touched_keys(kind, patch)
+    if not keys:
+        doc = {key: json.loads(value) for key, value in fragments.items()}
+        doc = apply_merge_patch(doc, patch) if kind == MERGE_PATCH else apply_json_patch(doc, patch)
+        if not isinstance(doc, dict):
+            raise PatchError("Project data must remain a JSON object")
+        return _dumps(doc), doc, [key for key in fragments if key not in doc]
+
+    # 只解析涉及的顶层字段，在这个小文档上应用补丁
+    partial = {key: json.loads(fragments[key]) for key in keys if key in fragments}
+    partial = apply_merge_patch(partial, patch) if kind == MERGE_PATCH else apply_json_patch(partial, patch)
+    if not isinstance(partial, dict):
+        raise PatchError("Project data must remain a JSON object")
+
+    removed = []
+    for key in keys:
+        if key in partial:
+            fragments[key] = _dumps(partial[key])
+        elif key in fragments:
+            del fragments[key]
+            removed.append(key)
+    return join_top_level(fragments), partial, removed
@@ -0,0 +1,481 @@
+"""
+扫描件 OCR
+
+文本提取阶段标记为 needs_ocr 的页面（只有图片、没有文字层）在这里识别：
+1. 栅格化：PDF 页面用 pypdfium2 渲染为灰度图（图片文件直接读取），按像素内容计算哈希
+2. 查缓存：同一张图片（按图片哈希 + 引擎）只识别一次，如多个文件里相同的盖章页
+3. 识别：未命中缓存的页面分发到进程池，每页有单独的超时
+识别结果写回 pagetext 表（source = "ocr"），界面读取文本的方式不变。
+
+OCR 引擎可替换：OCR_ENGINE = easyocr / paddleocr / stub，
+stub 不依赖任何模型，按图片内容返回确定的文本，用于测试和开发环境。
+未设置时自动选择已安装的 easyocr 或 paddleocr，都没有安装时跳过 OCR。
+识别任务与文本提取一样记录持有进程和心跳（见 task_lease.py），启动时只接管持有者已经退出的任务。
+"""
+
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, select
+
+from blob_store import BlobStore
+from scratch import ScratchStore
+from task_lease import TaskLease
+from text_extraction import EXTRACT_DONE, PageText, TextExtraction, detect_kind
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# OCR 引擎，为空时自动选择
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "")
+# OCR 进程数
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", "2"))
+# 单页超时（秒），包括子进程首次加载模型的时间
+OCR_PAGE_TIMEOUT = float(os.environ.get("OCR_PAGE_TIMEOUT", "120"))
+# 栅格化分辨率
+OCR_DPI = int(os.environ.get("OCR_DPI", "200"))
+
+OCR_PENDING = "pending"
+OCR_RUNNING = "running"
+OCR_DONE = "done"
+OCR_PARTIAL = "partial" # 部分页面失败或超时
+OCR_FAILED = "failed"
+
+
+class OcrJob(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    engine: str
+    status: str = OCR_PENDING
+    pages: int = 0 # 需要识别的页数
+    done_pages: int = 0
+    cached_pages: int = 0 # 命中图片缓存的页数
+    failed_pages: int = 0
+    error: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.now)
+    # 执行识别的进程和心跳时间，见 task_lease.py
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+
+
+class OcrCache(SQLModel, table=True):
+    image_sha256: str = Field(primary_key=True)
+    engine: str = Field(primary_key=True)
+    text: str = ""
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+# --- OCR 引擎 ---
+class StubEngine:
+    """确定性的替身引擎：文本只取决于图片内容，不加载模型"""
+
+    name = "stub"
+
+    def recognize(self, image_path: str) -> str:
+        with Image.open(image_path) as image:
+            digest = hashlib.sha256(image.tobytes()).hexdigest()
+            return f"[OCR {image.width}x{image.height} {digest[:16]}]"
+
+
+class EasyOcrEngine:
+    name = "easyocr"
+
+    def __init__(self):
+        import easyocr
+        self.reader = easyocr.Reader(["ch_sim", "en"], gpu=False, verbose=False)
+
+    def recognize(self, image_path: str) -> str:
+        return "\n".join(self.reader.readtext(image_path, detail=0, paragraph=True))
+
+
+class PaddleOcrEngine:
+    name = "paddleocr"
+
+    def __init__(self):
+        from paddleocr import PaddleOCR
+        self.ocr = PaddleOCR(use_angle_cls=True, lang="ch", show_log=False)
+
+    def recognize(self, image_path: str) -> str:
+        lines = []
+        for block in self.ocr.ocr(image_path, cls=True) or []:
+            for _box, (text, _score) in block or []:
+                lines.append(text)
+        return "\n".join(lines)
+
+
+# 引擎名称 -> (实现类, 依赖的模块)
+OCR_ENGINES: Dict[str, Tuple[Callable[[], Any], Optional[str]]] = {
+    "stub": (StubEngine, None),
+    "easyocr": (EasyOcrEngine, "easyocr"),
+    "paddleocr": (PaddleOcrEngine, "paddleocr"),
+}
+
+
+def engine_available(name: str) -> bool:
+    if name not in OCR_ENGINES:
+        return False
+    module = OCR_ENGINES[name][1]
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def resolve_engine(name: str = OCR_ENGINE) -> Optional[str]:
+    """确定要使用的引擎；指定的引擎不可用或没有安装任何引擎时返回 None"""
+    if name:
+        return name if engine_available(name) else None
+    for candidate in ("easyocr", "paddleocr"):
+        if engine_available(candidate):
+            return candidate
+    return None
+
+
+# 每个子进程只加载一次模型
+_engines: Dict[str, Any] = {}
+
+
+def _get_engine(name: str):
+    if name not in _engines:
+        _engines[name] = OCR_ENGINES[name][0]()
+    return _engines[name]
+
+
+# --- 在子进程中执行 ---
+def rasterize_page(path: str, kind: str, page: int, dpi: int, out_dir: str) -> Tuple[str, str]:
+    """把一页渲染为灰度 PNG，返回 (图片哈希, 图片路径)；只打开这一页，不载入整个文档"""
+    if Image is None:
+        raise RuntimeError("Pillow 未安装，无法栅格化页面")
+    if kind == "pdf":
+        if pdfium is None:
+            raise RuntimeError("pypdfium2 未安装，无法栅格化 PDF")
+        pdf = pdfium.PdfDocument(path)
+        try:
+            pdf_page = pdf[page - 1]
+            image = pdf_page.render(scale=dpi / 72).to_pil()
+            pdf_page.close()
+        finally:
+            pdf.close()
+    else:
+        with Image.open(path) as source:
+            image = source.copy()
+    image = image.convert("L")
+    digest = hashlib.sha256(f"{image.width}x{image.height}:".encode() + image.tobytes()).hexdigest()
+    out_path = os.path.join(out_dir, f"ocr_{digest}.png")
+    if not os.path.exists(out_path):
+        image.save(out_path)
+    return digest, out_path
+
+
+def recognize_image(engine: str, image_path: str) -> str:
+    return _get_engine(engine).recognize(image_path)
+
+
+class OcrRunner:
+    """
+    一个协调线程依次处理文件，每个文件的页面分发到进程池并行识别。
+    同时运行的任务数不超过进程数，任务提交即开始执行，单页超时据此计时。
+    """
+
+    def __init__(
+        self,
+        engine,
+        store: BlobStore,
+        scratch: ScratchStore,
+        ocr_engine: Optional[str] = None,
+        max_workers: int = OCR_WORKERS,
+        page_timeout: float = OCR_PAGE_TIMEOUT,
+        dpi: int = OCR_DPI,
+    ):
+        self.engine = engine
+        self.store = store
+        self.scratch = scratch
+        self.ocr_engine = resolve_engine(ocr_engine if ocr_engine is not None else OCR_ENGINE)
+        self.max_workers = max(1, max_workers)
+        self.page_timeout = page_timeout
+        self.dpi = dpi
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.listeners = []
+        self.lease = TaskLease(engine, OcrJob, OcrJob.sha256, (OCR_PENDING, OCR_RUNNING), name="OCR 任务")
+        if self.ocr_engine is None:
+            print("OcrRunner: 没有可用的 OCR 引擎，扫描页不做识别")
+
+    @property
+    def available(self) -> bool:
+        return self.ocr_engine is not None
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _terminate_pool(self):
+        """结束所有子进程：进程池不能单独取消已经开始执行的任务，超时只能整体重建"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _fan_out(self, fn, jobs: List[Tuple[Any, tuple]]) -> Dict[Any, Any]:
+        """并行执行 fn(*args)，返回 key -> 结果或异常；超时的任务结果为 TimeoutError"""
+        results: Dict[Any, Any] = {}
+        queue = deque(jobs)
+        running: Dict[Any, Tuple[Any, tuple, float]] = {}
+        while queue or running:
+            pool = self._process_pool()
+            while queue and len(running) < self.max_workers:
+                key, args = queue.popleft()
+                running[pool.submit(fn, *args)] = (key, args, time.monotonic())
+
+            oldest = min(started for _, _, started in running.values())
+            done, _ = wait(
+                list(running),
+                timeout=max(0.0, oldest + self.page_timeout - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            broken = False
+            for future in done:
+                key, _, _ = running.pop(future)
+                try:
+                    results[key] = future.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    results[key] = e
+                except Exception as e:
+                    results[key] = e
+            if broken:
+                # 子进程崩溃（如内存不足被杀）
+                self._terminate_pool()
+                for key, _, _ in running.values():
+                    results[key] = BrokenProcessPool("OCR 进程异常退出")
+                running.clear()
+                continue
+
+            now = time.monotonic()
+            expired = [f for f, (_, _, started) in running.items() if now - started >= self.page_timeout]
+            if expired:
+                for future in expired:
+                    key, _, _ = running.pop(future)
+                    results[key] = TimeoutError(f"超过 {self.page_timeout:g} 秒")
+                # 其余未超时的任务随进程池一起结束，重新排队
+                for key, args, _ in running.values():
+                    queue.appendleft((key, args))
+                running.clear()
+                self._terminate_pool()
+        return results
+
+    def _update(self, sha256: str, **fields):
+        with Session(self.engine) as session:
+            job = session.get(OcrJob, sha256)
+            if job is None:
+                return
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = datetime.now()
+            session.add(job)
+            session.commit()
+
+    def submit(self, sha256: str, force: bool = False) -> Optional[str]:
+        """文本提取完成后调用：有扫描页时排队识别；没有可用引擎或不需要识别时返回 None"""
+        if not self.available:
+            return None
+        with Session(self.engine) as session:
+            record = session.get(TextExtraction, sha256)
+            if record is None or record.status != EXTRACT_DONE:
+                return None
+            if not force and record.ocr_pages == 0:
+                return None
+            job = session.get(OcrJob, sha256)
+            if job is not None and job.engine != self.ocr_engine:
+                # 换了引擎，之前识别过的页面也要重新识别
+                force = True
+            if job is not None and not force:
+                return job.status
+            if job is None:
+                job = OcrJob(sha256=sha256, engine=self.ocr_engine)
+            job.engine = self.ocr_engine
+            job.status = OCR_PENDING
+            job.error = None
+            job.updated_at = datetime.now()
+            for key, value in self.lease.stamp().items():
+                setattr(job, key, value)
+            session.add(job)
+            try:
+                session.commit()
+            except IntegrityError:
+                return OCR_PENDING
+        self._queue(sha256, force)
+        return OCR_PENDING
+
+    def _queue(self, sha256: str, force: bool):
+        self.lease.hold(sha256)
+        self._thread.submit(self._run, sha256, force)
+
+    def _run(self, sha256: str, force: bool):
+        try:
+            self._recognize_file(sha256, force)
+        except Exception as e:
+            print(f"OcrRunner Error ({sha256[:12]}): {e}")
+            self._update(sha256, status=OCR_FAILED, error=str(e) or type(e).__name__)
+            return
+        finally:
+            self.lease.drop(sha256)
+        for listener in self.listeners:
+            try:
+                listener(sha256)
+            except Exception as e:
+                print(f"OcrRunner listener error: {e}")
+
+    def _recognize_file(self, sha256: str, force: bool):
+        engine_name = self.ocr_engine
+        path = self.store.path_for(sha256)
+        with Session(self.engine) as session:
+            query = select(PageText.page).where(PageText.sha256 == sha256)
+            if force:
+                # 重新识别：包括之前识别过的页面，有文字层的页面不动
+                query = query.where(or_(PageText.needs_ocr == True, PageText.source == "ocr")) # noqa: E712
+            else:
+                query = query.where(PageText.needs_ocr == True) # noqa: E712
+            pages = list(session.exec(query.order_by(PageText.page)).all())
+        kind = detect_kind(path)
+        self._update(sha256, status=OCR_RUNNING, pages=len(pages), done_pages=0, cached_pages=0, failed_pages=0)
+
+        # 栅格化的图片放在任务自己的子目录里：识别可能持续很久，按大小清理临时目录时不会删掉还没识别的页面
+        job_dir = self.scratch.job_dir("ocr")
+        try:
+            images, errors, cached, recognized = self._rasterize_and_recognize(engine_name, path, kind, pages, job_dir)
+        finally:
+            self.scratch.discard_dir(job_dir)
+
+        texts: Dict[int, str] = {}
+        new_cache: Dict[str, str] = {}
+        for page, (digest, _) in images.items():
+            if digest in cached:
+                texts[page] = cached[digest]
+                continue
+            result = recognized.get(digest)
+            if isinstance(result, BaseException):
+                errors[page] = result
+            else:
+                texts[page] = result
+                new_cache[digest] = result
+
+        with Session(self.engine) as session:
+            for digest, text in new_cache.items():
+                if session.get(OcrCache, (digest, engine_name)) is None:
+                    session.add(OcrCache(image_sha256=digest, engine=engine_name, text=text))
+            for page, text in texts.items():
+                row = session.get(PageText, (sha256, page))
+                if row is None:
+                    continue
+                row.text = text
+                row.source = "ocr"
+                row.needs_ocr = False
+                session.add(row)
+            job = session.get(OcrJob, sha256)
+            if job is None:
+                # 识别期间文件已被删除
+                session.rollback()
+                return
+            job.done_pages = len(texts)
+            job.cached_pages = sum(1 for digest, _ in images.values() if digest in cached)
+            job.failed_pages = len(errors)
+            if not errors:
+                job.status, job.error = OCR_DONE, None
+            else:
+                job.status = OCR_PARTIAL if texts else OCR_FAILED
+                job.error = "; ".join(
+                    f"第 {page} 页: {str(e) or type(e).__name__}" for page, e in sorted(errors.items())
+                )[:1000]
+            job.updated_at = datetime.now()
+            session.add(job)
+            session.commit()
+
+    def _rasterize_and_recognize(self, engine_name: str, path: str, kind: str, pages: List[int], out_dir: str):
+        """栅格化到 out_dir 并识别缓存未命中的页面，返回 (页面图片, 栅格化错误, 缓存命中, 识别结果)"""
+        # 1. 栅格化
+        rendered = self._fan_out(
+            rasterize_page, [(page, (path, kind, page, self.dpi, out_dir)) for page in pages]
+        )
+        images = {page: r for page, r in rendered.items() if not isinstance(r, BaseException)}
+        errors = {page: r for page, r in rendered.items() if isinstance(r, BaseException)}
+
+        # 2. 查图片缓存
+        hashes = {digest for digest, _ in images.values()}
+        with Session(self.engine) as session:
+            cached = dict(session.exec(
+                select(OcrCache.image_sha256, OcrCache.text)
+                .where(OcrCache.engine == engine_name, OcrCache.image_sha256.in_(list(hashes)))
+            ).all()) if hashes else {}
+
+        # 3. 识别未命中的图片（同一文件里相同的页面只识别一次）
+        misses = {digest: image_path for digest, image_path in images.values() if digest not in cached}
+        recognized = self._fan_out(
+            recognize_image, [(digest, (engine_name, image_path)) for digest, image_path in misses.items()]
+        )
+        return images, errors, cached, recognized
+
+    def _requeue_orphans(self):
+        """重新排队持有者已经退出的识别（其他进程正在进行的不动）"""
+        for sha256 in self.lease.claim_stale(status=OCR_PENDING, updated_at=datetime.now()):
+            self._queue(sha256, False)
+
+    def recover(self):
+        """
+        服务启动时：重新排队中断的识别，并补上已提取文本但还没有识别的扫描件；
+        之后随心跳定期检查中断的识别
+        """
+        if not self.available:
+            return
+        self._requeue_orphans()
+        with Session(self.engine) as session:
+            missing = list(session.exec(
+                select(TextExtraction.sha256)
+                .where(TextExtraction.status == EXTRACT_DONE, TextExtraction.ocr_pages > 0,
+                       TextExtraction.sha256.not_in(select(OcrJob.sha256)))
+            ).all())
+        for sha256 in missing:
+            self.submit(sha256)
+        self.lease.start(self._requeue_orphans)
+
+    def statuses(self, session: Session, sha256s: Iterable[str]) -> Dict[str, str]:
+        sha256s = list({sha for sha in sha256s if sha})
+        if not sha256s:
+            return {}
+        return dict(session.exec(select(OcrJob.sha256, OcrJob.status).where(OcrJob.sha256.in_(sha256s))).all())
+
+    def forget(self, sha256s: Iterable[str]):
+        """文件内容被删除后清除识别记录；图片缓存按图片哈希保存，与文件无关，保留"""
+        sha256s = list(sha256s)
+        if not sha256s:
+            return
+        with Session(self.engine) as session:
+            session.execute(delete(OcrJob).where(OcrJob.sha256.in_(sha256s)))
+            session.commit()
+
+    def shutdown(self):
+        self.lease.stop()
+        self._thread.shutdown(wait=False, cancel_futures=True)
+        self._terminate_pool()
@@ -0,0 +1,422 @@
+"""
+页面图片：把 PDF（生成的预览、上传的附件）逐页渲染为 PNG/WebP 缩略图
+
+预览区以前要先下载整份 PDF 才能显示。现在按页请求图片：第一页渲染完即可显示，
+其余页面在滚动到时再请求。
+- 每页单独渲染，只打开这一页，几百页的扫描件也不会整份载入内存
+- 渲染在进程池中执行，每个子进程限制地址空间（PAGE_IMAGE_MEMORY_MB），
+  单页像素数超过 PAGE_IMAGE_MAX_PIXELS 时按比例缩小，异常大的扫描页不会拖垮 Web 进程
+- 结果按 PDF 内容哈希 + 页码 + 宽度 + 格式缓存在磁盘上，按总字节数 LRU 淘汰；
+  同一页的并发请求只渲染一次
+- 字节数和 LRU 顺序在每个进程内各自统计（启动时只把已有的文件计入一次）：
+  多个 uvicorn worker 共用缓存目录时，磁盘占用最多约为 worker 数 × PAGE_IMAGE_CACHE_MAX_BYTES，
+  设置上限时要按 worker 数分摊
+"""
+
+import hashlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# 可选的图片宽度（像素），请求其他宽度时取不小于它的最接近的一档
+PAGE_IMAGE_WIDTHS = tuple(sorted(int(w) for w in os.environ.get("PAGE_IMAGE_WIDTHS", "160,480,1200").split(",")))
+PAGE_IMAGE_FORMATS = {"webp": "image/webp", "png": "image/png"}
+# 渲染进程数
+PAGE_IMAGE_WORKERS = int(os.environ.get("PAGE_IMAGE_WORKERS", "2"))
+# 每个渲染进程的内存（地址空间）上限，0 为不限制
+PAGE_IMAGE_MEMORY_MB = int(os.environ.get("PAGE_IMAGE_MEMORY_MB", "1024"))
+# 单页渲染的像素上限
+PAGE_IMAGE_MAX_PIXELS = int(os.environ.get("PAGE_IMAGE_MAX_PIXELS", str(16 * 1024 * 1024)))
+# 单页渲染超时（秒）
+PAGE_IMAGE_TIMEOUT = float(os.environ.get("PAGE_IMAGE_TIMEOUT", "60"))
+# 磁盘缓存总大小上限（每个进程各自计算，见模块说明）
+PAGE_IMAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# 记住页数的文档数
+_PAGE_COUNT_CACHE_SIZE = 4096
+
+
+class PageImageError(Exception):
+    pass
+
+
+class RenderTimeout(Exception):
+    """子进程内的渲染超过时限"""
+
+
+def _raise_timeout(signum, frame):
+    raise RenderTimeout()
+
+
+def _with_deadline(timeout: float, fn, *args):
+    """
+    在子进程中执行 fn，时限从开始执行算起（不含排队时间）。
+    到时先用 SIGALRM 在 Python 代码中抛出 RenderTimeout，子进程和进程池照常可用；
+    卡在不返回的 C 调用里时，再过同样长的时间由看门狗线程结束子进程（进程池随之重建）
+    """
+    if timeout <= 0:
+        return fn(*args)
+    watchdog = threading.Timer(timeout * 2, os._exit, args=(1,))
+    watchdog.daemon = True
+    watchdog.start()
+    alarm = hasattr(signal, "setitimer")
+    if alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        watchdog.cancel()
+
+
+def _limit_memory(memory_mb: int):
+    """子进程初始化：限制地址空间，超出时渲染抛出 MemoryError 而不是耗尽整机内存"""
+    if resource is None or memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def count_pages(path: str, kind: str) -> int:
+    if kind == "image":
+        return 1
+    if pdfium is None:
+        raise RuntimeError("pypdfium2 未安装，无法渲染 PDF 页面")
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _fit(width: float, height: float, target: int, max_pixels: int) -> float:
+    """缩放比例：宽度缩放到 target，像素数不超过 max_pixels"""
+    scale = target / width
+    if width * height * scale * scale > max_pixels:
+        scale = (max_pixels / (width * height)) ** 0.5
+    return scale
+
+
+def render_page(path: str, kind: str, page: int, width: int, fmt: str, out_path: str, max_pixels: int) -> int:
+    """在子进程中执行：渲染一页写入 out_path，返回文件字节数"""
+    if Image is None:
+        raise RuntimeError("Pillow 未安装，无法生成页面图片")
+    if kind == "pdf":
+        if pdfium is None:
+            raise RuntimeError("pypdfium2 未安装，无法渲染 PDF 页面")
+        pdf = pdfium.PdfDocument(path)
+        try:
+            pdf_page = pdf[page - 1]
+            page_width, page_height = pdf_page.get_size()
+            image = pdf_page.render(scale=_fit(page_width, page_height, width, max_pixels)).to_pil()
+            pdf_page.close()
+        finally:
+            pdf.close()
+    else:
+        Image.MAX_IMAGE_PIXELS = max_pixels * 16
+        with Image.open(path) as source:
+            # JPEG 可以直接按缩小的尺寸解码，不必先解出原图
+            source.draft("RGB", (width, int(width * source.height / source.width)))
+            scale = _fit(source.width, source.height, width, max_pixels)
+            image = source.convert("RGB").resize((max(1, round(source.width * scale)), max(1, round(source.height * scale))))
+
+    image = image.convert("RGB")
+    tmp_path = f"{out_path}.{uuid.uuid4().hex}.tmp"
+    if fmt == "webp":
+        image.save(tmp_path, "WEBP", quality=80, method=4)
+    else:
+        image.save(tmp_path, "PNG")
+    os.replace(tmp_path, out_path)
+    return os.path.getsize(out_path)
+
+
+class PageImages:
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = PAGE_IMAGE_CACHE_MAX_BYTES,
+        max_workers: int = PAGE_IMAGE_WORKERS,
+        memory_mb: int = PAGE_IMAGE_MEMORY_MB,
+        max_pixels: int = PAGE_IMAGE_MAX_PIXELS,
+        timeout: float = PAGE_IMAGE_TIMEOUT,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_workers = max(1, max_workers)
+        self.memory_mb = memory_mb
+        self.max_pixels = max_pixels
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # 图片路径 -> 字节数，按访问顺序排列
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # 正在渲染的图片路径 -> (进程池, Future)，同一页的并发请求共用
+        self._inflight: Dict[str, Tuple[ProcessPoolExecutor, Future]] = {}
+        # 已提交、尚未完成的任务数（用于估算排队时间）
+        self._queued = 0
+        # (路径, 修改时间, 大小) -> 内容哈希；内容哈希 -> 页数
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._page_counts: "OrderedDict[str, int]" = OrderedDict()
+        # 可重入：get() 持锁提交任务时，已完成任务的回调会在当前线程里立即执行
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        # 其他进程可能正在写 .tmp 文件；只删除超过渲染时限（含看门狗）仍未改名的，即中断留下的
+        stale_after = self.timeout * 2 + 60 if self.timeout > 0 else 3600
+        now = time.time()
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    # 其他进程刚刚改名或淘汰
+                    continue
+                if name.endswith(".tmp"):
+                    if now - st.st_mtime > stale_after:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                files.append((st.st_atime, path, st.st_size))
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_limit_memory,
+                    initargs=(self.memory_mb,),
+                )
+            return self._pool
+
+    def _terminate_pool(self, pool: Optional[ProcessPoolExecutor] = None):
+        """
+        结束进程池的全部子进程，下次使用时重建。
+        指定 pool 时只处理这个进程池：它已被替换时不动新的进程池，避免其他请求刚建好的进程池被连带结束
+        """
+        with self._pool_lock:
+            if pool is None:
+                pool = self._pool
+            if self._pool is pool:
+                self._pool = None
+        if pool is None:
+            return
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args) -> Tuple[ProcessPoolExecutor, Future]:
+        pool = self._process_pool()
+        future = pool.submit(_with_deadline, self.timeout, fn, *args)
+        with self._lock:
+            self._queued += 1
+        future.add_done_callback(self._done)
+        return pool, future
+
+    def _done(self, future: Future):
+        with self._lock:
+            self._queued -= 1
+
+    def _call(self, fn, *args):
+        return self._wait(*self._submit(fn, *args))
+
+    def _wait(self, pool: ProcessPoolExecutor, future: Future):
+        # 时限在子进程内从开始渲染算起；这里只是兜底，按排在前面的任务数放宽，正常排队不会触发
+        with self._lock:
+            rounds = self._queued // self.max_workers + 1
+        backstop = self.timeout * 2 * rounds + 5 if self.timeout > 0 else None
+        try:
+            return future.result(timeout=backstop)
+        except (RenderTimeout, FutureTimeout):
+            if not future.done():
+                self._terminate_pool(pool)
+            raise PageImageError(f"页面渲染超过 {self.timeout:g} 秒")
+        except BrokenProcessPool:
+            # 子进程崩溃（如超出内存上限被杀、看门狗结束），重建这个进程池
+            self._terminate_pool(pool)
+            raise PageImageError("页面渲染进程异常退出")
+        except MemoryError:
+            raise PageImageError("页面过大，超出渲染内存上限")
+
+    # --- 文档信息 ---
+    def digest(self, path: str) -> str:
+        """文件内容哈希（生成的预览没有现成的哈希），按路径 + 修改时间 + 大小记住"""
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+            if digest is not None:
+                self._digests.move_to_end(key)
+                return digest
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[key] = digest
+            while len(self._digests) > _PAGE_COUNT_CACHE_SIZE:
+                self._digests.popitem(last=False)
+        return digest
+
+    def page_count(self, sha256: str, path: str, kind: str = "pdf") -> int:
+        with self._lock:
+            count = self._page_counts.get(sha256)
+            if count is not None:
+                self._page_counts.move_to_end(sha256)
+                return count
+        try:
+            count = self._call(count_pages, path, kind)
+        except PageImageError:
+            raise
+        except Exception as e:
+            raise PageImageError(f"无法读取文档: {e}")
+        with self._lock:
+            self._page_counts[sha256] = count
+            while len(self._page_counts) > _PAGE_COUNT_CACHE_SIZE:
+                self._page_counts.popitem(last=False)
+        return count
+
+    @staticmethod
+    def pick_width(width: Optional[int]) -> int:
+        if not width:
+            return PAGE_IMAGE_WIDTHS[-1]
+        return next((w for w in PAGE_IMAGE_WIDTHS if w >= width), PAGE_IMAGE_WIDTHS[-1])
+
+    def _image_path(self, sha256: str, page: int, width: int, fmt: str) -> str:
+        return os.path.join(self.cache_dir, sha256[:2], f"{sha256}_{page}_{width}.{fmt}")
+
+    # --- 渲染 ---
+    def get(self, sha256: str, path: str, kind: str, page: int, width: int, fmt: str = "webp") -> str:
+        """返回页面图片路径，缓存中没有时渲染（同一页只渲染一次）"""
+        if fmt not in PAGE_IMAGE_FORMATS:
+            raise PageImageError(f"Unsupported format: {fmt}")
+        width = self.pick_width(width)
+        image_path = self._image_path(sha256, page, width, fmt)
+        with self._lock:
+            if image_path in self._entries and os.path.exists(image_path):
+                self._entries.move_to_end(image_path)
+                self.hits += 1
+                return image_path
+            self.misses += 1
+            task = self._inflight.get(image_path)
+            owner = task is None
+            if owner:
+                os.makedirs(os.path.dirname(image_path), exist_ok=True)
+                task = self._submit(render_page, path, kind, page, width, fmt, image_path, self.max_pixels)
+                self._inflight[image_path] = task
+        try:
+            size = self._wait(*task)
+        except PageImageError:
+            with self._lock:
+                self.failures += owner
+            raise
+        except Exception as e:
+            with self._lock:
+                self.failures += owner
+            raise PageImageError(f"页面渲染失败: {e}")
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(image_path, None)
+        if owner:
+            with self._lock:
+                if image_path not in self._entries:
+                    self._entries[image_path] = size
+                    self._total_bytes += size
+                    self._evict()
+        return image_path
+
+    def prefetch(self, sha256: str, path: str, kind: str, page: int, width: int, fmt: str = "webp"):
+        """后台提前渲染（如预览生成后先渲染第一页），不等待结果"""
+        threading.Thread(target=self._prefetch, args=(sha256, path, kind, page, width, fmt), daemon=True).start()
+
+    def _prefetch(self, *args):
+        try:
+            self.get(*args)
+        except PageImageError as e:
+            print(f"PageImages prefetch error: {e}")
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def forget(self, sha256s):
+        """文件内容被删除后清除其页面图片"""
+        with self._lock:
+            for sha256 in sha256s:
+                self._page_counts.pop(sha256, None)
+                prefix = os.path.join(self.cache_dir, sha256[:2], sha256 + "_")
+                for path in [p for p in self._entries if p.startswith(prefix)]:
+                    self._total_bytes -= self._entries.pop(path)
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "rendering": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "widths": list(PAGE_IMAGE_WIDTHS),
+            }
+
+    def shutdown(self):
+        self._terminate_pool()
@@ -0,0 +1,208 @@
+"""
+预览/生成结果缓存（内容寻址）
+
+缓存键 = sha256(模板名称 + 模板文件内容哈希 + 产物类型 + 规范化后的报告数据)。
+同一份数据重复预览时，只需一次哈希和一次文件读取即可返回。
+- 按总字节数做 LRU 淘汰。字节数、LRU 顺序和租约都在每个进程内各自记录：
+  多个 uvicorn worker 共用缓存目录时，磁盘占用最多约为 worker 数 × PREVIEW_CACHE_MAX_BYTES，
+  设置上限时要按 worker 数分摊
+- 记录命中/未命中次数
+- 模板文件变化（内容哈希变化）时自动清除该模板的缓存
+- 正在使用的条目（下载、写入 ZIP、拼接 PDF）通过 lease() 租用，租用期间不会被淘汰或删除，
+  释放最后一个租约时再补做淘汰
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+# 缓存总大小上限（每个进程各自计算，见模块说明）
+PREVIEW_CACHE_MAX_BYTES = int(os.environ.get("PREVIEW_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+def normalize_data(data: Dict[str, Any]) -> str:
+    """
+    规范化报告数据：键排序、去掉多余空白。
+    注意不改变值的类型（1500 和 1500.0 渲染结果不同，不能合并）
+    """
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class CacheLease:
+    """租用中的缓存文件；用完调用 release()，或用 with 语句（得到文件路径）"""
+
+    def __init__(self, cache: "PreviewCache", key: str, path: str):
+        self.cache = cache
+        self.key = key
+        self.path = path
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.cache._release(self.key)
+
+    def __enter__(self) -> str:
+        return self.path
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class PreviewCache:
+    def __init__(self, cache_dir: str, max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # key -> (文件路径, 字节数, 模板名称)
+        self._entries: "OrderedDict[str, Tuple[str, int, Optional[str]]]" = OrderedDict()
+        self._total_bytes = 0
+        # 模板名称 -> 最近一次见到的内容哈希
+        self._template_digests: Dict[str, str] = {}
+        # key -> 租约数；租用期间要删除的 key（释放后再删）
+        self._pins: Dict[str, int] = {}
+        self._doomed: Set[str] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        """重启后沿用磁盘上已有的缓存文件，按修改时间恢复 LRU 顺序"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                files.append((st.st_mtime, name, path, st.st_size))
+        for _, name, path, size in sorted(files):
+            key = os.path.splitext(name)[0]
+            self._entries[key] = (path, size, None)
+            self._total_bytes += size
+        self._evict()
+
+    def key(self, data: Dict[str, Any], kind: str, template_name: str, template_digest: str) -> str:
+        with self._lock:
+            last_digest = self._template_digests.get(template_name)
+            if last_digest != template_digest:
+                # 模板已变化，该模板的旧缓存全部作废
+                if last_digest:
+                    print(f"PreviewCache: 模板 {template_name} 已更新，清除其缓存")
+                    self._clear_locked(template_name)
+                self._template_digests[template_name] = template_digest
+        h = hashlib.sha256()
+        h.update(template_name.encode("utf-8"))
+        h.update(template_digest.encode())
+        h.update(kind.encode())
+        h.update(normalize_data(data).encode("utf-8"))
+        return h.hexdigest()
+
+    def _get_locked(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or key in self._doomed or not os.path.exists(entry[0]):
+            if entry is not None and key not in self._doomed:
+                self._remove_locked(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """返回缓存文件路径（不租用，只适合判断是否已缓存；要读取文件时用 lease）"""
+        with self._lock:
+            return self._get_locked(key)
+
+    def lease(self, key: str) -> Optional[CacheLease]:
+        """租用缓存文件，未命中时返回 None"""
+        with self._lock:
+            path = self._get_locked(key)
+            if path is None:
+                return None
+            self._pins[key] = self._pins.get(key, 0) + 1
+            return CacheLease(self, key, path)
+
+    def _release(self, key: str):
+        with self._lock:
+            count = self._pins.pop(key) - 1
+            if count:
+                self._pins[key] = count
+                return
+            if key in self._doomed:
+                self._doomed.discard(key)
+                self._remove_locked(key)
+            self._evict()
+
+    def put(self, key: str, src_path: str, template_name: Optional[str] = None) -> str:
+        """将生成好的文件移入缓存目录，返回缓存中的路径"""
+        return self._put(key, src_path, template_name, False)
+
+    def put_lease(self, key: str, src_path: str, template_name: Optional[str] = None) -> CacheLease:
+        """同 put，同时租用，放入后到使用前不会被其他请求淘汰"""
+        return CacheLease(self, key, self._put(key, src_path, template_name, True))
+
+    def _put(self, key: str, src_path: str, template_name: Optional[str], pin: bool) -> str:
+        ext = os.path.splitext(src_path)[1]
+        dst_path = os.path.join(self.cache_dir, key + ext)
+        os.replace(src_path, dst_path)
+        size = os.path.getsize(dst_path)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            # 同一个键内容相同，新文件替换了待删除的旧文件，不再删除
+            self._doomed.discard(key)
+            self._entries[key] = (dst_path, size, template_name)
+            self._total_bytes += size
+            if pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            self._evict()
+        return dst_path
+
+    def _evict(self):
+        # 按 LRU 顺序跳过租用中的条目
+        candidates = iter([key for key in self._entries if key not in self._pins])
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key = next(candidates, None)
+            if key is None:
+                break
+            self._remove_locked(key)
+            self.evictions += 1
+
+    def _remove_locked(self, key: str):
+        if key in self._pins:
+            # 正在使用，释放后再删
+            self._doomed.add(key)
+            return
+        path, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _clear_locked(self, template_name: Optional[str] = None):
+        for key, entry in list(self._entries.items()):
+            if template_name is None or entry[2] in (template_name, None):
+                self._remove_locked(key)
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "leased": len(self._pins),
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
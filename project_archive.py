@@ -0,0 +1,267 @@
+"""
+项目档案的导出与导入
+
+导出：项目的全部附件按分类放在各自的文件夹下（合同/xxx.pdf、工程结算书/xxx.pdf ...），
+另附 data.json（项目数据）、生成的报告和 project.json（清单）。
+ZIP 边写边输出，每个文件按块复制，内存里只有当前这一块，也不在磁盘上拼出完整的 ZIP。
+PDF、图片、Office 文档等本身已经压缩过，直接存储，不再浪费 CPU 重新压缩。
+
+导入：ZIP 的中央目录在文件末尾，而流式写出的条目（本模块导出的也一样）在本地文件头里没有大小，
+只能从末尾读起，所以上传的 ZIP 先流式写入临时文件（不在内存里），
+再逐个条目按块解压进内容寻址存储。文件夹名与 FILE_CATEGORIES 对应，对不上的归入"其他"。
+"""
+
+import json
+import os
+import posixpath
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from batch_report import Rendered, _StreamBuffer, opened, safe_filename
+
+# 导入的 ZIP 大小上限（上传大小和解压后的总大小）
+ARCHIVE_MAX_BYTES = int(os.environ.get("ARCHIVE_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+# 导入的 ZIP 最多包含的文件数
+ARCHIVE_MAX_ENTRIES = int(os.environ.get("ARCHIVE_MAX_ENTRIES", "5000"))
+# 复制文件内容的块大小
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+MANIFEST_NAME = "project.json"
+DATA_NAME = "data.json"
+REPORT_DIR = "生成报告"
+# project.json / data.json 读入内存，限制大小
+_META_MAX_BYTES = 16 * 1024 * 1024
+
+# 已经压缩过的格式，存储时不再压缩
+COMPRESSED_SUFFIXES = {
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".tif", ".tiff", ".heic",
+    ".docx", ".xlsx", ".pptx", ".ofd", ".zip", ".rar", ".7z", ".gz", ".bz2", ".xz",
+    ".mp3", ".mp4", ".mov", ".avi",
+}
+# 没有扩展名时按文件头判断
+_COMPRESSED_MAGIC = (b"%PDF-", b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"PK\x03\x04", b"Rar!", b"7z\xbc\xaf")
+
+# ZIP 的 UTF-8 文件名标记
+_UTF8_FLAG = 0x800
+_SKIPPED_NAMES = {".DS_Store", "Thumbs.db", "desktop.ini"}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+@dataclass
+class ArchiveFile:
+    category: str
+    filename: str
+    path: str
+    size: int = 0
+    sha256: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+
+
+@dataclass
+class ArchiveEntry:
+    info: zipfile.ZipInfo
+    category: str
+    filename: str
+
+
+@dataclass
+class ImportPlan:
+    manifest: Dict = field(default_factory=dict)
+    data: Optional[dict] = None
+    entries: List[ArchiveEntry] = field(default_factory=list)
+
+
+def is_compressed(filename: str, path: Optional[str] = None) -> bool:
+    if os.path.splitext(filename)[1].lower() in COMPRESSED_SUFFIXES:
+        return True
+    if path:
+        try:
+            with open(path, "rb") as f:
+                return f.read(8).startswith(_COMPRESSED_MAGIC)
+        except OSError:
+            return False
+    return False
+
+
+def _zip_time(value: Optional[datetime]) -> Tuple[int, int, int, int, int, int]:
+    value = value or datetime.now()
+    # ZIP 的时间从 1980 年开始
+    return max(value, datetime(1980, 1, 1)).timetuple()[:6]
+
+
+def _unique(arcname: str, used: set) -> str:
+    if arcname not in used:
+        used.add(arcname)
+        return arcname
+    base, ext = posixpath.splitext(arcname)
+    n = 2
+    while f"{base} ({n}){ext}" in used:
+        n += 1
+    arcname = f"{base} ({n}){ext}"
+    used.add(arcname)
+    return arcname
+
+
+def _write_file(zf: zipfile.ZipFile, buffer: _StreamBuffer, arcname: str, path: str,
+                compress_type: int, date_time) -> Iterator[bytes]:
+    """按块把文件写入 ZIP，每写一块就把压缩好的数据交给调用方"""
+    info = zipfile.ZipInfo(arcname, date_time=date_time)
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    size = os.path.getsize(path)
+    with open(path, "rb") as src, zf.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+        while True:
+            chunk = src.read(ARCHIVE_CHUNK_SIZE)
+            if not chunk:
+                break
+            dest.write(chunk)
+            yield buffer.drain()
+
+
+def iter_project_archive(
+    project: Dict,
+    data_json: str,
+    files: List[ArchiveFile],
+    render_report: Optional[Callable[[], Tuple[Rendered, str]]] = None,
+) -> Iterator[bytes]:
+    """
+    逐块输出项目档案 ZIP。
+    render_report() 返回 (报告文件路径或租约, 扩展名)，渲染失败时跳过报告并记入 project.json。
+    """
+    buffer = _StreamBuffer()
+    used = {MANIFEST_NAME, DATA_NAME}
+    manifest = dict(project)
+    manifest.update({"exported_at": datetime.now().isoformat(timespec="seconds"), "report": None, "files": []})
+
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        try:
+            data = json.loads(data_json or "{}")
+        except ValueError:
+            data = None
+        # 解析失败时原样保留
+        content = json.dumps(data, ensure_ascii=False, indent=2) if data is not None else data_json
+        zf.writestr(DATA_NAME, content)
+        yield buffer.drain()
+
+        if render_report is not None:
+            report = None
+            try:
+                report = render_report()
+            except Exception as e:
+                print(f"Archive Report Error: {e}")
+                manifest["report_error"] = str(e)
+            if report is not None:
+                rendered, ext = report
+                arcname = _unique(f"{REPORT_DIR}/{safe_filename(project.get('name') or '')}_审核报告.{ext}", used)
+                # 租约在写完（或导出中途被关闭）时释放
+                with opened(rendered) as path:
+                    yield from _write_file(zf, buffer, arcname, path, zipfile.ZIP_STORED, _zip_time(None))
+                manifest["report"] = arcname
+
+        for f in files:
+            entry = {"category": f.category, "filename": f.filename, "size": f.size, "sha256": f.sha256,
+                     "uploaded_at": f.uploaded_at.isoformat(timespec="seconds") if f.uploaded_at else None}
+            if not os.path.exists(f.path):
+                entry["missing"] = True
+                manifest["files"].append(entry)
+                continue
+            name = posixpath.basename(f.filename.replace("\\", "/")) or "file"
+            arcname = _unique(f"{f.category}/{name}", used)
+            compress = zipfile.ZIP_STORED if is_compressed(name, f.path) else zipfile.ZIP_DEFLATED
+            yield from _write_file(zf, buffer, arcname, f.path, compress, _zip_time(f.uploaded_at))
+            entry["path"] = arcname
+            manifest["files"].append(entry)
+
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    yield buffer.drain()
+
+
+# --- 导入 ---
+def entry_name(info: zipfile.ZipInfo) -> str:
+    """
+    没有 UTF-8 标记的文件名被 zipfile 按 cp437 解码；
+    Windows 自带压缩工具打包的中文文件名实际是 GBK，这里还原。
+    """
+    if info.flag_bits & _UTF8_FLAG:
+        return info.filename
+    try:
+        raw = info.filename.encode("cp437")
+    except UnicodeEncodeError:
+        return info.filename
+    for encoding in ("utf-8", "gbk"):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return info.filename
+
+
+def _read_json(zf: zipfile.ZipFile, info: zipfile.ZipInfo):
+    if info.file_size > _META_MAX_BYTES:
+        raise ArchiveError(f"{info.filename} 过大")
+    try:
+        return json.loads(zf.read(info).decode("utf-8"))
+    except ValueError as e:
+        raise ArchiveError(f"{info.filename} 解析失败: {e}")
+
+
+def plan_import(zf: zipfile.ZipFile, categories: List[str], max_entry_bytes: int) -> ImportPlan:
+    """读取中央目录，决定每个条目的分类和文件名；大小和数量超限时在写入任何数据前拒绝"""
+    plan = ImportPlan()
+    names = []
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        parts = [p for p in entry_name(info).replace("\\", "/").split("/") if p]
+        if not parts or "__MACOSX" in parts or parts[-1] in _SKIPPED_NAMES or parts[-1].startswith("._"):
+            continue
+        names.append((info, parts))
+
+    # 整个档案包在一个文件夹里时（如 "某项目/合同/..."）去掉这一层
+    roots = {parts[0] for _, parts in names}
+    if len(roots) == 1 and all(len(parts) > 1 for _, parts in names) and next(iter(roots)) not in categories:
+        names = [(info, parts[1:]) for info, parts in names]
+
+    by_path = {"/".join(parts): info for info, parts in names}
+    if MANIFEST_NAME in by_path:
+        manifest = _read_json(zf, by_path[MANIFEST_NAME])
+        if isinstance(manifest, dict):
+            plan.manifest = manifest
+    if DATA_NAME in by_path:
+        data = _read_json(zf, by_path[DATA_NAME])
+        if isinstance(data, dict):
+            plan.data = data
+    # 导出时附带的报告会根据数据重新生成，不作为附件导入
+    report = plan.manifest.get("report")
+
+    total = 0
+    for info, parts in names:
+        path = "/".join(parts)
+        if path in (MANIFEST_NAME, DATA_NAME) or path == report:
+            continue
+        if info.file_size > max_entry_bytes:
+            raise ArchiveError(f"{path} 超过单个文件大小上限 {max_entry_bytes} 字节")
+        total += info.file_size
+        category = next((p for p in parts[:-1] if p in categories), "其他")
+        plan.entries.append(ArchiveEntry(info=info, category=category, filename=parts[-1]))
+
+    if len(plan.entries) > ARCHIVE_MAX_ENTRIES:
+        raise ArchiveError(f"文件数 {len(plan.entries)} 超过上限 {ARCHIVE_MAX_ENTRIES}")
+    if total > ARCHIVE_MAX_BYTES:
+        raise ArchiveError(f"解压后总大小超过上限 {ARCHIVE_MAX_BYTES} 字节")
+    return plan
+
+
+def copy_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo, writer) -> None:
+    """按块解压一个条目写入 writer（BlobWriter），不把整个文件读进内存"""
+    with zf.open(info) as src:
+        while True:
+            chunk = src.read(ARCHIVE_CHUNK_SIZE)
+            if not chunk:
+                break
+            writer.write(chunk)
@@ -0,0 +1,180 @@
+"""
+项目数据的版本历史
+
+每次保存都记录一个版本，存储方式：
+- 增量：相对上一个版本变化了哪些顶层字段（新值 + 删除的键），zlib 压缩
+- 快照：完整的 data_json，zlib 压缩；每 HISTORY_SNAPSHOT_INTERVAL 个版本一份，
+  以及改动超过整份数据的一半、或缺少上一个版本时
+读取任意版本 = 最近的快照 + 其后最多 HISTORY_SNAPSHOT_INTERVAL - 1 个增量。
+每次保存占用的空间与改动的字段大小成正比，而不是整份数据。
+"""
+
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func
+from sqlmodel import Field, Session, SQLModel, select
+
+from json_patch import split_top_level
+
+# 每隔多少个版本存一份完整快照
+HISTORY_SNAPSHOT_INTERVAL = int(os.environ.get("HISTORY_SNAPSHOT_INTERVAL", "20"))
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+class ProjectVersion(SQLModel, table=True):
+    project_id: int = Field(foreign_key="project.id", primary_key=True)
+    version: int = Field(primary_key=True)
+    kind: str = DELTA # snapshot 或 delta
+    payload: bytes
+    # 变化的顶层字段（JSON 数组），列表接口不用解压 payload
+    changed_keys: str = "[]"
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class VersionNotFound(Exception):
+    pass
+
+
+def _compress(obj_json: str) -> bytes:
+    return zlib.compress(obj_json.encode("utf-8"), 6)
+
+
+def _decompress(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def diff_documents(old_json: str, new_data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """比较保存前的 data_json 和新数据的顶层字段，返回 (新增或修改的字段, 删除的键)"""
+    try:
+        old = split_top_level(old_json or "{}")
+    except ValueError:
+        old = {}
+    changed = {
+        key: value for key, value in new_data.items()
+        if old.get(key) != json.dumps(value, ensure_ascii=False)
+    }
+    removed = [key for key in old if key not in new_data]
+    return changed, removed
+
+
+def _pointer(key: str) -> str:
+    return "/" + key.replace("~", "~0").replace("/", "~1")
+
+
+def version_diff(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """两个版本之间的顶层差异，以 JSON Patch (RFC 6902) 操作表示，附带旧值方便展示"""
+    ops = []
+    for key in old:
+        path = _pointer(key)
+        if key not in new:
+            ops.append({"op": "remove", "path": path, "old": old[key]})
+        elif old[key] != new[key]:
+            ops.append({"op": "replace", "path": path, "value": new[key], "old": old[key]})
+    for key in new:
+        if key not in old:
+            ops.append({"op": "add", "path": _pointer(key), "value": new[key]})
+    return ops
+
+
+class ProjectHistory:
+    def __init__(self, snapshot_interval: int = HISTORY_SNAPSHOT_INTERVAL):
+        self.snapshot_interval = max(1, snapshot_interval)
+
+    def _last_snapshot(self, session: Session, project_id: int, at_most: Optional[int] = None) -> Optional[int]:
+        query = select(func.max(ProjectVersion.version)).where(
+            ProjectVersion.project_id == project_id, ProjectVersion.kind == SNAPSHOT
+        )
+        if at_most is not None:
+            query = query.where(ProjectVersion.version <= at_most)
+        return session.exec(query).one()
+
+    def record(
+        self,
+        session: Session,
+        project_id: int,
+        version: int,
+        data_json: str,
+        changed: Optional[Dict[str, Any]] = None,
+        removed: Optional[List[str]] = None,
+    ):
+        """
+        在调用方的事务中记录一个版本（由调用方提交）。
+        data_json 是保存后的完整数据；changed/removed 为相对上一版本的变化，为 None 时只能存快照。
+        """
+        changed_keys = sorted(set(changed or {}) | set(removed or []))
+        payload = None
+        kind = SNAPSHOT
+        if changed is not None:
+            last_snapshot = self._last_snapshot(session, project_id)
+            has_previous = session.get(ProjectVersion, (project_id, version - 1)) is not None
+            if has_previous and last_snapshot is not None and version - last_snapshot < self.snapshot_interval:
+                delta = json.dumps({"set": changed, "unset": removed or []}, ensure_ascii=False)
+                # 改动超过整份数据的一半时直接存快照，读取也更快
+                if len(delta) * 2 < len(data_json):
+                    kind, payload = DELTA, _compress(delta)
+        if payload is None:
+            payload = _compress(data_json)
+        session.add(ProjectVersion(
+            project_id=project_id,
+            version=version,
+            kind=kind,
+            payload=payload,
+            changed_keys=json.dumps(changed_keys, ensure_ascii=False),
+        ))
+
+    def list_versions(self, session: Session, project_id: int, limit: int = 50,
+                      before: Optional[int] = None) -> List[Dict[str, Any]]:
+        query = select(
+            ProjectVersion.version, ProjectVersion.kind, ProjectVersion.changed_keys,
+            func.length(ProjectVersion.payload), ProjectVersion.created_at,
+        ).where(ProjectVersion.project_id == project_id)
+        if before is not None:
+            query = query.where(ProjectVersion.version < before)
+        rows = session.exec(query.order_by(ProjectVersion.version.desc()).limit(limit)).all()
+        return [
+            {
+                "version": version,
+                "kind": kind,
+                "changed_keys": json.loads(changed_keys),
+                "stored_bytes": stored_bytes,
+                "created_at": created_at.isoformat(),
+            }
+            for version, kind, changed_keys, stored_bytes, created_at in rows
+        ]
+
+    def get(self, session: Session, project_id: int, version: int) -> Tuple[Dict[str, Any], datetime]:
+        """还原某个版本的完整数据：最近的快照 + 之后的增量"""
+        base = self._last_snapshot(session, project_id, at_most=version)
+        if base is None:
+            raise VersionNotFound(f"Version {version} not found")
+        rows = session.exec(
+            select(ProjectVersion)
+            .where(
+                ProjectVersion.project_id == project_id,
+                ProjectVersion.version >= base,
+                ProjectVersion.version <= version,
+            )
+            .order_by(ProjectVersion.version)
+        ).all()
+        if not rows or rows[-1].version != version:
+            raise VersionNotFound(f"Version {version} not found")
+
+        data: Dict[str, Any] = {}
+        for row in rows:
+            if row.kind == SNAPSHOT:
+                data = _decompress(row.payload)
+            else:
+                delta = _decompress(row.payload)
+                data.update(delta["set"])
+                for key in delta["unset"]:
+                    data.pop(key, None)
+        return data, rows[-1].created_at
+
+    def delete_project(self, session: Session, project_id: int):
+        session.execute(delete(ProjectVersion).where(ProjectVersion.project_id == project_id))
@@ -0,0 +1,91 @@
+"""
+有界渲染线程池
+
+DocxTemplate 渲染和 PDF 转换都是阻塞操作，直接在 async 接口里调用会卡住整个事件循环。
+这里把它们放到固定大小的线程池里执行，并限制排队深度：
+正在执行 + 排队中的任务数达到上限时直接拒绝，由接口返回 503 + Retry-After。
+批量生成、档案导出等同步流程用 submit(wait=True)：池满时等待空位而不是被拒绝，
+同样计入并发和排队深度，不会绕过上限。
+
+使用线程而不是进程：转换池（LibreOffice 实例）和模板注册表都是进程内共享状态，
+PDF 转换大部分时间在等待 LibreOffice，lxml 解析也会释放 GIL。
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# 同时执行的渲染/转换任务数
+RENDER_CONCURRENCY = int(os.environ.get("RENDER_CONCURRENCY", "2"))
+# 允许排队等待的任务数，超过则返回 503
+RENDER_QUEUE_DEPTH = int(os.environ.get("RENDER_QUEUE_DEPTH", "8"))
+# 503 响应中建议客户端重试的秒数
+RENDER_RETRY_AFTER = int(os.environ.get("RENDER_RETRY_AFTER", "2"))
+
+
+class PoolSaturated(Exception):
+    """线程池已满，任务被拒绝"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Server is busy, please retry later")
+        self.retry_after = retry_after
+
+
+class RenderPool:
+    def __init__(
+        self,
+        max_workers: int = RENDER_CONCURRENCY,
+        max_queue: int = RENDER_QUEUE_DEPTH,
+        retry_after: int = RENDER_RETRY_AFTER,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+            self._slot_freed.notify()
+
+    def submit(self, fn: Callable[..., Any], *args, wait: bool = False, timeout: Optional[float] = None,
+               **kwargs) -> Future:
+        """
+        在线程池中执行 fn，返回 Future。
+        池满时：wait=False 抛出 PoolSaturated；wait=True 等待空位（最多 timeout 秒，超时仍抛出 PoolSaturated）
+        """
+        with self._lock:
+            limit = self.max_workers + self.max_queue
+            if self._pending >= limit and wait:
+                self._slot_freed.wait_for(lambda: self._pending < limit, timeout)
+            if self._pending >= limit:
+                self._rejected += 1
+                raise PoolSaturated(self.retry_after)
+            self._pending += 1
+        # 计数在任务真正结束时才释放（客户端断开不会让线程提前空出来）
+        future = self.executor.submit(functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在线程池中执行 fn，池满时抛出 PoolSaturated"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
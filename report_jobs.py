@@ -0,0 +1,244 @@
+"""
+异步报告任务
+
+POST 创建任务后立即返回任务 ID，渲染和转换在后台进行：任务线程只负责调度和更新状态，
+实际渲染交给服务端共用的渲染池（见 server.run_report_job），不会绕过渲染并发上限。
+任务状态持久化在 SQLite 的 reportjob 表里，客户端可以轮询状态接口或通过 SSE 订阅进度，
+完成后再下载产物。
+
+产物复制到单独的结果目录（不放在会被淘汰的预览缓存里），保留 JOB_RESULT_TTL；
+后台定期清理：结束超过 JOB_RESULT_TTL 的任务连同产物一起删除，没有对应任务的产物文件也删除。
+
+多个进程共用数据库时，任务行记录执行它的进程和心跳（见 task_lease.py），
+只有持有者已经退出的未完成任务才标记为中断，不会误伤其他进程正在执行的任务。
+"""
+
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import delete
+from sqlmodel import Field, Session, SQLModel, select
+
+from task_lease import TaskLease
+
+# 后台同时调度的任务数（实际渲染的并发受渲染池限制）
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# 已结束的任务及其产物的保留时间（秒）
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", str(24 * 3600)))
+# 后台清理间隔（秒）
+JOB_SWEEP_INTERVAL = int(os.environ.get("JOB_SWEEP_INTERVAL", "600"))
+# 没有对应任务的产物文件至少保留的时间（秒），防止删掉刚写入、任务状态还没更新的文件
+JOB_ORPHAN_MIN_AGE = 60
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+JOB_ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+
+class ReportJob(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
+    project_id: Optional[int] = Field(default=None, foreign_key="project.id")
+    kind: str = "docx" # docx 或 pdf
+    template: str = ""
+    status: str = JOB_QUEUED
+    progress: int = 0 # 0-100
+    message: str = ""
+    data_json: str = "{}"
+    result_path: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+    # 执行任务的进程和心跳时间，见 task_lease.py
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+
+
+class JobCancelled(Exception):
+    """任务在执行过程中被取消"""
+
+
+def job_to_dict(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "project_id": job.project_id,
+        "kind": job.kind,
+        "template": job.template,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+def store_result(src: str, dest: str):
+    """把产物放到结果目录：先硬链接（同一文件系统上不复制），不行再复制，写完再改名"""
+    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+
+class JobRunner:
+    """
+    后台执行报告任务。
+    pipeline(job, progress, dest) 负责真正的渲染，把产物写到 dest（可以用 store_result）；
+    progress(percent, message) 会更新数据库，并在任务已被取消时抛出 JobCancelled。
+    """
+
+    def __init__(
+        self,
+        engine,
+        pipeline: Callable,
+        result_dir: str,
+        max_workers: int = JOB_WORKERS,
+        ttl: int = JOB_RESULT_TTL,
+        sweep_interval: int = JOB_SWEEP_INTERVAL,
+    ):
+        self.engine = engine
+        self.pipeline = pipeline
+        self.result_dir = result_dir
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.lease = TaskLease(engine, ReportJob, ReportJob.id, JOB_ACTIVE_STATES, name="报告任务")
+        os.makedirs(result_dir, exist_ok=True)
+
+    def _fail_orphans(self):
+        """把持有者已经退出的未完成任务标记为失败（其他进程正在执行的任务不动）"""
+        self.lease.claim_stale(
+            status=JOB_FAILED, message="生成失败", error="服务重启，任务中断", data_json="{}",
+            updated_at=datetime.now(),
+        )
+
+    def recover(self):
+        """服务启动时处理中断的任务，之后随心跳定期检查"""
+        self._fail_orphans()
+        self.lease.start(self._fail_orphans)
+
+    def submit(self, job_id: str):
+        """job 创建时应带上 self.lease.stamp() 的归属字段"""
+        self.lease.hold(job_id)
+        self.executor.submit(self._run, job_id)
+
+    def start(self):
+        """启动时先清理一次，然后在后台定期清理"""
+        self.sweep()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="job-sweeper", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        self.lease.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def result_path(self, job: ReportJob) -> str:
+        return os.path.join(self.result_dir, f"{job.id}.{job.kind}")
+
+    def _discard(self, path: Optional[str]):
+        # 只删结果目录里的文件（旧版本的任务产物指向预览缓存，由缓存自己管理）
+        if not path or os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.result_dir):
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def sweep(self) -> Dict[str, int]:
+        """删除结束超过 TTL 的任务及其产物，以及没有对应任务的产物文件"""
+        cutoff = datetime.now() - timedelta(seconds=self.ttl)
+        with Session(self.engine) as session:
+            expired = session.exec(
+                select(ReportJob.id, ReportJob.result_path).where(
+                    ReportJob.status.in_(JOB_FINISHED_STATES), ReportJob.updated_at < cutoff,
+                )
+            ).all()
+            if expired:
+                session.execute(delete(ReportJob).where(ReportJob.id.in_([job_id for job_id, _ in expired])))
+                session.commit()
+            kept = set(session.exec(select(ReportJob.id)).all())
+        for _, path in expired:
+            self._discard(path)
+
+        orphans = 0
+        now = datetime.now().timestamp()
+        for entry in os.scandir(self.result_dir):
+            job_id = entry.name.split(".", 1)[0]
+            if job_id in kept or not entry.is_file(follow_symlinks=False):
+                continue
+            if now - entry.stat().st_mtime > JOB_ORPHAN_MIN_AGE:
+                self._discard(entry.path)
+                orphans += 1
+        return {"removed_jobs": len(expired), "removed_orphans": orphans}
+
+    def _loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Job sweep error: {e}")
+
+    def _update(self, job_id: str, **fields) -> ReportJob:
+        with Session(self.engine) as session:
+            job = session.get(ReportJob, job_id)
+            if job.status == JOB_CANCELLED:
+                raise JobCancelled()
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.updated_at = datetime.now()
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job
+
+    def _run(self, job_id: str):
+        job = None
+        try:
+            job = self._update(job_id, status=JOB_RUNNING, progress=5, message="开始生成")
+
+            def progress(percent: int, message: str = ""):
+                self._update(job_id, progress=percent, message=message)
+
+            result_path = self.result_path(job)
+            self.pipeline(job, progress, result_path)
+            # 结束后不再需要任务数据
+            self._update(job_id, status=JOB_SUCCEEDED, progress=100, message="已完成", result_path=result_path,
+                         data_json="{}")
+        except JobCancelled:
+            if job is not None:
+                self._discard(self.result_path(job))
+        except Exception as e:
+            print(f"Job Error ({job_id}): {e}")
+            try:
+                self._update(job_id, status=JOB_FAILED, message="生成失败", error=str(e), data_json="{}")
+            except JobCancelled:
+                pass
+        finally:
+            self.lease.drop(job_id)
+
+    def cancel(self, session: Session, job: ReportJob) -> ReportJob:
+        """取消任务。排队中的任务不会再执行；执行中的任务在下一个阶段开始前停止"""
+        if job.status not in JOB_FINISHED_STATES:
+            job.status = JOB_CANCELLED
+            job.message = "已取消"
+            job.data_json = "{}"
+            job.updated_at = datetime.now()
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+        return job
@@ -0,0 +1,140 @@
+"""
+临时文件目录 (tmp_reports) 的生命周期管理
+
+渲染和转换过程中的中间文件都放在这里，以前从不删除，目录会无限增长。
+ScratchStore 负责：
+- 分配唯一的临时文件路径
+- 用完即删（discard）
+- 后台定期清理：超过 TTL 的文件，以及总大小超过上限时从最旧的开始删除
+刚创建不久的文件（SCRATCH_MIN_AGE 以内）不会被清理，避免删掉正在使用的文件。
+耗时较长、要陆续使用一批文件的任务（如 OCR 栅格化）用 job_dir 分配单独的子目录，
+按大小清理时不动它，只在任务异常退出、子目录超过 TTL 后才删除。
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+# 临时目录总大小上限
+SCRATCH_MAX_BYTES = int(os.environ.get("SCRATCH_MAX_BYTES", str(256 * 1024 * 1024)))
+# 文件最长保留时间（秒）
+SCRATCH_TTL = int(os.environ.get("SCRATCH_TTL", "3600"))
+# 文件至少保留时间（秒），防止清理正在使用的文件
+SCRATCH_MIN_AGE = int(os.environ.get("SCRATCH_MIN_AGE", "60"))
+# 任务子目录的名称前缀
+JOB_DIR_PREFIX = "job_"
+# 后台清理间隔（秒）
+SCRATCH_SWEEP_INTERVAL = int(os.environ.get("SCRATCH_SWEEP_INTERVAL", "300"))
+
+
+class ScratchStore:
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int = SCRATCH_MAX_BYTES,
+        ttl: int = SCRATCH_TTL,
+        min_age: int = SCRATCH_MIN_AGE,
+        sweep_interval: int = SCRATCH_SWEEP_INTERVAL,
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_age = min_age
+        self.sweep_interval = sweep_interval
+        self.swept_files = 0
+        self.swept_bytes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, prefix: str, ext: str) -> str:
+        """分配一个新的临时文件路径"""
+        return os.path.join(self.root, f"{prefix}_{uuid.uuid4()}{ext}")
+
+    def job_dir(self, prefix: str) -> str:
+        """为一个任务分配子目录，任务结束后用 discard_dir 删除"""
+        path = os.path.join(self.root, f"{JOB_DIR_PREFIX}{prefix}_{uuid.uuid4()}")
+        os.makedirs(path)
+        return path
+
+    def discard_dir(self, path: Optional[str]):
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def discard(self, path: Optional[str]):
+        """删除一次性的临时文件（不存在也不报错）"""
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def sweep(self) -> Dict[str, int]:
+        """清理过期文件，并把目录总大小控制在上限以内"""
+        with self._lock:
+            now = time.time()
+            files = []
+            # 只处理顶层的普通文件，LibreOffice 的配置目录等子目录不动；
+            # 任务子目录只在超过 TTL（任务异常退出后遗留）时删除
+            for entry in os.scandir(self.root):
+                if entry.is_file(follow_symlinks=False):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+                elif entry.name.startswith(JOB_DIR_PREFIX) and entry.is_dir(follow_symlinks=False):
+                    if now - entry.stat().st_mtime > self.ttl:
+                        self.discard_dir(entry.path)
+            files.sort()
+
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            removed_bytes = 0
+            for mtime, size, path in files:
+                age = now - mtime
+                if age < self.min_age:
+                    break
+                if age > self.ttl or total > self.max_bytes:
+                    self.discard(path)
+                    total -= size
+                    removed += 1
+                    removed_bytes += size
+            self.swept_files += removed
+            self.swept_bytes += removed_bytes
+            return {"removed": removed, "removed_bytes": removed_bytes, "total_bytes": total}
+
+    def _loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Scratch sweep error: {e}")
+
+    def start(self):
+        """启动时先清理一次，然后在后台定期清理"""
+        self.sweep()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="scratch-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        files = 0
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.is_file(follow_symlinks=False):
+                files += 1
+                total += entry.stat().st_size
+        return {
+            "files": files,
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "swept_files": self.swept_files,
+            "swept_bytes": self.swept_bytes,
+        }
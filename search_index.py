@@ -0,0 +1,258 @@
+"""
+全文搜索：项目名称/编号、项目数据中的文本字段、附件的逐页文本
+
+基于 SQLite FTS5。FTS5 自带的分词器不切分中文，这里先在 Python 里把文本切成二元组
+（"亮化灯具" -> "亮化 化灯 灯具"，英文和数字按单词、转小写），再交给 FTS5 的 unicode61 分词器按空格切分。
+查询词用同样的方式切分后作为短语匹配，相当于子串匹配：搜 "灯具品牌" 不会命中只含 "灯具" 和 "品牌" 的文档。
+单个汉字按前缀匹配二元组，但连续汉字的最后一个字不是任何二元组的开头（"安装路灯" 中的 "灯"），
+所以另有 tails 列存放每段连续汉字的最后一个字，单字查询同时匹配两列。
+
+每条可搜索的内容是 searchdoc 表中的一行（原文，用于生成摘要和高亮），
+search_fts 虚拟表以同一个 rowid 存放切分后的词。
+保存、上传、删除时只更新涉及的行：保存只重建变化的顶层字段，附件按文件重建。
+非 SQLite 数据库没有 FTS5，退化为 LIKE 查询。
+"""
+
+import html
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, text
+from sqlmodel import Field, Session, SQLModel, select
+
+# 各类内容的排序权重（bm25 分数乘以权重，越大越靠前）
+KIND_WEIGHTS = {"project": 3.0, "data": 1.5, "file": 1.0}
+# 摘要长度（字符）
+SNIPPET_CHARS = 120
+
+FTS_TABLE = "search_fts"
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[0-9A-Za-z]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+
+class SearchDoc(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: int = Field(foreign_key="project.id", index=True)
+    kind: str # project / data / file
+    # data 为顶层字段名，file 为 "文件ID:页码"（页码 0 为文件名），project 为 "name"
+    ref: str
+    file_id: Optional[int] = Field(default=None, index=True)
+    page: Optional[int] = None
+    title: str = ""
+    text: str = ""
+
+
+def tokenize(value: str) -> List[str]:
+    """中文切成相邻二元组，英文数字按单词（小写）"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(value):
+        run = match.group()
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def tails(value: str) -> List[str]:
+    """每段连续汉字（两个字以上）的最后一个字，供单字查询匹配"""
+    return [run[-1] for run in _TOKEN_RE.findall(value) if len(run) > 1 and _CJK_RE.match(run)]
+
+
+def build_match(query: str) -> Optional[str]:
+    """把用户输入转换为 FTS5 查询：空格分隔的每个词是一个短语，多个词之间为 AND"""
+    phrases = []
+    for word in query.split():
+        tokens = tokenize(word)
+        if not tokens:
+            continue
+        if len(tokens) == 1 and _CJK_RE.fullmatch(tokens[0]):
+            # 单个汉字：匹配以它开头的二元组，或 tails 列中以它结尾的一段汉字
+            phrases.append(f'"{tokens[0]}"*')
+        else:
+            phrases.append('"' + " ".join(tokens) + '"')
+    return " AND ".join(phrases) if phrases else None
+
+
+def _strings(value: Any) -> Iterable[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def highlight(content: str, terms: List[str], width: int = SNIPPET_CHARS) -> str:
+    """截取第一个命中附近的一段，转义 HTML 后用 <mark> 标出命中的词"""
+    lowered = content.lower()
+    positions = [p for p in (lowered.find(t.lower()) for t in terms) if p >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    snippet = content[start:start + width].replace("\n", " ")
+    escaped = html.escape(snippet)
+    if terms:
+        pattern = re.compile("|".join(re.escape(html.escape(t)) for t in sorted(terms, key=len, reverse=True)),
+                             re.IGNORECASE)
+        escaped = pattern.sub(lambda m: f"<mark>{m.group()}</mark>", escaped)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + width < len(content) else ""
+    return prefix + escaped + suffix
+
+
+class SearchIndex:
+    def __init__(self, engine):
+        self.engine = engine
+        self.fts = engine.dialect.name == "sqlite"
+
+    def create(self) -> bool:
+        """创建索引表；旧版本的表（没有 tails 列）会被重建，返回 True 表示需要重新建立索引"""
+        if not self.fts:
+            return False
+        with self.engine.begin() as conn:
+            columns = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({FTS_TABLE})").all()]
+            outdated = bool(columns) and "tails" not in columns
+            if outdated:
+                conn.exec_driver_sql(f"DROP TABLE {FTS_TABLE}")
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(tokens, tails, tokenize='unicode61')"
+            )
+        return outdated
+
+    def is_empty(self, session: Session) -> bool:
+        return session.exec(select(SearchDoc.id).limit(1)).first() is None
+
+    # --- 写入（在调用方的事务中，由调用方提交） ---
+    def _add(self, session: Session, docs: List[SearchDoc]):
+        docs = [doc for doc in docs if doc.text.strip()]
+        if not docs:
+            return
+        session.add_all(docs)
+        session.flush()
+        if self.fts:
+            session.execute(
+                text(f"INSERT INTO {FTS_TABLE} (rowid, tokens, tails) VALUES (:id, :tokens, :tails)"),
+                [{"id": doc.id, "tokens": " ".join(tokenize(doc.text)), "tails": " ".join(tails(doc.text))}
+                 for doc in docs],
+            )
+
+    def _remove(self, session: Session, *conditions):
+        ids = list(session.exec(select(SearchDoc.id).where(*conditions)).all())
+        if not ids:
+            return
+        if self.fts:
+            session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), [{"id": i} for i in ids])
+        session.execute(delete(SearchDoc).where(SearchDoc.id.in_(ids)))
+
+    def index_project(self, session: Session, project_id: int, name: str, code: str):
+        self._remove(session, SearchDoc.project_id == project_id, SearchDoc.kind == "project")
+        self._add(session, [SearchDoc(
+            project_id=project_id, kind="project", ref="name", title=name, text=f"{name} {code or ''}",
+        )])
+
+    def index_data(self, session: Session, project_id: int, changed: Dict[str, Any], removed: Iterable[str] = (),
+                   replace_all: bool = False):
+        """重建变化的顶层字段；replace_all 时先清除该项目的全部数据字段"""
+        if replace_all:
+            self._remove(session, SearchDoc.project_id == project_id, SearchDoc.kind == "data")
+        else:
+            keys = list(changed) + list(removed)
+            if not keys:
+                return
+            self._remove(session, SearchDoc.project_id == project_id, SearchDoc.kind == "data",
+                         SearchDoc.ref.in_(keys))
+        self._add(session, [
+            SearchDoc(project_id=project_id, kind="data", ref=key, title=key, text="\n".join(_strings(value)))
+            for key, value in changed.items()
+        ])
+
+    def index_file(self, session: Session, project_id: int, file_id: int, filename: str,
+                   pages: Iterable[Tuple[int, str]] = ()):
+        """文件名（页码 0）和逐页文本"""
+        self.delete_file(session, file_id)
+        docs = [SearchDoc(project_id=project_id, kind="file", ref=f"{file_id}:0", file_id=file_id, page=0,
+                          title=filename, text=filename)]
+        docs.extend(
+            SearchDoc(project_id=project_id, kind="file", ref=f"{file_id}:{page}", file_id=file_id, page=page,
+                      title=filename, text=page_text)
+            for page, page_text in pages
+        )
+        self._add(session, docs)
+
+    def delete_file(self, session: Session, file_id: int):
+        self._remove(session, SearchDoc.file_id == file_id)
+
+    def delete_project(self, session: Session, project_id: int):
+        self._remove(session, SearchDoc.project_id == project_id)
+
+    def clear(self, session: Session):
+        if self.fts:
+            session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        session.execute(delete(SearchDoc))
+
+    # --- 查询 ---
+    def search(self, session: Session, query: str, project_id: Optional[int] = None, kind: Optional[str] = None,
+               offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        terms = query.split()
+        filters = []
+        params: Dict[str, Any] = {"limit": limit, "offset": offset}
+        if project_id is not None:
+            filters.append("d.project_id = :project_id")
+            params["project_id"] = project_id
+        if kind:
+            filters.append("d.kind = :kind")
+            params["kind"] = kind
+
+        if self.fts:
+            match = build_match(query)
+            if match is None:
+                return {"total": 0, "items": []}
+            params["match"] = match
+            where = " AND ".join([f"{FTS_TABLE} MATCH :match"] + filters)
+            weight = "CASE d.kind " + " ".join(
+                f"WHEN '{k}' THEN {w}" for k, w in KIND_WEIGHTS.items()
+            ) + " ELSE 1.0 END"
+            base = f"FROM {FTS_TABLE} JOIN searchdoc d ON d.id = {FTS_TABLE}.rowid WHERE {where}"
+            # 没有过滤条件时计数不需要关联 searchdoc
+            count_from = base if filters else f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+            total = session.execute(text(f"SELECT count(*) {count_from}"), params).scalar()
+            rows = session.execute(text(
+                f"SELECT d.id, d.project_id, d.kind, d.ref, d.file_id, d.page, d.title, d.text, "
+                f"bm25({FTS_TABLE}) * {weight} AS score {base} ORDER BY score LIMIT :limit OFFSET :offset"
+            ), params).all()
+        else:
+            conditions = [SearchDoc.text.ilike(f"%{term}%") for term in terms]
+            if not conditions:
+                return {"total": 0, "items": []}
+            if project_id is not None:
+                conditions.append(SearchDoc.project_id == project_id)
+            if kind:
+                conditions.append(SearchDoc.kind == kind)
+            total = session.exec(select(func.count()).select_from(SearchDoc).where(*conditions)).one()
+            rows = [
+                (d.id, d.project_id, d.kind, d.ref, d.file_id, d.page, d.title, d.text, 0.0)
+                for d in session.exec(
+                    select(SearchDoc).where(*conditions).order_by(SearchDoc.id).offset(offset).limit(limit)
+                ).all()
+            ]
+
+        items = [
+            {
+                "project_id": project_id_,
+                "kind": kind_,
+                "ref": ref,
+                "file_id": file_id,
+                "page": page,
+                "title": title,
+                "snippet": highlight(content, terms),
+                "score": round(-score, 4),
+            }
+            for _id, project_id_, kind_, ref, file_id, page, title, content, score in rows
+        ]
+        return {"total": total, "items": items}
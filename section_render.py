@@ -0,0 +1,368 @@
+"""
+增量预览：按硬分页把报告拆成若干段，只重新渲染输入有变化的段
+
+表单每次修改通常只改一个字段（如 quality_status、adjustments 的某一行），
+以前每次预览都要把整份报告重新渲染、重新交给 LibreOffice 转换。
+这里把模板正文在硬分页处（段落末尾的分页符、段前分页）切开，每段各是一个只含这部分正文的文档：
+- 每段用到的变量由 Jinja 语法树得出（页眉页脚用到的变量算作每段都用到）
+- 每段的 PDF 按 (模板内容哈希, 段号, 该段变量的取值) 缓存
+- 预览时只渲染、转换缓存中没有的段，再把各段 PDF 的页面按顺序拼成完整的预览
+每段都从新的一页开始，拼接结果与整份转换的分页一致，预览的耗时只取决于改动涉及的段。
+
+以下情况无法保证拼接结果一致，整份渲染：
+模板走 DocxTemplate 完整流程、正文有多个节、首页不同的页眉页脚、页码域（PAGE/NUMPAGES）。
+各段一个都没有缓存时（新数据或模板刚更新）也整份渲染，随后在后台补齐各段缓存，下次修改即可增量渲染。
+最终生成的报告始终整份渲染，分段只用于预览。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from jinja2 import Environment, TemplateSyntaxError, meta
+from lxml import etree
+
+from preview_cache import CacheLease, PreviewCache, normalize_data
+from scratch import ScratchStore
+from template_registry import CompiledTemplate
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# 各段 PDF 缓存的总大小上限
+SECTION_CACHE_MAX_BYTES = int(os.environ.get("SECTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# 是否启用增量预览
+SECTION_PREVIEW = os.environ.get("SECTION_PREVIEW", "1") not in ("0", "false", "no")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_PAGE_FIELD_RE = re.compile(r"\b(PAGE|NUMPAGES|SECTIONPAGES)\b")
+_FIELD_RE = re.compile(r'<w:instrText[^>]*>([^<]*)</w:instrText>|<w:fldSimple [^>]*w:instr="([^"]*)"')
+
+# pypdfium2 不是线程安全的，拼接 PDF 串行执行
+_pdfium_lock = threading.Lock()
+
+
+@dataclass
+class Section:
+    index: int
+    compiled: Any
+    variables: FrozenSet[str]
+
+
+def _ends_with_page_break(elem) -> bool:
+    """段落的最后一项内容是分页符（之后没有文字或图片）"""
+    if elem.tag != _W + "p":
+        return False
+    seen_break = False
+    for node in elem.iter(_W + "br", _W + "t", _W + "drawing", _W + "pict", _W + "tab"):
+        if node.tag == _W + "br" and node.get(_W + "type") == "page":
+            seen_break = True
+        elif node.tag == _W + "t" and not (node.text or "").strip():
+            continue
+        elif seen_break:
+            return False
+    return seen_break
+
+
+def _page_breaks(elem) -> List[Any]:
+    return [br for br in elem.iter(_W + "br") if br.get(_W + "type") == "page"]
+
+
+def _starts_with_page_break(elem) -> bool:
+    """段落的第一项内容是分页符，效果等同于段前分页"""
+    if elem.tag != _W + "p":
+        return False
+    for node in elem.iter(_W + "br", _W + "t", _W + "drawing", _W + "pict", _W + "tab"):
+        if node.tag == _W + "br" and node.get(_W + "type") == "page":
+            return True
+        if node.tag == _W + "t" and not (node.text or "").strip():
+            continue
+        return False
+    return False
+
+
+def _starts_new_page(elem) -> bool:
+    if elem.tag != _W + "p":
+        return False
+    flag = elem.find(f"{_W}pPr/{_W}pageBreakBefore")
+    if flag is not None and flag.get(_W + "val") not in ("0", "false"):
+        return True
+    return _starts_with_page_break(elem) and len(_page_breaks(elem)) == 1
+
+
+def _copy(elem):
+    return etree.fromstring(etree.tostring(elem))
+
+
+def _strip_page_breaks(elem, leading: bool, trailing: bool):
+    """段首段尾的分页在单独的文档里会多出一个空白页，去掉（下一段本来就从新页开始）"""
+    if leading and _starts_new_page(elem):
+        flag = elem.find(f"{_W}pPr/{_W}pageBreakBefore")
+        if flag is not None:
+            flag.getparent().remove(flag)
+        if _starts_with_page_break(elem):
+            br = _page_breaks(elem)[0]
+            br.getparent().remove(br)
+    if trailing and _ends_with_page_break(elem):
+        br = _page_breaks(elem)[-1]
+        br.getparent().remove(br)
+
+
+class ReportSections:
+    """一个模板拆分出的各段；reason 不为空时表示该模板不能分段渲染"""
+
+    def __init__(self, tpl: CompiledTemplate):
+        self.template_name = tpl.name
+        self.digest = tpl.digest
+        self.sections: List[Section] = []
+        self.reason: Optional[str] = None
+        self._env = Environment()
+        try:
+            self._split(tpl)
+        except (etree.XMLSyntaxError, TemplateSyntaxError) as e:
+            self.reason = f"模板解析失败: {e}"
+        if self.reason:
+            self.sections = []
+            print(f"SectionRenderer: 模板 {tpl.name} 不分段渲染（{self.reason}）")
+        else:
+            print(f"SectionRenderer: 模板 {tpl.name} 拆分为 {len(self.sections)} 段")
+
+    @property
+    def supported(self) -> bool:
+        return self.reason is None and len(self.sections) > 1
+
+    def _variables(self, source: str) -> FrozenSet[str]:
+        return frozenset(meta.find_undeclared_variables(self._env.parse(source)))
+
+    def _split(self, tpl: CompiledTemplate):
+        if not tpl.fast_path:
+            self.reason = "模板使用完整渲染流程"
+            return
+        sources = [tpl.body_xml] + list(tpl.part_sources.values())
+        for source in sources:
+            for match in _FIELD_RE.finditer(source):
+                if _PAGE_FIELD_RE.search(match.group(1) or match.group(2) or ""):
+                    self.reason = "含页码域"
+                    return
+
+        body = etree.fromstring(tpl.body_xml)
+        if len(body.findall(f".//{_W}sectPr")) > 1:
+            self.reason = "正文有多个节"
+            return
+        children = list(body)
+        sect_pr = children.pop() if children and children[-1].tag == _W + "sectPr" else None
+        if sect_pr is not None and sect_pr.find(_W + "titlePg") is not None:
+            self.reason = "首页页眉页脚不同"
+            return
+
+        # 在硬分页处切开
+        groups: List[List[Any]] = [[]]
+        for child in children:
+            if _starts_new_page(child):
+                if groups[-1]:
+                    groups.append([])
+                groups[-1].append(child)
+            else:
+                groups[-1].append(child)
+                if _ends_with_page_break(child):
+                    groups.append([])
+        groups = [g for g in groups if g]
+
+        shared = frozenset()
+        for source in tpl.part_sources.values():
+            shared |= self._variables(tpl.patch_xml(source))
+
+        open_tag = tpl.body_xml[:tpl.body_xml.index(">") + 1]
+        sect_xml = etree.tostring(sect_pr, encoding="unicode") if sect_pr is not None else ""
+        # 正文开头的文本（如跨元素的 Jinja 标签）放在第一段
+        lead = body.text or ""
+        pending: List[Any] = []
+        for n, group in enumerate(groups):
+            pending.extend(group)
+            fragment = lead
+            for i, child in enumerate(pending):
+                child = _copy(child)
+                _strip_page_breaks(child, leading=i == 0, trailing=i == len(pending) - 1)
+                fragment += etree.tostring(child, encoding="unicode", with_tail=True)
+            source = tpl.patch_xml(fragment)
+            try:
+                variables = self._variables(source)
+            except TemplateSyntaxError:
+                # 循环、条件跨过了分页，与下一段合并
+                if n == len(groups) - 1:
+                    raise
+                continue
+            compiled = tpl.compile_body(open_tag + fragment + sect_xml + "</w:body>")
+            self.sections.append(Section(index=len(self.sections), compiled=compiled, variables=variables | shared))
+            pending = []
+            lead = ""
+
+    def key(self, section: Section, context: Dict[str, Any]) -> str:
+        h = hashlib.sha256()
+        h.update(self.template_name.encode("utf-8"))
+        h.update(self.digest.encode())
+        h.update(str(section.index).encode())
+        h.update(normalize_data({name: context.get(name) for name in sorted(section.variables)}).encode("utf-8"))
+        return h.hexdigest()
+
+
+def _release_result(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().release()
+
+
+def merge_pdfs(paths: List[str], out_path: str):
+    """按顺序拼接各段 PDF 的全部页面"""
+    if pdfium is None:
+        raise RuntimeError("pypdfium2 未安装，无法拼接 PDF")
+    with _pdfium_lock:
+        merged = pdfium.PdfDocument.new()
+        try:
+            for path in paths:
+                src = pdfium.PdfDocument(path)
+                try:
+                    merged.import_pages(src)
+                finally:
+                    src.close()
+            merged.save(out_path)
+        finally:
+            merged.close()
+
+
+class SectionRenderer:
+    def __init__(self, cache_dir: str, scratch: ScratchStore, converter, out_dir: str,
+                 max_bytes: int = SECTION_CACHE_MAX_BYTES, enabled: bool = SECTION_PREVIEW):
+        self.cache = PreviewCache(cache_dir, max_bytes)
+        self.scratch = scratch
+        self.converter = converter
+        self.out_dir = out_dir
+        self.enabled = enabled and pdfium is not None
+        # 转换器有多个常驻实例时各段并行转换；逐次启动 soffice 时共用配置目录，只能串行
+        workers = len(getattr(converter, "workers", None) or [None])
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="section")
+        # 后台补齐缓存只用一个线程，同一组段只排队一次
+        self._warmer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="section-warm")
+        self._warming = set()
+        self._templates: Dict[Tuple[str, str], ReportSections] = {}
+        self._lock = threading.Lock()
+        self.incremental = 0
+        self.full = 0
+        self.sections_rendered = 0
+        self.sections_reused = 0
+
+    def sections(self, tpl: CompiledTemplate) -> ReportSections:
+        with self._lock:
+            sections = self._templates.get((tpl.name, tpl.digest))
+        if sections is None:
+            sections = ReportSections(tpl)
+            with self._lock:
+                # 模板更新后旧版本的拆分结果不再需要
+                for key in [k for k in self._templates if k[0] == tpl.name]:
+                    del self._templates[key]
+                self._templates[(tpl.name, tpl.digest)] = sections
+        return sections
+
+    def _render_section(self, tpl: CompiledTemplate, section: Section, context: Dict[str, Any],
+                        key: str) -> CacheLease:
+        docx_path = self.scratch.path(f"section{section.index}", ".docx")
+        try:
+            tpl.render_to(context, docx_path, body=section.compiled)
+            pdf_path = self.converter.convert(docx_path, self.out_dir)
+        finally:
+            self.scratch.discard(docx_path)
+        return self.cache.put_lease(key, pdf_path, tpl.name)
+
+    def render(self, tpl: CompiledTemplate, context: Dict[str, Any]) -> Optional[str]:
+        """
+        增量渲染 PDF 预览，返回拼接好的临时文件路径。
+        context 为已经 prepare_report_data 处理过的数据。
+        返回 None 表示应整份渲染（不支持分段，或各段都没有缓存）。
+        """
+        if not self.enabled:
+            return None
+        sections = self.sections(tpl)
+        if not sections.supported:
+            return None
+        keys = [sections.key(section, context) for section in sections.sections]
+        # 拼接完成前各段都处于租用状态，不会被并发的渲染淘汰
+        leases = [self.cache.lease(key) for key in keys]
+        missing = [i for i, lease in enumerate(leases) if lease is None]
+        if len(missing) == len(keys):
+            # 冷启动：整份转换一次比逐段转换快，各段缓存在后台补齐
+            self._warm(tpl, sections, context, keys)
+            with self._lock:
+                self.full += 1
+            return None
+
+        futures = {}
+        try:
+            futures = {
+                i: self._threads.submit(self._render_section, tpl, sections.sections[i], context, keys[i])
+                for i in missing
+            }
+            for i, future in futures.items():
+                leases[i] = future.result()
+            out_path = self.scratch.path("preview", ".pdf")
+            merge_pdfs([lease.path for lease in leases], out_path)
+        finally:
+            for lease in leases:
+                if lease is not None:
+                    lease.release()
+            for future in futures.values():
+                # 前面的段失败时，其余段渲染完也要释放
+                future.add_done_callback(_release_result)
+        with self._lock:
+            self.incremental += 1
+            self.sections_rendered += len(missing)
+            self.sections_reused += len(keys) - len(missing)
+        return out_path
+
+    def _warm(self, tpl: CompiledTemplate, sections: ReportSections, context: Dict[str, Any], keys: List[str]):
+        warm_key = tuple(keys)
+        with self._lock:
+            if warm_key in self._warming:
+                return
+            self._warming.add(warm_key)
+        # 请求结束后 context 可能被改动，复制一份
+        context = json.loads(json.dumps(context, ensure_ascii=False, default=str))
+
+        def run():
+            try:
+                for section, key in zip(sections.sections, keys):
+                    if self.cache.get(key) is None:
+                        self._render_section(tpl, section, context, key).release()
+            except Exception as e:
+                print(f"SectionRenderer warm error: {e}")
+            finally:
+                with self._lock:
+                    self._warming.discard(warm_key)
+
+        self._warmer.submit(run)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            templates = {
+                name: {"sections": len(s.sections), "reason": s.reason}
+                for (name, _), s in self._templates.items()
+            }
+            return {
+                "enabled": self.enabled,
+                "incremental_renders": self.incremental,
+                "full_renders": self.full,
+                "sections_rendered": self.sections_rendered,
+                "sections_reused": self.sections_reused,
+                "warming": len(self._warming),
+                "templates": templates,
+                "cache": self.cache.stats(),
+            }
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        self._warmer.shutdown(wait=False, cancel_futures=True)
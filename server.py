@@ -1,23 +1,78 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from urllib.parse import quote
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import Field, Session, SQLModel, create_engine, select, Relationship
-from docxtpl import DocxTemplate
-from typing import List, Optional, Dict, Any
+from starlette.background import BackgroundTask
+from sqlmodel import Field, Session, SQLModel, select, Relationship
+from sqlalchemy import inspect as sa_inspect, func, or_, and_, delete, update, literal
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
 from datetime import datetime
 import os
-import uuid
 import json
-import shutil
-import subprocess
+import hashlib
+import io
+import asyncio
+import base64
+import threading
+import time
+import zipfile
+import zlib
+
+from converter import create_converter
+from database import create_db_engine, database_stats, ping
+from preview_cache import CacheLease, PreviewCache
+from template_registry import TemplateRegistry
+from render_pool import RenderPool, PoolSaturated
+from scratch import ScratchStore
+from blob_store import BlobStore, UploadTooLarge, UPLOAD_MAX_BYTES, receive_multipart_upload
+from file_serving import serve_file, etag_matches
+from json_patch import patch_document, PatchError, PatchTestFailed, JSON_PATCH, MERGE_PATCH
+from project_history import ProjectHistory, VersionNotFound, diff_documents, version_diff
+from chunked_upload import ChunkedUploads, UploadSession, ChunkError, session_status
+from batch_report import BatchItem, iter_batch_zip
+from project_archive import (ArchiveError, ArchiveFile, ARCHIVE_MAX_BYTES, copy_entry, iter_project_archive,
+                             plan_import)
+from report_jobs import ReportJob, JobRunner, job_to_dict, store_result, JOB_SUCCEEDED, JOB_FINISHED_STATES
+from text_extraction import TextExtractor, TextExtraction, PageText, EXTRACT_PENDING, EXTRACT_RUNNING, detect_kind
+from ocr import OcrRunner, OcrJob, OCR_PENDING, OCR_RUNNING
+from field_extractor import suggest_fields
+from search_index import SearchIndex
+from section_render import SectionRenderer
+from chinese_amount import amount_to_chinese, amounts_to_chinese, WAN
+from template_schema import template_schema
+from page_images import PageImages, PageImageError, PAGE_IMAGE_FORMATS, PAGE_IMAGE_WIDTHS
 
 # --- 配置 ---
 # 自动获取当前文件所在目录（兼容本地和Docker环境）
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, "database.db")
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
-TMP_DIR = os.path.join(BASE_DIR, "tmp_reports")
+# 数据库、上传文件、缓存等运行时数据的根目录（基准测试等指向临时目录，不写入代码目录）
+DATA_DIR = os.environ.get("DATA_DIR") or BASE_DIR
+DB_FILE = os.path.join(DATA_DIR, "database.db")
+UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
+# 按内容哈希存放的上传文件
+BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
+# 断点续传中的未完成文件
+PARTIAL_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "partial")
+TMP_DIR = os.path.join(DATA_DIR, "tmp_reports")
 TEMPLATE_PATH = os.path.join(BASE_DIR, "report_template.docx")
+CACHE_DIR = os.path.join(DATA_DIR, "preview_cache")
+PAGE_IMAGE_DIR = os.path.join(DATA_DIR, "page_images")
+# 异步报告任务的产物（按任务保留，不随预览缓存淘汰）
+JOB_RESULT_DIR = os.path.join(DATA_DIR, "job_results")
+# 额外的报告模板目录：每个 .docx 以文件名注册为一种报告类型
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+DEFAULT_TEMPLATE = "结算审核"
+# 项目列表分页大小
+PROJECT_PAGE_SIZE = int(os.environ.get("PROJECT_PAGE_SIZE", "20"))
+PROJECT_PAGE_MAX = 100
+# 解析后的项目数据缓存条数
+PROJECT_DATA_CACHE_SIZE = int(os.environ.get("PROJECT_DATA_CACHE_SIZE", "256"))
+# 整份保存被并发的保存抢先时的重试次数
+SAVE_RETRIES = 5
 
 # 确保目录存在
 for d in [UPLOAD_DIR, TMP_DIR]:
@@ -28,11 +83,13 @@ for d in [UPLOAD_DIR, TMP_DIR]:
 class Project(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    code: str = "" # 项目编号
-    created_at: datetime = Field(default_factory=datetime.now)
-    updated_at: datetime = Field(default_factory=datetime.now)
+    code: str = Field(default="", index=True) # 项目编号
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    updated_at: datetime = Field(default_factory=datetime.now, index=True)
     # 存储表单数据的 JSON 字符串
     data_json: str = "{}" 
+    # 数据版本号，每次保存加一，用于增量保存的乐观并发控制
+    version: int = 0
     
     # 关联文件
     files: List["ProjectFile"] = Relationship(back_populates="project")
@@ -44,6 +101,9 @@ class ProjectFile(SQLModel, table=True):
     filepath: str
     file_type: str = "other" # contract, settlement, etc.
     category: str = "其他" # 文件夹分类
+    size: int = 0
+    # 指向内容寻址存储中的文件（旧数据为空，仍按 filepath 存取）
+    blob_sha256: Optional[str] = Field(default=None, foreign_key="fileblob.sha256", index=True)
     uploaded_at: datetime = Field(default_factory=datetime.now)
 
     project: Optional[Project] = Relationship(back_populates="files")
@@ -73,17 +133,145 @@ FILE_CATEGORIES = [
     "其他"
 ]
 
-# 数据库连接
-sqlite_url = f"sqlite:///{DB_FILE}"
-engine = create_engine(sqlite_url)
+# 临时文件目录管理（大小上限 + TTL + 后台清理）
+scratch = ScratchStore(TMP_DIR)
+
+# PDF 转换器（常驻 LibreOffice 实例池）
+converter = create_converter()
+
+# 预览/生成结果缓存（按数据 + 模板内容寻址）
+preview_cache = PreviewCache(CACHE_DIR)
+
+# 增量预览：报告按分页拆段，只重新转换数据有变化的段
+section_renderer = SectionRenderer(os.path.join(CACHE_DIR, "sections"), scratch, converter, TMP_DIR)
+
+# 预览和附件的逐页图片（按 PDF 内容哈希缓存，进程池渲染）
+page_images = PageImages(PAGE_IMAGE_DIR)
+
+# 报告模板注册表（模板只解析一次，文件变化时自动重新加载）
+template_registry = TemplateRegistry()
+template_registry.register(DEFAULT_TEMPLATE, TEMPLATE_PATH)
+template_registry.register_dir(TEMPLATES_DIR)
+
+# 渲染/转换线程池（有界，满时返回 503）
+render_pool = RenderPool()
+
+# 项目数据版本历史（增量 + 定期快照）
+project_history = ProjectHistory()
+
+# 数据库连接（默认 SQLite，设置 DATABASE_URL 可切换到服务端数据库）
+DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DB_FILE}")
+engine = create_db_engine(DATABASE_URL)
+
+# 全文搜索索引
+search_index = SearchIndex(engine)
+
+def column_ddl(column) -> str:
+    """按模型中的列定义和当前数据库的方言生成 ADD COLUMN 的列定义（类型、默认值、非空、外键）"""
+    dialect = engine.dialect
+    quote = dialect.identifier_preparer.quote
+    ddl = f"{quote(column.name)} {column.type.compile(dialect=dialect)}"
+    if column.default is not None and column.default.is_scalar:
+        # 已有的行用模型的默认值填充；非空的新列必须有默认值
+        default = literal(column.default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True},
+        )
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    for fk in column.foreign_keys:
+        ddl += f" REFERENCES {quote(fk.column.table.name)} ({quote(fk.column.name)})"
+    return ddl
+
+def ensure_columns(model, *names: str):
+    """create_all 不会给已存在的表加列，这里为旧数据库补上模型中新增的列"""
+    table = model.__table__
+    existing = {c["name"] for c in sa_inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for name in names:
+            if name not in existing:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {engine.dialect.identifier_preparer.format_table(table)} "
+                    f"ADD COLUMN {column_ddl(table.c[name])}"
+                )
+
+def ensure_indexes(*models):
+    """create_all 不会给已存在的表建索引，这里为旧数据库补上模型中声明的索引"""
+    with engine.begin() as conn:
+        for model in models:
+            for index in model.__table__.indexes:
+                index.create(conn, checkfirst=True)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    ensure_columns(ProjectFile, "category", "size", "blob_sha256")
+    ensure_columns(Project, "version")
+    ensure_columns(UploadSession, "completing")
+    for model in (ReportJob, TextExtraction, OcrJob):
+        ensure_columns(model, "owner", "heartbeat_at")
+    ensure_indexes(Project, ProjectFile)
+    outdated = search_index.create()
+    with Session(engine) as session:
+        needs_rebuild = (outdated or search_index.is_empty(session)) and \
+            session.exec(select(Project.id).limit(1)).first() is not None
+    if needs_rebuild:
+        # 升级前的数据还没有索引，或索引表结构已变化
+        rebuild_search_index()
+    job_runner.recover()
+    text_extractor.recover()
+    ocr_runner.recover()
 
 def get_session():
     with Session(engine) as session:
         yield session
 
+# 上传文件存储（内容寻址 + 引用计数）
+blob_store = BlobStore(BLOB_DIR, engine)
+chunked_uploads = ChunkedUploads(PARTIAL_UPLOAD_DIR, engine)
+# 上传文件的逐页文本（后台进程池提取，按内容哈希缓存）
+text_extractor = TextExtractor(engine, blob_store)
+# 扫描页 OCR，文本提取完成后自动排队
+ocr_runner = OcrRunner(engine, blob_store, scratch)
+text_extractor.listeners.append(ocr_runner.submit)
+
+def index_blob_files(sha256: str):
+    """文本提取或 OCR 完成后，重建引用这份内容的所有文件的搜索索引"""
+    with Session(engine) as session:
+        files = session.exec(select(ProjectFile).where(ProjectFile.blob_sha256 == sha256)).all()
+        if not files:
+            return
+        pages = [(p.page, p.text) for p in text_extractor.pages(session, sha256)]
+        for f in files:
+            search_index.index_file(session, f.project_id, f.id, f.filename, pages)
+        session.commit()
+
+def rebuild_search_index() -> int:
+    """重建整个索引，返回项目数"""
+    with Session(engine) as session:
+        search_index.clear(session)
+        projects = session.exec(select(Project)).all()
+        for project in projects:
+            search_index.index_project(session, project.id, project.name, project.code)
+            search_index.index_data(session, project.id, load_project_data(project), replace_all=True)
+        files = session.exec(select(ProjectFile)).all()
+        pages_by_blob: Dict[str, List[Tuple[int, str]]] = {}
+        for f in files:
+            if f.blob_sha256 and f.blob_sha256 not in pages_by_blob:
+                pages_by_blob[f.blob_sha256] = [(p.page, p.text) for p in text_extractor.pages(session, f.blob_sha256)]
+            search_index.index_file(session, f.project_id, f.id, f.filename, pages_by_blob.get(f.blob_sha256, []))
+        session.commit()
+    print(f"Search index rebuilt: {len(projects)} projects, {len(files)} files")
+    return len(projects)
+
+text_extractor.listeners.append(index_blob_files)
+ocr_runner.listeners.append(index_blob_files)
+
+def forget_blob_text(sha256s: List[str]):
+    """内容寻址的文件被删除后清除其提取文本和识别记录"""
+    text_extractor.forget(sha256s)
+    ocr_runner.forget(sha256s)
+    page_images.forget(sha256s)
+
 # --- FastAPI App ---
 app = FastAPI()
 
@@ -93,11 +281,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 浏览器端需要读取的分段下载和预览缓存相关响应头
+    expose_headers=["ETag", "Content-Range", "Accept-Ranges", "Content-Location", "X-Preview-Key"],
 )
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    scratch.start()
+    job_runner.start()
+    chunked_uploads.start()
+    converter.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    job_runner.shutdown()
+    text_extractor.shutdown()
+    ocr_runner.shutdown()
+    page_images.shutdown()
+    section_renderer.shutdown()
+    render_pool.shutdown()
+    converter.shutdown()
+    chunked_uploads.stop()
+    scratch.stop()
 
 # --- Pydantic Models for API (请求/响应) ---
 class ProjectCreate(SQLModel):
@@ -111,107 +317,104 @@ class ProjectRead(SQLModel):
     created_at: datetime
     updated_at: datetime
 
+class ProjectPage(SQLModel):
+    items: List[ProjectRead]
+    total: int
+    next_cursor: Optional[str] = None # 为空表示没有下一页
+
+class ProjectFileRead(SQLModel):
+    id: int
+    project_id: int
+    filename: str
+    filepath: str
+    file_type: str
+    category: str
+    size: int
+    blob_sha256: Optional[str] = None
+    uploaded_at: datetime
+    # 文本提取状态：pending/running/done/failed/unsupported，旧数据没有内容哈希时为空
+    extraction_status: Optional[str] = None
+    # 扫描页识别状态：pending/running/done/partial/failed，没有扫描页时为空
+    ocr_status: Optional[str] = None
+
 class ProjectDetail(ProjectRead):
+    version: int
     data: Dict[str, Any] # 解析后的 JSON 对象
-    files: List[ProjectFile]
+    files: List[ProjectFileRead]
 
 class SaveDataRequest(SQLModel):
     data: Dict[str, Any]
+    template: Optional[str] = None # 报告模板名称，默认为结算审核
 
-# --- 辅助函数 ---
-def amount_to_chinese(amount: float) -> str:
-    """
-    将金额转换为中文大写
-    例如：14800000.00 -> 壹仟肆佰捌拾万元整
-    """
-    if amount == 0:
-        return "零元整"
+class BatchGenerateRequest(SQLModel):
+    project_ids: Optional[List[int]] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+    kind: str = "docx" # docx 或 pdf
+    template: Optional[str] = None
 
-    # 中文数字
-    chinese_numbers = ["零", "壹", "贰", "叁", "肆", "伍", "陆", "柒", "捌", "玖"]
-    # 单位
-    units = ["", "拾", "佰", "仟"]
-    big_units = ["", "万", "亿", "兆"]
+class ChunkedUploadCreate(SQLModel):
+    filename: str
+    size: int
+    category: str = "其他"
+    chunk_size: Optional[int] = None
 
-    # 转换为分（避免浮点数精度问题）
-    amount_fen = int(round(amount * 100))
+class JobCreate(SQLModel):
+    kind: str = "docx" # docx 或 pdf
+    data: Optional[Dict[str, Any]] = None # 不传则使用项目已保存的数据
+    project_id: Optional[int] = None
+    template: Optional[str] = None
 
-    # 分离元和角分
-    yuan = amount_fen // 100
-    jiao = (amount_fen % 100) // 10
-    fen = amount_fen % 10
+# --- 辅助函数 ---
+def get_report_template(name: Optional[str]):
+    """按名称获取已编译的报告模板，名称未知时返回 404"""
+    name = name or DEFAULT_TEMPLATE
+    if name not in template_registry:
+        raise HTTPException(status_code=404, detail=f"Template not found: {name}")
+    try:
+        return template_registry.get(name)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    if yuan == 0:
-        result = "零"
-    else:
-        # 将元部分转换为字符串，方便按位处理
-        yuan_str = str(yuan)
-        length = len(yuan_str)
-        result = ""
-
-        # 从高位到低位处理
-        for i, digit in enumerate(yuan_str):
-            digit_int = int(digit)
-            # 当前位的权重（从右往左数）
-            pos = length - i - 1
-
-            if digit_int != 0:
-                result += chinese_numbers[digit_int]
-                result += units[pos % 4]
-            else:
-                # 避免连续的零
-                if result and result[-1] != "零":
-                    result += "零"
-
-            # 添加大单位（万、亿）
-            if pos % 4 == 0 and pos > 0:
-                unit_index = pos // 4
-                if unit_index < len(big_units):
-                    result += big_units[unit_index]
-                    # 去除单位前的零
-                    if result.endswith("零" + big_units[unit_index]):
-                        result = result[:-1-len(big_units[unit_index])] + big_units[unit_index]
-
-    # 去除末尾的零
-    result = result.rstrip("零")
-
-    # 添加"元"
-    result += "元"
-
-    # 处理角分
-    if jiao == 0 and fen == 0:
-        result += "整"
-    else:
-        if jiao != 0:
-            result += chinese_numbers[jiao] + "角"
-        if fen != 0:
-            result += chinese_numbers[fen] + "分"
+# 金额字段（单位万元），渲染前为每个字段生成 <字段>_chinese 大写金额
+MONEY_FIELDS = [
+    "contract_amount", "submit_amount_wan", "audit_amount", "final_approved_amount", "reduction_amount",
+    "bidding_price_control", "bidding_price_winning", "audit_fee_deduction",
+]
 
-    return result
+# prepare_report_data 生成的派生字段 -> 来源字段；模板用到派生字段时来源字段不能裁掉
+DERIVED_FIELDS = {f"{field}_chinese": (field,) for field in MONEY_FIELDS}
 
-def generate_docx_file(data: dict, filename_prefix: str) -> str:
-    if not os.path.exists(TEMPLATE_PATH):
-        raise FileNotFoundError("Template file not found")
+def report_payload(tpl, data: dict, strict: bool = False) -> dict:
+    """
+    去掉模板用不到的字段后再渲染和计算缓存键：与报告无关的字段变化不会让缓存失效。
+    strict=True 时有用不到的字段直接返回 422，便于调用方发现字段名拼写错误
+    """
+    trimmed, unused = template_schema(tpl).trim(data, DERIVED_FIELDS)
+    if strict and unused:
+        raise HTTPException(status_code=422, detail={"message": "模板未使用的字段", "unused": unused})
+    return trimmed
 
+def prepare_report_data(data: dict) -> dict:
+    """渲染前补充派生字段（金额大写、多行文本换行符），原地修改并返回 data"""
     # 自动生成金额大写字段
     # 注意：前端传入的是万元，需要转换成元
-    # 申定金额大写
-    if 'final_approved_amount' in data and data['final_approved_amount']:
-        try:
-            amount_wan = float(str(data['final_approved_amount']).replace('¥', '').replace(',', '').strip())
-            amount_yuan = amount_wan * 10000  # 万元转元
-            data['final_approved_amount_chinese'] = amount_to_chinese(amount_yuan)
-        except (ValueError, TypeError):
-            data['final_approved_amount_chinese'] = '***元整'
-
-    # 净核减额大写
-    if 'reduction_amount' in data and data['reduction_amount']:
-        try:
-            amount_wan = float(str(data['reduction_amount']).replace('¥', '').replace(',', '').strip())
-            amount_yuan = amount_wan * 10000  # 万元转元
-            data['reduction_amount_chinese'] = amount_to_chinese(amount_yuan)
-        except (ValueError, TypeError):
-            data['reduction_amount_chinese'] = '***元整'
+    for field in MONEY_FIELDS:
+        if field in data and data[field]:
+            try:
+                data[f"{field}_chinese"] = amount_to_chinese(data[field], WAN)
+            except (ValueError, TypeError):
+                data[f"{field}_chinese"] = '***元整'
+
+    # 调整项表格每一行的金额大写，整列一次转换
+    adjustments = data.get('adjustments')
+    if isinstance(adjustments, list):
+        rows = [item for item in adjustments if isinstance(item, dict) and item.get('amount')]
+        texts = amounts_to_chinese((item['amount'] for item in rows), WAN, invalid='***元整')
+        for item, text in zip(rows, texts):
+            item['amount_chinese'] = text
 
     # 处理多行文本字段：将 \n 转换为 Word 的手动换行符 \a
     # 这样可以保持段落格式（悬挂缩进等）
@@ -222,26 +425,33 @@ def generate_docx_file(data: dict, filename_prefix: str) -> str:
             # 它会在同一段落内换行，继承段落格式
             data[field] = str(data[field]).replace('\n', '\a')
 
-    # 直接渲染，Word表格会自动处理换行和居中
-    tpl = DocxTemplate(TEMPLATE_PATH)
-    tpl.render(data)
+    return data
 
-    filename = f"{filename_prefix}_{uuid.uuid4()}.docx"
-    file_path = os.path.join(TMP_DIR, filename)
-    tpl.save(file_path)
+def generate_docx_file(data: dict, filename_prefix: str, template_name: Optional[str] = None) -> str:
+    tpl = template_registry.get(template_name or DEFAULT_TEMPLATE)
+    prepare_report_data(data)
+
+    # 直接渲染，Word表格会自动处理换行和居中
+    file_path = scratch.path(filename_prefix, ".docx")
+    tpl.render_to(data, file_path)
     return file_path
 
+def generate_docx_bytes(data: dict, template_name: Optional[str] = None) -> bytes:
+    """渲染到内存，不经过磁盘（不需要转 PDF 时使用）"""
+    tpl = template_registry.get(template_name or DEFAULT_TEMPLATE)
+    prepare_report_data(data)
+    buffer = io.BytesIO()
+    tpl.render_to(data, buffer)
+    return buffer.getvalue()
+
 # --- API 接口 ---
 
 # 1. 项目管理接口
-@app.post("/api/projects", response_model=ProjectRead)
-def create_project(project: ProjectCreate, session: Session = Depends(get_session)):
-    # 使用 model_dump() 确保兼容性
-    db_project = Project(**project.model_dump())
-    # 初始化默认数据结构（带测试数据）
-    default_data = {
-        "project_name": project.name,
-        "report_code": project.code or "杭滨咨(2026)结审第001号",
+def default_project_data(name: str, code: str) -> Dict[str, Any]:
+    """新建项目的默认数据结构（带测试数据）"""
+    return {
+        "project_name": name,
+        "report_code": code or "杭滨咨(2026)结审第001号",
         "report_date": datetime.now().strftime("%Y年%m月%d日"),
         "client_name": "杭州市滨江区城市建设投资集团有限公司",
         "project_description": "本工程主要包括江南大道（西兴路-火炬大道）及周边楼宇的亮化设计与施工，涉及灯具安装 1200 套，控制系统升级等内容。",
@@ -270,170 +480,1194 @@ def create_project(project: ProjectCreate, session: Session = Depends(get_sessio
             {"content": "亮化灯具品牌更换核减差价", "amount": 8.30}
         ]
     }
-    db_project.data_json = json.dumps(default_data, ensure_ascii=False)
+
+def add_project(session: Session, db_project: Project, data: Dict[str, Any]) -> Project:
+    """登记新项目及其初始数据（不提交）"""
+    db_project.data_json = json.dumps(data, ensure_ascii=False)
     session.add(db_project)
+    session.flush()
+    # 初始数据作为第 0 版
+    project_history.record(session, db_project.id, db_project.version, db_project.data_json)
+    search_index.index_project(session, db_project.id, db_project.name, db_project.code)
+    search_index.index_data(session, db_project.id, data, replace_all=True)
+    return db_project
+
+@app.post("/api/projects", response_model=ProjectRead)
+def create_project(project: ProjectCreate, session: Session = Depends(get_session)):
+    # 使用 model_dump() 确保兼容性
+    db_project = Project(**project.model_dump())
+    add_project(session, db_project, default_project_data(project.name, project.code))
     session.commit()
     session.refresh(db_project)
     return db_project
 
-@app.get("/api/projects", response_model=List[ProjectRead])
-def read_projects(session: Session = Depends(get_session)):
-    projects = session.exec(select(Project).order_by(Project.created_at.desc())).all()
-    return projects
+def encode_cursor(created_at: datetime, project_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{project_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, project_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(project_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/projects", response_model=ProjectPage)
+def read_projects(
+    q: Optional[str] = None,
+    code: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=PROJECT_PAGE_SIZE, ge=1, le=PROJECT_PAGE_MAX),
+    session: Session = Depends(get_session),
+):
+    """
+    项目列表（按创建时间倒序，游标分页）。
+    q 在名称和编号中模糊搜索，code 按编号精确筛选；
+    只查询列表需要的列，不读取 data_json。
+    """
+    conditions = []
+    if q:
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        conditions.append(or_(Project.name.like(pattern, escape="\\"), Project.code.like(pattern, escape="\\")))
+    if code:
+        conditions.append(Project.code == code)
+
+    total = session.exec(select(func.count()).select_from(Project).where(*conditions)).one()
+
+    query = select(Project.id, Project.name, Project.code, Project.created_at, Project.updated_at).where(*conditions)
+    if cursor:
+        # 键集分页：从上一页最后一条之后继续，id 用于区分创建时间相同的项目
+        created_at, project_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Project.created_at < created_at,
+            and_(Project.created_at == created_at, Project.id < project_id),
+        ))
+    rows = session.exec(query.order_by(Project.created_at.desc(), Project.id.desc()).limit(limit + 1)).all()
+
+    items = [ProjectRead(id=r[0], name=r[1], code=r[2], created_at=r[3], updated_at=r[4]) for r in rows[:limit]]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+    return ProjectPage(items=items, total=total, next_cursor=next_cursor)
+
+# 解析后的项目数据：project_id -> (updated_at, data)，updated_at 变化即失效
+_project_data_cache: "OrderedDict[int, Tuple[datetime, Dict[str, Any]]]" = OrderedDict()
+_project_data_lock = threading.Lock()
+
+def remember_project_data(project_id: int, updated_at: datetime, data: Dict[str, Any]):
+    with _project_data_lock:
+        _project_data_cache[project_id] = (updated_at, data)
+        _project_data_cache.move_to_end(project_id)
+        while len(_project_data_cache) > PROJECT_DATA_CACHE_SIZE:
+            _project_data_cache.popitem(last=False)
+
+def forget_project_data(project_id: int):
+    with _project_data_lock:
+        _project_data_cache.pop(project_id, None)
+
+def load_project_data(project: Project) -> Dict[str, Any]:
+    """解析 data_json，同一版本只解析一次"""
+    with _project_data_lock:
+        cached = _project_data_cache.get(project.id)
+        if cached is not None and cached[0] == project.updated_at:
+            _project_data_cache.move_to_end(project.id)
+            return cached[1]
+    try:
+        data = json.loads(project.data_json)
+    except ValueError as e:
+        print(f"Project {project.id} data_json 解析失败: {e}")
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    remember_project_data(project.id, project.updated_at, data)
+    return data
+
+def touch_project(session: Session, project_id: int):
+    """项目的文件变化时更新 updated_at，使详情的 ETag 失效"""
+    session.execute(update(Project).where(Project.id == project_id).values(updated_at=datetime.now()))
+
+def file_statuses(session: Session, sha256s: List[Optional[str]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """附件的 (文本提取状态, OCR 状态)，按内容哈希"""
+    return text_extractor.statuses(session, sha256s), ocr_runner.statuses(session, sha256s)
+
+def project_etag(project_id: int, updated_at: datetime, statuses: Tuple[Dict[str, str], Dict[str, str]]) -> str:
+    """
+    详情的 ETag：updated_at 加上附件的提取/OCR 状态。
+    后台提取和识别只改状态、不更新项目，状态也要计入，否则轮询的客户端一直拿到 304
+    """
+    extraction, ocr = statuses
+    state = ";".join(f"{sha}:{extraction.get(sha)}:{ocr.get(sha)}" for sha in sorted(set(extraction) | set(ocr)))
+    digest = hashlib.sha1(state.encode("utf-8")).hexdigest()[:12]
+    return f'W/"{project_id}-{updated_at.isoformat()}-{digest}"'
 
 @app.get("/api/projects/{project_id}", response_model=ProjectDetail)
-def read_project_detail(project_id: int, session: Session = Depends(get_session)):
-    project = session.get(Project, project_id)
+def read_project_detail(project_id: int, request: Request, response: Response, session: Session = Depends(get_session)):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # 只查 updated_at 和附件状态，未变时直接返回 304，不加载项目数据也不序列化
+        updated_at = session.exec(select(Project.updated_at).where(Project.id == project_id)).first()
+        if updated_at is not None:
+            sha256s = list(session.exec(
+                select(ProjectFile.blob_sha256).where(ProjectFile.project_id == project_id)
+            ).all())
+            etag = project_etag(project_id, updated_at, file_statuses(session, sha256s))
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    # 项目和文件列表一次 JOIN 查询取回
+    project = session.get(Project, project_id, options=[joinedload(Project.files)])
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    
-    # 构造详情响应，将 data_json 解析为 dict
-    try:
-        data_obj = json.loads(project.data_json)
-    except:
-        data_obj = {}
-        
+
+    statuses, ocr_statuses = file_statuses(session, [f.blob_sha256 for f in project.files])
+    response.headers["ETag"] = project_etag(project.id, project.updated_at, (statuses, ocr_statuses))
+    response.headers["Cache-Control"] = "no-cache"
     return ProjectDetail(
         id=project.id,
         name=project.name,
         code=project.code,
         created_at=project.created_at,
         updated_at=project.updated_at,
-        data=data_obj,
-        files=project.files
+        version=project.version,
+        data=load_project_data(project),
+        files=[
+            ProjectFileRead(
+                **f.dict(),
+                extraction_status=statuses.get(f.blob_sha256),
+                ocr_status=ocr_statuses.get(f.blob_sha256),
+            )
+            for f in project.files
+        ]
     )
 
+def expected_version(request: Request, required: bool) -> Optional[int]:
+    """从 If-Match 头读取客户端持有的数据版本号（"3"、3、W/"3" 均可）"""
+    value = request.headers.get("if-match")
+    if value is None:
+        if required:
+            raise HTTPException(status_code=428, detail="If-Match header with the project version is required")
+        return None
+    try:
+        return int(value.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be the project version number")
+
+def version_conflict(current: int) -> HTTPException:
+    return HTTPException(status_code=412, detail=f"Project data has changed (current version {current})")
+
 @app.put("/api/projects/{project_id}/save")
-def save_project_data(project_id: int, request: SaveDataRequest, session: Session = Depends(get_session)):
-    project = session.get(Project, project_id)
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    # 更新数据
-    project.data_json = json.dumps(request.data, ensure_ascii=False)
-    project.updated_at = datetime.now()
-    session.add(project)
-    session.commit()
-    return {"status": "success"}
+def save_project_data(project_id: int, request: SaveDataRequest, http_request: Request, session: Session = Depends(get_session)):
+    expected = expected_version(http_request, required=False)
+    new_json = json.dumps(request.data, ensure_ascii=False)
+    # 版本号作为条件写入；没有 If-Match 时（整份覆盖）被并发的保存抢先就按新版本重试
+    for _ in range(SAVE_RETRIES):
+        row = session.exec(
+            select(Project.version, Project.data_json).where(Project.id == project_id)
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        version, data_json = row
+        if expected is not None and expected != version:
+            raise version_conflict(version)
+
+        # 更新数据，并记录相对上一版的变化
+        changed, removed = diff_documents(data_json, request.data)
+        updated_at = datetime.now()
+        result = session.execute(
+            update(Project)
+            .where(Project.id == project_id, Project.version == version)
+            .values(data_json=new_json, version=version + 1, updated_at=updated_at)
+        )
+        if result.rowcount == 0:
+            session.rollback()
+            continue
+        project_history.record(session, project_id, version + 1, new_json, changed, removed)
+        search_index.index_data(session, project_id, changed, removed)
+        session.commit()
+        break
+    else:
+        raise HTTPException(status_code=409, detail="Concurrent save, please retry")
+    # 刚保存的数据就是解析结果，直接放入缓存
+    remember_project_data(project_id, updated_at, request.data)
+    return {"status": "success", "version": version + 1}
+
+def apply_project_patch(project_id: int, kind: str, patch: Any, expected: int) -> dict:
+    with Session(engine) as session:
+        row = session.exec(
+            select(Project.version, Project.data_json).where(Project.id == project_id)
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        version, data_json = row
+        if version != expected:
+            raise version_conflict(version)
+
+        try:
+            new_json, changed, removed = patch_document(data_json, kind, patch)
+        except PatchTestFailed as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except PatchError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        # 版本号作为条件写入，期间有其他保存时不会覆盖
+        result = session.execute(
+            update(Project)
+            .where(Project.id == project_id, Project.version == expected)
+            .values(data_json=new_json, version=expected + 1, updated_at=datetime.now())
+        )
+        if result.rowcount == 0:
+            session.rollback()
+            current = session.exec(select(Project.version).where(Project.id == project_id)).first()
+            raise version_conflict(current)
+        project_history.record(session, project_id, expected + 1, new_json, changed, removed)
+        search_index.index_data(session, project_id, changed, removed)
+        session.commit()
+    return {"status": "success", "version": expected + 1}
+
+@app.patch("/api/projects/{project_id}/data")
+async def patch_project_data(project_id: int, request: Request):
+    """
+    增量保存项目数据，用于自动保存。
+    请求体为 JSON Patch (application/json-patch+json) 或 JSON Merge Patch (application/merge-patch+json)，
+    If-Match 头携带客户端当前的版本号，版本不一致时返回 412。
+    只重新序列化补丁涉及的顶层字段，其余字段原样保留。
+    """
+    expected = expected_version(request, required=True)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        patch = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if content_type == "application/json":
+        # 未声明补丁类型时按请求体推断：数组为 JSON Patch，对象为 Merge Patch
+        content_type = JSON_PATCH if isinstance(patch, list) else MERGE_PATCH
+    if content_type not in (JSON_PATCH, MERGE_PATCH):
+        raise HTTPException(status_code=415, detail=f"Use {JSON_PATCH} or {MERGE_PATCH}")
+    return await run_in_threadpool(apply_project_patch, project_id, content_type, patch, expected)
 
 @app.delete("/api/projects/{project_id}")
 def delete_project(project_id: int, session: Session = Depends(get_session)):
+    """删除项目及其文件记录；内容寻址的文件批量减少引用，未完成的分片上传一并清理"""
     project = session.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
-    session.delete(project)
+
+    files = session.exec(
+        select(ProjectFile.blob_sha256, ProjectFile.filepath).where(ProjectFile.project_id == project_id)
+    ).all()
+    upload_ids = session.exec(select(UploadSession.id).where(UploadSession.project_id == project_id)).all()
+
+    session.execute(delete(ProjectFile).where(ProjectFile.project_id == project_id))
+    # 历史任务保留，只解除与项目的关联
+    session.execute(update(ReportJob).where(ReportJob.project_id == project_id).values(project_id=None))
+    project_history.delete_project(session, project_id)
+    search_index.delete_project(session, project_id)
+    session.execute(delete(Project).where(Project.id == project_id))
     session.commit()
+    forget_project_data(project_id)
+
+    forget_blob_text(blob_store.release_many(sha for sha, _ in files if sha))
+    for sha, filepath in files:
+        # 旧数据没有登记到内容寻址存储，直接删除物理文件
+        if not sha and os.path.exists(filepath):
+            os.remove(filepath)
+    for upload_id in upload_ids:
+        chunked_uploads.discard(session, upload_id)
     return {"status": "deleted"}
 
+@app.get("/api/projects/{project_id}/suggestions")
+def suggest_project_data(
+    project_id: int,
+    min_confidence: float = Query(0.5, ge=0, le=1),
+    only_missing: bool = False,
+    session: Session = Depends(get_session),
+):
+    """
+    根据已上传文件的文本（含 OCR 结果）给出表单字段的建议值，附带出处页码和置信度。
+    only_missing=true 时 data 里只包含项目数据中还没有填写的字段。
+    """
+    project = get_project_or_404(session, project_id)
+    start = time.perf_counter()
+    rows = session.exec(
+        select(ProjectFile.id, ProjectFile.filename, ProjectFile.category, PageText.page, PageText.text, PageText.source)
+        .join(PageText, PageText.sha256 == ProjectFile.blob_sha256)
+        .where(ProjectFile.project_id == project_id)
+        .order_by(ProjectFile.id, PageText.page)
+    ).all()
+    result = suggest_fields(rows, min_confidence=min_confidence)
+
+    current = load_project_data(project)
+    for name, info in result["fields"].items():
+        info["current"] = current.get(name)
+    if only_missing:
+        result["data"] = {name: value for name, value in result["data"].items() if current.get(name) in (None, "")}
+
+    # 还在提取或识别中的文件，建议可能不完整
+    pending = session.exec(
+        select(func.count()).select_from(ProjectFile)
+        .join(TextExtraction, TextExtraction.sha256 == ProjectFile.blob_sha256)
+        .outerjoin(OcrJob, OcrJob.sha256 == ProjectFile.blob_sha256)
+        .where(
+            ProjectFile.project_id == project_id,
+            or_(
+                TextExtraction.status.in_([EXTRACT_PENDING, EXTRACT_RUNNING]),
+                OcrJob.status.in_([OCR_PENDING, OCR_RUNNING]),
+            ),
+        )
+    ).one()
+    result["pages"] = len(rows)
+    result["pending_files"] = pending
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+# 项目数据版本历史
+def get_project_or_404(session: Session, project_id: int) -> Project:
+    project = session.get(Project, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return project
+
+def get_version_or_404(session: Session, project_id: int, version: int) -> Tuple[Dict[str, Any], datetime]:
+    try:
+        return project_history.get(session, project_id, version)
+    except VersionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/projects/{project_id}/versions")
+def list_project_versions(
+    project_id: int,
+    before: Optional[int] = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    session: Session = Depends(get_session),
+):
+    """版本列表（新到旧），只返回元数据和变化的字段名"""
+    project = get_project_or_404(session, project_id)
+    return {
+        "current_version": project.version,
+        "versions": project_history.list_versions(session, project_id, limit=limit, before=before),
+    }
+
+@app.get("/api/projects/{project_id}/versions/{version}")
+def read_project_version(project_id: int, version: int, session: Session = Depends(get_session)):
+    data, created_at = get_version_or_404(session, project_id, version)
+    return {"project_id": project_id, "version": version, "created_at": created_at.isoformat(), "data": data}
+
+@app.get("/api/projects/{project_id}/diff")
+def diff_project_versions(
+    project_id: int,
+    from_version: int = Query(alias="from"),
+    to_version: Optional[int] = Query(default=None, alias="to"),
+    session: Session = Depends(get_session),
+):
+    """两个版本之间的差异（JSON Patch 格式），to 省略时与当前版本比较"""
+    if to_version is None:
+        to_version = get_project_or_404(session, project_id).version
+    old, _ = get_version_or_404(session, project_id, from_version)
+    new, _ = get_version_or_404(session, project_id, to_version)
+    return {"from": from_version, "to": to_version, "operations": version_diff(old, new)}
+
+@app.get("/api/projects/{project_id}/versions/{version}/report")
+async def generate_version_report(
+    project_id: int,
+    version: int,
+    request: Request,
+    kind: str = "docx",
+    template: Optional[str] = None,
+):
+    """按历史版本的数据重新生成报告（结果按数据内容缓存，重复下载不再渲染）"""
+    if kind not in ("docx", "pdf"):
+        raise HTTPException(status_code=400, detail="kind must be docx or pdf")
+    tpl = get_report_template(template)
+    with Session(engine) as session:
+        project = get_project_or_404(session, project_id)
+        data, _ = get_version_or_404(session, project_id, version)
+    try:
+        lease = await render_pool.run(render_cached, data, kind, tpl.name)
+    except PoolSaturated as e:
+        raise busy_response(e)
+    except Exception as e:
+        print(f"Version Report Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    filename = f"{project.name}_v{version}_审核报告.{kind}"
+    return serve_lease(request, lease, filename=filename, attachment=kind == "docx")
+
 # 2. 文件上传接口
+def add_project_file(session: Session, db_file: ProjectFile):
+    """登记文件记录；写入失败时退回 acquire 增加的引用，否则内容寻址的文件永远不会被删除"""
+    session.add(db_file)
+    touch_project(session, db_file.project_id)
+    try:
+        session.flush()
+        # 同样的内容之前已经提取过文本时，直接带上逐页文本
+        pages = []
+        if db_file.blob_sha256:
+            pages = [(p.page, p.text) for p in text_extractor.pages(session, db_file.blob_sha256)]
+        search_index.index_file(session, db_file.project_id, db_file.id, db_file.filename, pages)
+        session.commit()
+    except Exception:
+        session.rollback()
+        if db_file.blob_sha256:
+            blob_store.release(db_file.blob_sha256)
+        raise
+
 @app.post("/api/projects/{project_id}/upload")
 async def upload_file(
     project_id: int,
-    file: UploadFile = File(...),
-    category: str = Form(default="其他"),
+    request: Request,
     session: Session = Depends(get_session)
 ):
+    """
+    上传文件到项目（multipart/form-data，字段 file 和 category）
+    请求体流式写入并同时计算 SHA-256，相同内容只存一份
+    """
     project = session.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
 
+    fields, writer, filename, digest = await receive_multipart_upload(request, blob_store)
+    if writer is None:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+
     # 验证分类是否有效
+    category = fields.get("category", "其他")
     if category not in FILE_CATEGORIES:
         category = "其他"
 
-    # 保存文件
-    # 为避免重名，加个 UUID 前缀
-    safe_filename = f"{uuid.uuid4().hex[:8]}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, safe_filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 存入内容寻址存储（已存在相同内容时只增加引用计数）
+    blob = await run_in_threadpool(blob_store.acquire, digest, writer.size, writer.tmp_path)
 
     # 记录到数据库
     db_file = ProjectFile(
         project_id=project_id,
-        filename=file.filename, # 原始文件名用于展示
-        filepath=file_path,
+        filename=filename, # 原始文件名用于展示
+        filepath=blob.path,
         file_type="file", # 后续可根据后缀名优化
-        category=category
+        category=category,
+        size=writer.size,
+        blob_sha256=digest,
     )
-    session.add(db_file)
-    session.commit()
+    add_project_file(session, db_file)
     session.refresh(db_file)
+    text_extractor.submit(digest)
     return db_file
 
+# 断点续传：init -> PUT 分片 -> complete
+@app.post("/api/projects/{project_id}/uploads")
+def init_chunked_upload(project_id: int, request: ChunkedUploadCreate, session: Session = Depends(get_session)):
+    """创建分片上传会话"""
+    project = session.get(Project, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    # 验证分类是否有效
+    category = request.category if request.category in FILE_CATEGORIES else "其他"
+    try:
+        upload = chunked_uploads.create(session, project_id, request.filename, request.size, category, request.chunk_size)
+    except ChunkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session_status(upload, [])
+
+def get_upload_or_404(session: Session, upload_id: str) -> UploadSession:
+    upload = session.get(UploadSession, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return upload
+
+@app.get("/api/uploads/{upload_id}")
+def read_chunked_upload(upload_id: str, session: Session = Depends(get_session)):
+    """查询已收到的分片，断线后据此只补传缺失部分"""
+    upload = get_upload_or_404(session, upload_id)
+    return session_status(upload, chunked_uploads.received(session, upload_id))
+
+@app.put("/api/uploads/{upload_id}/chunks/{index}")
+async def upload_chunk(upload_id: str, index: int, request: Request):
+    """上传一个分片（请求体为原始字节），可并行、可重复"""
+    with Session(engine) as session:
+        upload = get_upload_or_404(session, upload_id)
+    data = await request.body()
+    try:
+        await run_in_threadpool(chunked_uploads.write_chunk, upload, index, data)
+    except ChunkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"upload_id": upload_id, "index": index, "size": len(data)}
+
+@app.post("/api/uploads/{upload_id}/complete")
+def complete_chunked_upload(upload_id: str, session: Session = Depends(get_session)):
+    """所有分片到齐后登记为项目文件；同一会话并发 complete 时只有一个生效，其余返回 409"""
+    upload = get_upload_or_404(session, upload_id)
+    if not chunked_uploads.claim(session, upload_id):
+        raise HTTPException(status_code=409, detail="Upload is already being completed")
+    try:
+        with chunked_uploads.writes_finished(upload_id):
+            digest, part_path = chunked_uploads.finish(session, upload)
+            # 分片已经写在最终文件里，直接原地移入内容寻址存储，不再复制
+            blob = blob_store.acquire(digest, upload.size, part_path)
+    except BaseException as e:
+        chunked_uploads.unclaim(session, upload_id)
+        if isinstance(e, ChunkError):
+            raise HTTPException(status_code=409, detail=str(e))
+        raise
+    db_file = ProjectFile(
+        project_id=upload.project_id,
+        filename=upload.filename,
+        filepath=blob.path,
+        file_type="file",
+        category=upload.category,
+        size=upload.size,
+        blob_sha256=digest,
+    )
+    add_project_file(session, db_file)
+    chunked_uploads.discard(session, upload_id)
+    session.refresh(db_file)
+    text_extractor.submit(digest)
+    return db_file
+
+@app.delete("/api/uploads/{upload_id}")
+def abort_chunked_upload(upload_id: str, session: Session = Depends(get_session)):
+    get_upload_or_404(session, upload_id)
+    chunked_uploads.discard(session, upload_id)
+    return {"status": "deleted"}
+
 @app.get("/api/file-categories")
 def get_file_categories():
     """获取文件夹分类列表"""
     return {"categories": FILE_CATEGORIES}
 
+@app.api_route("/api/files/{file_id}/content", methods=["GET", "HEAD"])
+def download_file(file_id: int, request: Request, session: Session = Depends(get_session)):
+    """在线查看/下载上传的文件，支持 Range 和条件请求"""
+    file_rec = session.get(ProjectFile, file_id)
+    if not file_rec:
+        raise HTTPException(status_code=404, detail="File not found")
+    attachment = request.query_params.get("download") == "1"
+    return serve_file(request, file_rec.filepath, filename=file_rec.filename,
+                      digest=file_rec.blob_sha256, attachment=attachment)
+
+def get_file_or_404(session: Session, file_id: int) -> ProjectFile:
+    file_rec = session.get(ProjectFile, file_id)
+    if not file_rec:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_rec
+
+@app.get("/api/files/{file_id}/text")
+def read_file_text(file_id: int, page: Optional[int] = Query(None, ge=1), session: Session = Depends(get_session)):
+    """文件的逐页文本；提取未完成时 pages 为空，根据 status 轮询"""
+    file_rec = get_file_or_404(session, file_id)
+    if not file_rec.blob_sha256:
+        raise HTTPException(status_code=409, detail="File is not in the content store")
+    record = session.get(TextExtraction, file_rec.blob_sha256)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Text extraction not started")
+    pages = text_extractor.pages(session, file_rec.blob_sha256, page)
+    ocr_job = session.get(OcrJob, file_rec.blob_sha256)
+    return {
+        "file_id": file_id,
+        "status": record.status,
+        "kind": record.kind,
+        "page_count": record.pages,
+        "ocr_pages": record.ocr_pages,
+        "error": record.error,
+        "ocr": ocr_job and {
+            "status": ocr_job.status,
+            "engine": ocr_job.engine,
+            "pages": ocr_job.pages,
+            "done_pages": ocr_job.done_pages,
+            "cached_pages": ocr_job.cached_pages,
+            "failed_pages": ocr_job.failed_pages,
+            "error": ocr_job.error,
+        },
+        "pages": [
+            {"page": p.page, "text": p.text, "source": p.source, "needs_ocr": p.needs_ocr}
+            for p in pages
+        ],
+    }
+
+@app.post("/api/files/{file_id}/extract")
+def extract_file_text(file_id: int, session: Session = Depends(get_session)):
+    """重新提取文本（如提取失败后、或安装了 pdfplumber 之后）"""
+    file_rec = get_file_or_404(session, file_id)
+    if not file_rec.blob_sha256:
+        raise HTTPException(status_code=409, detail="File is not in the content store")
+    return {"file_id": file_id, "status": text_extractor.submit(file_rec.blob_sha256, force=True)}
+
+@app.post("/api/files/{file_id}/ocr")
+def ocr_file(file_id: int, session: Session = Depends(get_session)):
+    """重新识别扫描页（如换了 OCR 引擎、或部分页面超时）"""
+    file_rec = get_file_or_404(session, file_id)
+    if not ocr_runner.available:
+        raise HTTPException(status_code=503, detail="No OCR engine available")
+    if not file_rec.blob_sha256:
+        raise HTTPException(status_code=409, detail="File is not in the content store")
+    status = ocr_runner.submit(file_rec.blob_sha256, force=True)
+    if status is None:
+        raise HTTPException(status_code=409, detail="Text extraction has not finished")
+    return {"file_id": file_id, "status": status}
+
 @app.delete("/api/files/{file_id}")
 def delete_file(file_id: int, session: Session = Depends(get_session)):
     file_rec = session.get(ProjectFile, file_id)
     if not file_rec:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # 删除物理文件
-    if os.path.exists(file_rec.filepath):
-        os.remove(file_rec.filepath)
-
+    blob_sha256 = file_rec.blob_sha256
+    search_index.delete_file(session, file_id)
     session.delete(file_rec)
+    touch_project(session, file_rec.project_id)
     session.commit()
+
+    # 删除物理文件：内容寻址的文件在最后一个引用删除时才删除
+    if blob_sha256:
+        forget_blob_text(blob_store.release(blob_sha256))
+    elif os.path.exists(file_rec.filepath):
+        os.remove(file_rec.filepath)
     return {"status": "deleted"}
 
 # 3. 生成与预览接口 (复用之前的逻辑，但现在接收任意 JSON)
+def render_report_file(data: dict, kind: str, template_name: str, cache_key: str, progress=None,
+                       incremental: bool = False) -> CacheLease:
+    """
+    渲染报告并写入缓存（kind 为 docx 或 pdf），在渲染线程池或任务线程中执行。
+    incremental=True（预览）时 PDF 只重新转换数据有变化的分段。
+    返回租用中的缓存文件，调用方用完后释放
+    """
+    if kind == "pdf":
+        file_path = None
+        if incremental:
+            file_path = section_renderer.render(template_registry.get(template_name), prepare_report_data(data))
+        if file_path is None:
+            # 1. 生成 Word
+            docx_path = generate_docx_file(data, "preview", template_name)
+            # 2. 交给常驻 LibreOffice 实例转 PDF
+            if progress:
+                progress(50, "正在转换 PDF")
+            try:
+                file_path = converter.convert(docx_path, TMP_DIR)
+            finally:
+                # 中间的 Word 文件用完即删
+                scratch.discard(docx_path)
+    else:
+        file_path = generate_docx_file(data, "report", template_name)
+    return preview_cache.put_lease(cache_key, file_path, template_name)
+
+def render_cached(data: dict, kind: str, template_name: Optional[str] = None) -> CacheLease:
+    """带缓存的同步渲染，供批量生成等后台流程使用；返回租用中的缓存文件，用完后释放（可用 with 语句）"""
+    tpl = template_registry.get(template_name or DEFAULT_TEMPLATE)
+    data = report_payload(tpl, data)
+    cache_key = preview_cache.key(data, kind, tpl.name, tpl.digest)
+    lease = preview_cache.lease(cache_key)
+    if lease is None:
+        lease = render_report_file(data, kind, tpl.name, cache_key)
+    return lease
+
+def serve_lease(request: Request, lease: CacheLease, **kwargs) -> Response:
+    """返回租用中的缓存文件，响应发送完（或客户端断开）后释放租约"""
+    try:
+        response = serve_file(request, lease.path, **kwargs)
+    except BaseException:
+        lease.release()
+        raise
+    response.background = BackgroundTask(lease.release)
+    return response
+
+def busy_response(e: PoolSaturated) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 @app.post("/api/generate")
-async def generate_report(request: SaveDataRequest):
-    """直接接收 JSON 数据生成 Word (不依赖数据库)"""
+async def generate_report(request: SaveDataRequest, strict: bool = False):
+    """直接接收 JSON 数据生成 Word (不依赖数据库)；strict=true 时拒绝模板用不到的字段"""
+    tpl = get_report_template(request.template)
+    data = report_payload(tpl, request.data, strict)
     try:
-        file_path = generate_docx_file(request.data, "report")
-        return FileResponse(file_path, filename="审核报告.docx", media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+        # 模板已预编译，渲染只需几十毫秒，直接在内存中生成，不落盘
+        content = await render_pool.run(generate_docx_bytes, data, tpl.name)
+        filename = quote("审核报告.docx")
+        return Response(
+            content,
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            headers={"Content-Disposition": f"attachment; filename*=utf-8''{filename}"},
+        )
+    except PoolSaturated as e:
+        raise busy_response(e)
     except Exception as e:
         print(f"Gen Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/preview")
-async def preview_report(request: SaveDataRequest):
-    """直接接收 JSON 数据生成 PDF 预览"""
+async def preview_report(request: SaveDataRequest, http_request: Request, pages: bool = False,
+                         strict: bool = False):
+    """
+    直接接收 JSON 数据生成 PDF 预览。
+    响应头 Content-Location 指向缓存中的预览文件，之后可以用 GET 分段读取。
+    pages=true 时不返回 PDF，只返回页数，由前端按页请求图片
+    """
+    tpl = get_report_template(request.template)
+    data = report_payload(tpl, request.data, strict)
     try:
         # print(f"DEBUG Preview Data: {json.dumps(request.data, ensure_ascii=False)}")
-        
-        # 1. 生成 Word
-        docx_path = generate_docx_file(request.data, "preview")
-        
-        # 2. 调用 LibreOffice 转 PDF
-        # 设置环境变量，解决 macOS 下可能的配置加载问题
-        env = os.environ.copy()
-        env["HOME"] = TMP_DIR 
-        
-        cmd = [
-            "/Applications/LibreOffice.app/Contents/MacOS/soffice",
-            "--headless",
-            "--convert-to", "pdf",
-            "--outdir", TMP_DIR,
-            docx_path
-        ]
-        
-        # 增加 timeout 防止死锁
-        process = subprocess.run(cmd, capture_output=True, text=True, env=env, timeout=30)
-        
-        if process.returncode != 0:
-            print(f"LibreOffice Error: {process.stderr}")
-            print(f"LibreOffice Stdout: {process.stdout}")
-            raise Exception("PDF Conversion failed")
-            
-        pdf_filename = os.path.basename(docx_path).replace(".docx", ".pdf")
-        pdf_path = os.path.join(TMP_DIR, pdf_filename)
-        
-        if not os.path.exists(pdf_path):
-            raise Exception("PDF file not generated")
-            
-        return FileResponse(pdf_path, media_type="application/pdf")
 
+        # 相同数据（模板用到的字段） + 相同模板直接返回缓存
+        cache_key = preview_cache.key(data, "pdf", tpl.name, tpl.digest)
+        lease = preview_cache.lease(cache_key)
+        if lease is None:
+            # 渲染和转换都是阻塞操作，放到线程池里执行，不占用事件循环
+            lease = await render_pool.run(render_report_file, data, "pdf", tpl.name, cache_key,
+                                          incremental=True)
+        if pages:
+            with lease:
+                return await run_in_threadpool(preview_pages, cache_key, lease.path)
+        return serve_lease(http_request, lease, media_type="application/pdf", conditional=False, headers={
+            "X-Preview-Key": cache_key,
+            "Content-Location": f"/api/previews/{cache_key}",
+        })
+    except PoolSaturated as e:
+        raise busy_response(e)
     except Exception as e:
         print(f"Preview Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.api_route("/api/previews/{cache_key}", methods=["GET", "HEAD"])
+def read_cached_preview(cache_key: str, request: Request):
+    """按缓存键读取已生成的预览，支持 Range 和条件请求；缓存被淘汰后返回 404，需重新 POST 生成"""
+    return serve_lease(request, lease_preview_pdf_or_404(cache_key), media_type="application/pdf")
+
+# 逐页图片：预览和附件都按页返回 PNG/WebP，前端先显示第一页，其余滚动到时再加载
+def page_info(sha256: str, path: str, kind: str, url: str) -> Dict[str, Any]:
+    try:
+        count = page_images.page_count(sha256, path, kind)
+    except PageImageError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"pages": count, "widths": list(PAGE_IMAGE_WIDTHS), "formats": list(PAGE_IMAGE_FORMATS), "url": url}
+
+def serve_page_image(request: Request, sha256: str, path: str, kind: str, page: int,
+                     width: Optional[int], fmt: str) -> Response:
+    if fmt not in PAGE_IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(PAGE_IMAGE_FORMATS)}")
+    try:
+        if page < 1 or page > page_images.page_count(sha256, path, kind):
+            raise HTTPException(status_code=404, detail="Page not found")
+        width = page_images.pick_width(width)
+        image_path = page_images.get(sha256, path, kind, page, width, fmt)
+    except PageImageError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # 同一 URL 对应的内容不会变化（预览按数据和模板寻址，附件按内容寻址），浏览器可以长期缓存
+    return serve_file(request, image_path, media_type=PAGE_IMAGE_FORMATS[fmt],
+                      digest=f"{sha256}-{page}-{width}-{fmt}",
+                      headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
+def lease_preview_pdf_or_404(cache_key: str) -> CacheLease:
+    if len(cache_key) != 64 or any(c not in "0123456789abcdef" for c in cache_key):
+        raise HTTPException(status_code=404, detail="Preview not found")
+    lease = preview_cache.lease(cache_key)
+    if lease is None:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    if not lease.path.endswith(".pdf"):
+        lease.release()
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return lease
+
+def preview_pages(cache_key: str, pdf_path: str) -> Dict[str, Any]:
+    sha256 = page_images.digest(pdf_path)
+    info = page_info(sha256, pdf_path, "pdf", f"/api/previews/{cache_key}/pages")
+    # 先在后台渲染第一页，前端请求时多半已经就绪
+    page_images.prefetch(sha256, pdf_path, "pdf", 1, PAGE_IMAGE_WIDTHS[-1])
+    info.update({"key": cache_key, "pdf_url": f"/api/previews/{cache_key}"})
+    return info
+
+@app.get("/api/previews/{cache_key}/pages")
+def read_preview_pages(cache_key: str):
+    with lease_preview_pdf_or_404(cache_key) as pdf_path:
+        return preview_pages(cache_key, pdf_path)
+
+@app.api_route("/api/previews/{cache_key}/pages/{page}", methods=["GET", "HEAD"])
+def read_preview_page(cache_key: str, page: int, request: Request, width: Optional[int] = None, format: str = "webp"):
+    with lease_preview_pdf_or_404(cache_key) as pdf_path:
+        return serve_page_image(request, page_images.digest(pdf_path), pdf_path, "pdf", page, width, format)
+
+def get_file_pages_source(session: Session, file_id: int) -> Tuple[str, str, str]:
+    """附件的 (内容哈希, 路径, 类型)，只支持 PDF 和图片"""
+    db_file = get_file_or_404(session, file_id)
+    if not os.path.exists(db_file.filepath):
+        raise HTTPException(status_code=404, detail="File not found")
+    kind = detect_kind(db_file.filepath)
+    if kind not in ("pdf", "image"):
+        raise HTTPException(status_code=415, detail="Only PDF and image files have page images")
+    sha256 = db_file.blob_sha256 or page_images.digest(db_file.filepath)
+    return sha256, db_file.filepath, kind
+
+@app.get("/api/files/{file_id}/pages")
+def read_file_pages(file_id: int, session: Session = Depends(get_session)):
+    sha256, path, kind = get_file_pages_source(session, file_id)
+    return page_info(sha256, path, kind, f"/api/files/{file_id}/pages")
+
+@app.api_route("/api/files/{file_id}/pages/{page}", methods=["GET", "HEAD"])
+def read_file_page(file_id: int, page: int, request: Request, width: Optional[int] = None, format: str = "webp",
+                   session: Session = Depends(get_session)):
+    sha256, path, kind = get_file_pages_source(session, file_id)
+    return serve_page_image(request, sha256, path, kind, page, width, format)
+
+@app.get("/api/page-images/stats")
+def page_image_stats():
+    return page_images.stats()
+
+# 4. 异步报告任务接口
+def run_report_job(job: ReportJob, progress, dest: str):
+    """任务流水线：复用缓存和 generate_docx_file（在渲染池中执行），产物复制到任务自己的结果文件"""
+    tpl = template_registry.get(job.template)
+    data = report_payload(tpl, json.loads(job.data_json))
+    cache_key = preview_cache.key(data, job.kind, tpl.name, tpl.digest)
+    lease = preview_cache.lease(cache_key)
+    if lease is None:
+        progress(20, "正在生成 Word")
+        # 与预览、批量生成共用渲染池的并发和排队上限；池满时排队等待，不让任务失败
+        lease = render_pool.submit(
+            render_report_file, data, job.kind, tpl.name, cache_key, progress, wait=True,
+        ).result()
+    with lease as file_path:
+        store_result(file_path, dest)
+
+job_runner = JobRunner(engine, run_report_job, JOB_RESULT_DIR)
+
+@app.post("/api/jobs")
+def create_job(request: JobCreate, session: Session = Depends(get_session)):
+    """创建报告生成任务，立即返回任务 ID"""
+    if request.kind not in ("docx", "pdf"):
+        raise HTTPException(status_code=400, detail="kind must be docx or pdf")
+    tpl = get_report_template(request.template)
+
+    data = request.data
+    if request.project_id is not None:
+        project = session.get(Project, request.project_id)
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if data is None:
+            data = json.loads(project.data_json or "{}")
+    if data is None:
+        raise HTTPException(status_code=400, detail="data or project_id is required")
+
+    job = ReportJob(
+        project_id=request.project_id,
+        kind=request.kind,
+        template=tpl.name,
+        data_json=json.dumps(data, ensure_ascii=False),
+        message="排队中",
+        **job_runner.lease.stamp(),
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    job_runner.submit(job.id)
+    return job_to_dict(job)
+
+def get_job_or_404(session: Session, job_id: str) -> ReportJob:
+    job = session.get(ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+def read_job(job_id: str, session: Session = Depends(get_session)):
+    return job_to_dict(get_job_or_404(session, job_id))
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """通过 Server-Sent Events 推送任务进度，任务结束后关闭连接"""
+    def load():
+        with Session(engine) as session:
+            job = session.get(ReportJob, job_id)
+            return job_to_dict(job) if job else None
+
+    if await run_in_threadpool(load) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last = None
+        while True:
+            state = await run_in_threadpool(load)
+            if state is None:
+                return
+            if state != last:
+                yield f"event: progress\ndata: {json.dumps(state, ensure_ascii=False)}\n\n"
+                last = state
+            if state["status"] in JOB_FINISHED_STATES:
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/jobs/{job_id}/result")
+def download_job_result(job_id: str, request: Request, session: Session = Depends(get_session)):
+    job = get_job_or_404(session, job_id)
+    if job.status != JOB_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="Job result has expired")
+    if job.kind == "pdf":
+        return serve_file(request, job.result_path, media_type="application/pdf")
+    return serve_file(request, job.result_path, filename="审核报告.docx", attachment=True, media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, session: Session = Depends(get_session)):
+    job = get_job_or_404(session, job_id)
+    return job_to_dict(job_runner.cancel(session, job))
+
+# 5. 批量生成接口
+def select_batch_items(
+    session: Session,
+    project_ids: Optional[List[int]] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+) -> List[BatchItem]:
+    """按 ID 列表或创建/更新时间筛选需要批量生成的项目"""
+    query = select(Project.id, Project.name, Project.code, Project.data_json)
+    if project_ids:
+        query = query.where(Project.id.in_(project_ids))
+    if created_after:
+        query = query.where(Project.created_at >= created_after)
+    if created_before:
+        query = query.where(Project.created_at < created_before)
+    if updated_after:
+        query = query.where(Project.updated_at >= updated_after)
+    if updated_before:
+        query = query.where(Project.updated_at < updated_before)
+    rows = session.exec(query.order_by(Project.id)).all()
+    items = [BatchItem(project_id=r[0], name=r[1], code=r[2], data_json=r[3]) for r in rows]
+
+    # 按 ID 请求但没有选中的项目也要出现在批量结果里，标明原因
+    missing = sorted(set(project_ids or ()) - {item.project_id for item in items})
+    if missing:
+        existing = set(session.exec(select(Project.id).where(Project.id.in_(missing))).all())
+        items.extend(
+            BatchItem(project_id=pid, name="", code="", data_json="",
+                      error="项目不符合时间筛选条件" if pid in existing else "项目不存在")
+            for pid in missing
+        )
+    return items
+
+@app.post("/api/batch/generate")
+def batch_generate(request: BatchGenerateRequest, session: Session = Depends(get_session)):
+    """批量生成多个项目的报告，边生成边以 ZIP 流式返回"""
+    if request.kind not in ("docx", "pdf"):
+        raise HTTPException(status_code=400, detail="kind must be docx or pdf")
+    tpl = get_report_template(request.template)
+    items = select_batch_items(
+        session,
+        project_ids=request.project_ids,
+        created_after=request.created_after,
+        created_before=request.created_before,
+        updated_after=request.updated_after,
+        updated_before=request.updated_before,
+    )
+    if not any(item.error is None for item in items):
+        raise HTTPException(status_code=404, detail="No matching projects")
+
+    def render(data: dict, kind: str) -> CacheLease:
+        return render_cached(data, kind, tpl.name)
+
+    def submit(fn, *args):
+        # 与预览等接口共用渲染池的并发上限，池满时等待空位
+        return render_pool.submit(fn, *args, wait=True)
+
+    filename = quote(f"批量报告_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip")
+    return StreamingResponse(
+        iter_batch_zip(items, request.kind, render, submit=submit),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"},
+    )
+
+# 项目档案导出/导入
+@app.get("/api/projects/{project_id}/export")
+def export_project(
+    project_id: int,
+    report: str = Query("docx", pattern="^(docx|pdf|none)$"),
+    template: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    """导出项目档案：附件按分类文件夹存放，附带项目数据和生成的报告，ZIP 边打包边返回"""
+    project = get_project_or_404(session, project_id)
+    tpl = get_report_template(template) if report != "none" else None
+    files = session.exec(
+        select(ProjectFile).where(ProjectFile.project_id == project_id).order_by(ProjectFile.category, ProjectFile.id)
+    ).all()
+    archive_files = [
+        ArchiveFile(category=f.category, filename=f.filename, path=f.filepath, size=f.size,
+                    sha256=f.blob_sha256, uploaded_at=f.uploaded_at)
+        for f in files
+    ]
+    meta = {
+        "name": project.name,
+        "code": project.code,
+        "version": project.version,
+        "created_at": project.created_at.isoformat(timespec="seconds"),
+        "updated_at": project.updated_at.isoformat(timespec="seconds"),
+    }
+    data_json = project.data_json
+
+    def render() -> Tuple[CacheLease, str]:
+        # 渲染会改动数据，单独解析一份；在渲染池中执行，计入并发上限
+        future = render_pool.submit(render_cached, json.loads(data_json), report, tpl.name, wait=True)
+        return future.result(), report
+
+    filename = quote(f"{project.code or project.id}_{project.name}_档案.zip")
+    return StreamingResponse(
+        iter_project_archive(meta, data_json, archive_files, render if tpl else None),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"},
+    )
+
+def import_project_archive(zip_path: str, name: Optional[str], code: Optional[str],
+                           archive_name: Optional[str]) -> Project:
+    """把临时文件中的 ZIP 导入为新项目；中途失败时删除已经创建的项目"""
+    try:
+        zf = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Not a valid ZIP archive")
+    with zf, Session(engine) as session:
+        try:
+            plan = plan_import(zf, FILE_CATEGORIES, UPLOAD_MAX_BYTES)
+        except ArchiveError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        name = name or plan.manifest.get("name") or os.path.splitext(archive_name or "")[0] or "导入的项目"
+        code = code if code is not None else plan.manifest.get("code") or ""
+        db_project = add_project(session, Project(name=name, code=code),
+                                 plan.data if plan.data is not None else default_project_data(name, code))
+        session.commit()
+        project_id = db_project.id
+
+        digests = []
+        try:
+            for entry in plan.entries:
+                writer = blob_store.writer()
+                try:
+                    copy_entry(zf, entry.info, writer)
+                except BaseException:
+                    writer.abort()
+                    raise
+                digest = writer.close()
+                blob = blob_store.acquire(digest, writer.size, writer.tmp_path)
+                add_project_file(session, ProjectFile(
+                    project_id=project_id,
+                    filename=entry.filename,
+                    filepath=blob.path,
+                    file_type="file",
+                    category=entry.category,
+                    size=writer.size,
+                    blob_sha256=digest,
+                ))
+                digests.append(digest)
+        except Exception as e:
+            print(f"Archive Import Error: {e}")
+            session.rollback()
+            delete_project(project_id, session)
+            if isinstance(e, (UploadTooLarge, zipfile.BadZipFile, zlib.error)):
+                raise HTTPException(status_code=400, detail=str(e))
+            raise
+        for digest in digests:
+            text_extractor.submit(digest)
+        session.refresh(db_project)
+        return db_project
+
+@app.post("/api/projects/import", response_model=ProjectRead)
+async def import_project(request: Request):
+    """
+    从档案 ZIP 新建项目（multipart/form-data，字段 file，可选 name、code）
+    文件夹名对应文件分类，data.json 作为项目数据，生成的报告不导入
+    """
+    fields, writer, filename, _ = await receive_multipart_upload(request, blob_store, ARCHIVE_MAX_BYTES)
+    if writer is None:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    try:
+        return await run_in_threadpool(
+            import_project_archive, writer.tmp_path, fields.get("name"), fields.get("code"), filename
+        )
+    finally:
+        # 上传的 ZIP 本身不保留
+        writer.abort()
+
+# 全文搜索
+@app.get("/api/search")
+def search(
+    q: str = Query(..., min_length=1),
+    project_id: Optional[int] = None,
+    kind: Optional[str] = Query(None, pattern="^(project|data|file)$"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(PROJECT_PAGE_SIZE, ge=1, le=PROJECT_PAGE_MAX),
+    session: Session = Depends(get_session),
+):
+    """
+    搜索项目名称/编号、项目数据中的文本和附件文本。
+    多个词用空格分隔（同时包含）；结果按相关度排序，snippet 中命中的词用 <mark> 标出。
+    """
+    start = time.perf_counter()
+    result = search_index.search(session, q, project_id=project_id, kind=kind, offset=offset, limit=limit)
+    project_ids = {item["project_id"] for item in result["items"]}
+    names = dict(session.exec(select(Project.id, Project.name).where(Project.id.in_(project_ids))).all()) if project_ids else {}
+    for item in result["items"]:
+        item["project_name"] = names.get(item["project_id"])
+    next_offset = offset + limit
+    result["next_offset"] = next_offset if next_offset < result["total"] else None
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+@app.post("/api/search/rebuild")
+def rebuild_search():
+    return {"projects": rebuild_search_index()}
+
+@app.get("/api/health")
+def health_check():
+    """健康检查：数据库可用时返回 200，否则 503"""
+    try:
+        latency = ping(engine)
+    except Exception as e:
+        print(f"Health Check Error: {e}")
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    return {"status": "ok", "database": {"latency_ms": latency}}
+
+@app.get("/api/db/stats")
+def get_db_stats():
+    return database_stats(engine)
+
+@app.get("/api/render/stats")
+def get_render_stats():
+    """渲染线程池状态"""
+    return render_pool.stats()
+
+@app.get("/api/templates")
+def get_templates():
+    """获取可用的报告模板列表"""
+    return {"templates": template_registry.names(), "default": DEFAULT_TEMPLATE}
+
+@app.get("/api/templates/{name}/schema")
+def get_template_schema(name: str):
+    """模板用到的变量、循环、过滤器及其在文档 XML 中的位置（每个模板版本只分析一次）"""
+    schema = template_schema(get_report_template(name))
+    result = schema.to_dict()
+    result["derived"] = {k: list(v) for k, v in DERIVED_FIELDS.items() if k in schema.variables}
+    return result
+
+@app.post("/api/templates/{name}/check")
+def check_template_data(name: str, data: Dict[str, Any]):
+    """对照模板检查数据：模板用不到的字段和模板需要但数据中没有的字段"""
+    schema = template_schema(get_report_template(name))
+    _, unused = schema.trim(data, DERIVED_FIELDS)
+    return {"complete": schema.complete, "unused": unused, "missing": schema.missing(data, DERIVED_FIELDS)}
+
+@app.get("/api/scratch/stats")
+def get_scratch_stats():
+    """临时文件目录状态"""
+    return scratch.stats()
+
+@app.get("/api/preview/cache/stats")
+def get_preview_cache_stats():
+    """预览缓存命中统计"""
+    stats = preview_cache.stats()
+    stats["sections"] = section_renderer.stats()
+    return stats
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
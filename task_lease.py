@@ -0,0 +1,132 @@
+"""
+后台任务的归属（多个 Web 进程共用一个数据库时）
+
+uvicorn --workers 启动多个进程，报告任务、文本提取、OCR 的任务行都在同一个数据库里。
+以前每个进程启动时把所有未完成的任务当作"上次中断"处理，会抢走其他进程正在执行的任务。
+现在任务行记录持有它的进程（owner：主机名:pid）和心跳时间（heartbeat_at）：
+- 进程在后台定期刷新自己持有（排队或执行中）的任务的心跳
+- 心跳超过 TASK_HEARTBEAT_TIMEOUT 没有刷新的未完成任务，说明持有它的进程已经退出，
+  由其他进程接管；接管是条件 UPDATE，多个进程同时发现也只有一个能接管成功
+- 没有心跳的旧数据按 updated_at 判断
+启动时接管一次，之后随心跳定期检查，进程崩溃后不必等下一次重启。
+"""
+
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, List, Optional, Set
+
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+# 心跳间隔（秒）
+TASK_HEARTBEAT_INTERVAL = int(os.environ.get("TASK_HEARTBEAT_INTERVAL", "30"))
+# 心跳超时（秒），超过后认为持有任务的进程已经退出
+TASK_HEARTBEAT_TIMEOUT = int(os.environ.get("TASK_HEARTBEAT_TIMEOUT", "120"))
+
+
+def worker_id() -> str:
+    # 每次调用时取 pid：预加载后 fork 出的进程与父进程的 pid 不同
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TaskLease:
+    """
+    model 为任务表（需要 owner、heartbeat_at、updated_at 和 status 列），key 为主键列，
+    active_states 为未完成的状态。
+    """
+
+    def __init__(
+        self,
+        engine,
+        model,
+        key,
+        active_states: Iterable[str],
+        name: str = "task",
+        interval: int = TASK_HEARTBEAT_INTERVAL,
+        timeout: int = TASK_HEARTBEAT_TIMEOUT,
+    ):
+        self.engine = engine
+        self.model = model
+        self.key = key
+        self.active_states = tuple(active_states)
+        self.name = name
+        self.interval = interval
+        self.timeout = timeout
+        self._held: Set[Any] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def stamp(self) -> dict:
+        """创建或重新排队任务时写入的归属字段"""
+        return {"owner": worker_id(), "heartbeat_at": datetime.now()}
+
+    def hold(self, key: Any):
+        with self._lock:
+            self._held.add(key)
+
+    def drop(self, key: Any):
+        with self._lock:
+            self._held.discard(key)
+
+    def beat(self):
+        """刷新本进程持有的任务的心跳"""
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return
+        with Session(self.engine) as session:
+            session.execute(
+                update(self.model)
+                .where(self.key.in_(held), self.model.owner == worker_id())
+                .values(heartbeat_at=datetime.now())
+            )
+            session.commit()
+
+    def _stale(self, cutoff: datetime):
+        return (
+            self.model.status.in_(self.active_states),
+            func.coalesce(self.model.heartbeat_at, self.model.updated_at) < cutoff,
+        )
+
+    def claim_stale(self, **values) -> List[Any]:
+        """接管持有者已经退出的未完成任务，同时写入 values，返回接管到的主键"""
+        cutoff = datetime.now() - timedelta(seconds=self.timeout)
+        claimed = []
+        with Session(self.engine) as session:
+            keys = list(session.exec(select(self.key).where(*self._stale(cutoff))).all())
+            for key in keys:
+                # 条件与查询时相同：其他进程已经接管（心跳已刷新）时不会再更新
+                result = session.execute(
+                    update(self.model)
+                    .where(self.key == key, *self._stale(cutoff))
+                    .values(**self.stamp(), **values)
+                )
+                session.commit()
+                if result.rowcount == 1:
+                    claimed.append(key)
+        if claimed:
+            print(f"TaskLease: 接管 {len(claimed)} 个中断的{self.name}")
+        return claimed
+
+    def _loop(self, on_tick: Optional[Callable[[], None]]):
+        while not self._stop.wait(self.interval):
+            try:
+                self.beat()
+                if on_tick:
+                    on_tick()
+            except Exception as e:
+                print(f"TaskLease error ({self.name}): {e}")
+
+    def start(self, on_tick: Optional[Callable[[], None]] = None):
+        """启动心跳线程；on_tick 在每次心跳后调用（用于定期接管中断的任务）"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, args=(on_tick,), name=f"{self.name}-heartbeat", daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
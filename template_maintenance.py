@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+模板维护命令行工具：按顺序对模板应用一组声明式变换，一次流式处理 OOXML
+
+不经过 python-docx：正文（word/document.xml）和页眉页脚按顶层段落/表格逐个解析、变换、写出，
+内存里只有当前这一个块；其余部件原样复制。支持的变换：
+- replace        占位符替换，Word 把文字拆成多个 run 时也能匹配
+- row_height     表格行高规则（如改为自动行高），并去掉单元格的不换行设置
+- remove_borders 去掉表格边框
+
+用法：
+    python3 template_maintenance.py report_template.docx --preset fields --preset punctuation
+    python3 template_maintenance.py report_template.docx --spec transforms.json --dry-run
+    python3 template_maintenance.py report_template.docx --preset row-height -o fixed.docx
+
+变换文件为 JSON 列表（或 {"transforms": [...]}），例如：
+    [
+        {"op": "replace", "find": "招标控制价****元", "replace": "招标控制价{{ bidding_price_control }}元"},
+        {"op": "replace", "find": "万元；", "replace": "万元{% if loop.last %}。{% else %}；{% endif %}",
+         "within": "adjustments"},
+        {"op": "row_height", "rule": "auto"},
+        {"op": "remove_borders", "table": "咨询项目全称"}
+    ]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from lxml import etree
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BASE_DIR, "report_template.docx")
+
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_W = "{%s}" % _W_NS
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+# 处理的部件：正文、页眉、页脚
+_PART_RE = re.compile(r"^word/(document|header\d*|footer\d*)\.xml$")
+# 根元素下直接放块的部件（页眉页脚），正文的块在 w:body 下
+_CONTAINERS = {_W + "document", _W + "body", _W + "hdr", _W + "ftr"}
+# 复制部件时的块大小
+_CHUNK_SIZE = 1024 * 1024
+
+# tblPr 中排在 tblBorders 之后的元素（按 OOXML 规定的顺序插入）
+_AFTER_TBL_BORDERS = ("shd", "tblLayout", "tblCellMar", "tblLook", "tblCaption", "tblDescription")
+_BORDER_EDGES = ("top", "left", "bottom", "right", "insideH", "insideV")
+_HEIGHT_RULES = ("auto", "atLeast", "exact")
+
+# 内置变换（原 update_template_fields.py / fix_template_punctuation.py / fix_table_row_height.py /
+# convert_template_to_table.py 中的修改）
+PRESETS: Dict[str, List[Dict[str, Any]]] = {
+    "fields": [
+        {"op": "replace", "find": "本工程采用****方式招标", "replace": "本工程采用{{ bidding_method }}方式招标"},
+        {"op": "replace", "find": "招标控制价****元", "replace": "招标控制价{{ bidding_price_control }}元"},
+        {"op": "replace", "find": "中标价****", "replace": "中标价{{ bidding_price_winning }}"},
+        {"op": "replace", "find": "工程质量情况：****合同约定", "replace": "工程质量情况：{{ quality_status }}合同约定"},
+        {"op": "replace", "find": "扣除追加审计费****元", "replace": "扣除追加审计费{{ audit_fee_deduction }}元"},
+        {"op": "replace", "find": "支付追加审计费****元", "replace": "支付追加审计费{{ audit_fee_deduction }}元"},
+        {"op": "replace", "find": "追加审计费:****", "replace": "追加审计费:"},
+        {"op": "replace", "find": "咨询报告书编号：****", "replace": "咨询报告书编号：{{ report_code }}"},
+        {"op": "replace", "find": "咨询项目委托方全称： ****", "replace": "咨询项目委托方全称： {{ client_name }}"},
+        {"op": "replace", "find": "咨询作业期：****—****",
+         "replace": "咨询作业期：{{ audit_period_start }}—{{ audit_period_end }}"},
+    ],
+    # 调整项最后一条用句号，其他条用分号
+    "punctuation": [
+        {"op": "replace", "find": "万元；", "replace": "万元{% if loop.last %}。{% else %}；{% endif %}",
+         "within": "adjustments"},
+    ],
+    "row-height": [
+        {"op": "row_height", "rule": "auto"},
+    ],
+    "borders": [
+        {"op": "remove_borders", "table": "咨询项目全称"},
+    ],
+}
+
+
+class TransformError(Exception):
+    pass
+
+
+@dataclass
+class Change:
+    part: str
+    location: str
+    before: str
+    after: str
+
+
+@dataclass
+class _Block:
+    """当前处理的顶层块（段落或表格）及其在部件中的位置"""
+    part: str
+    index: int
+    element: Any
+    changes: List[Change] = field(default_factory=list)
+
+    @property
+    def location(self) -> str:
+        return f"{etree.QName(self.element).localname}[{self.index}]"
+
+    def record(self, before: str, after: str):
+        self.changes.append(Change(self.part, self.location, before, after))
+
+
+def _text(element) -> str:
+    return "".join(t.text or "" for t in element.iter(_W + "t"))
+
+
+def _own_texts(paragraph) -> List[Any]:
+    """段落自己的 w:t（不含文本框等嵌套段落里的）"""
+    return [t for t in paragraph.iter(_W + "t") if next(t.iterancestors(_W + "p"), None) is paragraph]
+
+
+def _text_of(nodes) -> str:
+    return "".join(t.text or "" for t in nodes)
+
+
+# --- 变换 ---
+def _replace(spec: Dict[str, Any]) -> Callable[[_Block], None]:
+    find = spec.get("find")
+    if not find:
+        raise TransformError("replace 需要 find")
+    replace = spec.get("replace", "")
+    pattern = re.compile(find if spec.get("regex") else re.escape(find))
+    within = spec.get("within")
+
+    def apply(block: _Block):
+        for paragraph in block.element.iter(_W + "p"):
+            nodes = _own_texts(paragraph)
+            texts = [t.text or "" for t in nodes]
+            full = "".join(texts)
+            if within and within not in full:
+                continue
+            matches = list(pattern.finditer(full))
+            if not matches:
+                continue
+            starts = []
+            offset = 0
+            for text in texts:
+                starts.append(offset)
+                offset += len(text)
+
+            def node_at(pos: int) -> int:
+                return next(i for i, text in enumerate(texts) if starts[i] <= pos < starts[i] + len(text))
+
+            # 从后往前替换，前面的偏移不受影响；替换文字放在匹配开头所在的 run 里，沿用它的格式。
+            # 替换前后相同的匹配不动节点，全部相同时段落不记为修改
+            changed = False
+            for match in reversed(matches):
+                if match.start() == match.end():
+                    continue
+                new = match.expand(replace) if spec.get("regex") else replace
+                if new == match.group():
+                    continue
+                changed = True
+                first, last = node_at(match.start()), node_at(match.end() - 1)
+                head = nodes[first].text or ""
+                tail = nodes[last].text or ""
+                if first == last:
+                    nodes[first].text = head[:match.start() - starts[first]] + new + head[match.end() - starts[first]:]
+                else:
+                    nodes[first].text = head[:match.start() - starts[first]] + new
+                    for node in nodes[first + 1:last]:
+                        node.text = ""
+                    nodes[last].text = tail[match.end() - starts[last]:]
+                for node in {nodes[first], nodes[last]}:
+                    node.set(_XML_SPACE, "preserve")
+            if changed:
+                block.record(full, _text_of(nodes))
+
+    return apply
+
+
+def _tables(block: _Block, spec: Dict[str, Any]):
+    """块中的表格；指定 table 时只处理文字包含它的表格"""
+    keyword = spec.get("table")
+    for tbl in block.element.iter(_W + "tbl"):
+        if keyword and keyword not in _text(tbl):
+            continue
+        yield tbl
+
+
+def _row_height(spec: Dict[str, Any]) -> Callable[[_Block], None]:
+    rule = spec.get("rule", "auto")
+    if rule not in _HEIGHT_RULES:
+        raise TransformError(f"row_height 的 rule 只能是 {', '.join(_HEIGHT_RULES)}")
+    height = spec.get("height")
+    wrap = spec.get("wrap", True)
+
+    def apply(block: _Block):
+        for tbl in _tables(block, spec):
+            for row, tr in enumerate(tbl.findall(_W + "tr"), start=1):
+                tr_pr = tr.find(_W + "trPr")
+                if tr_pr is None:
+                    tr_pr = etree.Element(_W + "trPr")
+                    # trPr 在 tblPrEx 之后、单元格之前
+                    tr.insert(1 if len(tr) and tr[0].tag == _W + "tblPrEx" else 0, tr_pr)
+                tr_height = tr_pr.find(_W + "trHeight")
+                if tr_height is None:
+                    tr_height = etree.SubElement(tr_pr, _W + "trHeight")
+                before = f"hRule={tr_height.get(_W + 'hRule')} val={tr_height.get(_W + 'val')}"
+                tr_height.set(_W + "hRule", rule)
+                if height is not None:
+                    tr_height.set(_W + "val", str(int(height)))
+                after = f"hRule={rule} val={tr_height.get(_W + 'val')}"
+                if before != after:
+                    block.record(f"第 {row} 行 {before}", f"第 {row} 行 {after}")
+                if wrap:
+                    for no_wrap in tr.findall(f"{_W}tc/{_W}tcPr/{_W}noWrap"):
+                        no_wrap.getparent().remove(no_wrap)
+                        block.record(f"第 {row} 行 noWrap", f"第 {row} 行 (自动换行)")
+
+    return apply
+
+
+def _remove_borders(spec: Dict[str, Any]) -> Callable[[_Block], None]:
+    cells = spec.get("cells", True)
+
+    def apply(block: _Block):
+        for tbl in _tables(block, spec):
+            tbl_pr = tbl.find(_W + "tblPr")
+            if tbl_pr is None:
+                tbl_pr = etree.Element(_W + "tblPr")
+                tbl.insert(0, tbl_pr)
+            old = tbl_pr.find(_W + "tblBorders")
+            if old is not None and all(
+                (old.find(_W + edge) is not None and old.find(_W + edge).get(_W + "val") == "none")
+                for edge in _BORDER_EDGES
+            ):
+                continue
+            if old is not None:
+                tbl_pr.remove(old)
+            borders = etree.Element(_W + "tblBorders")
+            for edge in _BORDER_EDGES:
+                etree.SubElement(borders, _W + edge, {_W + "val": "none", _W + "sz": "0",
+                                                      _W + "space": "0", _W + "color": "auto"})
+            anchor = next((c for c in tbl_pr if etree.QName(c).localname in _AFTER_TBL_BORDERS), None)
+            if anchor is not None:
+                anchor.addprevious(borders)
+            else:
+                tbl_pr.append(borders)
+            if cells:
+                for tc_borders in tbl.iter(_W + "tcBorders"):
+                    tc_borders.getparent().remove(tc_borders)
+            block.record(f"表格边框 {_text(tbl)[:30]}", "无边框")
+
+    return apply
+
+
+TRANSFORMS: Dict[str, Callable[[Dict[str, Any]], Callable[[_Block], None]]] = {
+    "replace": _replace,
+    "row_height": _row_height,
+    "remove_borders": _remove_borders,
+}
+
+
+def compile_transforms(specs: List[Dict[str, Any]]) -> List[Callable[[_Block], None]]:
+    result = []
+    for i, spec in enumerate(specs, start=1):
+        factory = TRANSFORMS.get(spec.get("op")) if isinstance(spec, dict) else None
+        if factory is None:
+            raise TransformError(f"第 {i} 个变换的 op 未知: {spec!r}")
+        result.append(factory(spec))
+    return result
+
+
+# --- 流式处理 ---
+def _start_tag(element) -> bytes:
+    """容器元素的开始标签（含属性和命名空间声明）"""
+    shell = etree.Element(element.tag, attrib=dict(element.attrib), nsmap=element.nsmap)
+    return etree.tostring(shell, encoding="UTF-8", xml_declaration=False)[:-2] + b">"
+
+
+def _end_tag(element) -> bytes:
+    name = etree.QName(element).localname
+    return (f"</{element.prefix}:{name}>" if element.prefix else f"</{name}>").encode("utf-8")
+
+
+def _strip_declarations(data: bytes, declarations: List[bytes]) -> bytes:
+    """块单独序列化时会带上根元素上的全部命名空间声明，去掉开始标签里与根元素重复的部分"""
+    end = data.index(b">")
+    head = data[:end]
+    for declaration in declarations:
+        head = head.replace(declaration, b"", 1)
+    return head + data[end:]
+
+
+def transform_part(part: str, source, target, transforms: List[Callable[[_Block], None]]) -> List[Change]:
+    """逐块解析部件 XML，变换后立即写出并释放，返回修改记录"""
+    changes: List[Change] = []
+    # 已写出开始标签的容器元素（w:document、w:body、w:hdr、w:ftr）
+    containers: List[Any] = []
+    declarations: List[bytes] = []
+    counts: Dict[str, int] = {}
+    target.write(b"<?xml version=\"1.0\" encoding=\"UTF-8\" standalone=\"yes\"?>\r\n")
+    for event, element in etree.iterparse(source, events=("start", "end"), huge_tree=True):
+        if event == "start":
+            if element.tag in _CONTAINERS and (not containers or element.getparent() is containers[-1]):
+                tag = _start_tag(element)
+                if containers:
+                    tag = _strip_declarations(tag, declarations)
+                else:
+                    declarations = [
+                        (f' xmlns:{prefix}="{uri}"' if prefix else f' xmlns="{uri}"').encode("utf-8")
+                        for prefix, uri in element.nsmap.items()
+                    ]
+                target.write(tag)
+                containers.append(element)
+            continue
+        if containers and element is containers[-1]:
+            containers.pop()
+            target.write(_end_tag(element))
+            continue
+        if not containers or element.getparent() is not containers[-1]:
+            continue
+        name = etree.QName(element).localname
+        counts[name] = counts.get(name, 0) + 1
+        block = _Block(part, counts[name], element)
+        for transform in transforms:
+            transform(block)
+        changes.extend(block.changes)
+        data = etree.tostring(element, encoding="UTF-8", xml_declaration=False, with_tail=False)
+        target.write(_strip_declarations(data, declarations))
+        # 写出后释放，内存里只保留当前块
+        element.clear()
+        element.getparent().remove(element)
+    return changes
+
+
+def transform_docx(src: str, dest: Optional[str], transforms: List[Callable[[_Block], None]]) -> List[Change]:
+    """
+    对 src 应用变换写入 dest；dest 为 None 时只返回修改记录（试运行）。
+    正文、页眉、页脚逐块流式变换，其余部件按块原样复制
+    """
+    changes: List[Change] = []
+    with zipfile.ZipFile(src) as zin:
+        if dest is None:
+            for info in zin.infolist():
+                if _PART_RE.match(info.filename):
+                    with zin.open(info) as source:
+                        changes.extend(transform_part(info.filename, source, _NullWriter(), transforms))
+            return changes
+        with zipfile.ZipFile(dest, "w") as zout:
+            for info in zin.infolist():
+                with zin.open(info) as source, zout.open(_copy_info(info), "w", force_zip64=True) as target:
+                    if _PART_RE.match(info.filename):
+                        changes.extend(transform_part(info.filename, source, target, transforms))
+                    else:
+                        shutil.copyfileobj(source, target, _CHUNK_SIZE)
+    return changes
+
+
+class _NullWriter:
+    def write(self, data):
+        return len(data)
+
+
+def _copy_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    new = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    new.compress_type = info.compress_type
+    new.external_attr = info.external_attr
+    return new
+
+
+def print_changes(changes: List[Change]):
+    """按部件和位置输出修改前后的对比"""
+    for change in changes:
+        print(f"@@ {change.part} {change.location}")
+        print(f"- {change.before}")
+        print(f"+ {change.after}")
+
+
+def load_specs(presets: List[str], spec_path: Optional[str]) -> List[Dict[str, Any]]:
+    specs: List[Dict[str, Any]] = []
+    for name in presets:
+        specs.extend(PRESETS[name])
+    if spec_path:
+        with open(spec_path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+        if isinstance(loaded, dict):
+            loaded = loaded.get("transforms")
+        if not isinstance(loaded, list):
+            raise TransformError("变换文件应为 JSON 列表或 {\"transforms\": [...]}")
+        specs.extend(loaded)
+    return specs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="模板维护：对 Word 模板批量应用变换")
+    parser.add_argument("template", nargs="?", default=TEMPLATE_PATH, help="模板路径，默认 report_template.docx")
+    parser.add_argument("--preset", action="append", default=[], choices=sorted(PRESETS),
+                        help="内置变换，可重复，按给出的顺序执行")
+    parser.add_argument("--spec", help="变换定义 JSON 文件，在内置变换之后执行")
+    parser.add_argument("-o", "--output", help="输出路径，默认覆盖原模板")
+    parser.add_argument("--dry-run", action="store_true", help="只显示将要做的修改，不写文件")
+    parser.add_argument("--no-backup", action="store_true", help="覆盖原模板时不保留备份")
+    args = parser.parse_args(argv)
+
+    try:
+        specs = load_specs(args.preset, args.spec)
+        if not specs:
+            parser.error("请指定 --preset 或 --spec")
+        transforms = compile_transforms(specs)
+    except (OSError, ValueError, TransformError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    if args.dry_run:
+        changes = transform_docx(args.template, None, transforms)
+        print_changes(changes)
+        print(f"🔍 共 {len(changes)} 处修改（试运行，未写入）")
+        return 0
+
+    output = os.path.abspath(args.output or args.template)
+    # 先写到同目录的临时文件，完成后再替换，失败时原文件不受影响
+    fd, tmp_path = tempfile.mkstemp(suffix=".docx", dir=os.path.dirname(output))
+    os.close(fd)
+    try:
+        changes = transform_docx(args.template, tmp_path, transforms)
+        if not changes and output == os.path.abspath(args.template):
+            # 没有实际修改时不改写原模板（也不生成备份）
+            os.remove(tmp_path)
+            print(f"✅ 没有需要修改的内容，未改写: {output}")
+            return 0
+        if output == os.path.abspath(args.template) and not args.no_backup:
+            backup_path = os.path.splitext(output)[0] + "_backup.docx"
+            shutil.copy2(output, backup_path)
+            print(f"✅ 已备份原模板到: {backup_path}")
+        os.replace(tmp_path, output)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    print_changes(changes)
+    print(f"✅ 共 {len(changes)} 处修改，已写入: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
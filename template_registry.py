@@ -0,0 +1,211 @@
+"""
+报告模板注册表（一次解析，多次渲染）
+
+DocxTemplate 每次构造都要解压 docx、解析 XML、预处理并重新编译 Jinja 模板。
+这里每个模板只加载一次，缓存：
+- 预处理后的正文/页眉/页脚 XML 编译出的 Jinja 模板
+- document.xml 中正文以外的前后缀
+- docx 包内其余文件的原始内容
+
+每次渲染只执行 Jinja 渲染和表格修正，然后直接写出 zip，不再经过 python-docx 对象模型。
+模板文件的 mtime/大小变化时重新计算内容哈希，哈希变化则自动重新加载。
+
+注意：快速路径只支持纯数据上下文（不支持 InlineImage / Subdoc / 图片替换），
+模板的文档属性中含有 Jinja 标签时自动退回到 DocxTemplate 的完整渲染流程。
+"""
+
+import copy
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+from typing import Any, Dict, IO, List, Optional, Tuple, Union
+
+import docx.oxml.ns
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+from lxml import etree
+
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+CORE_PROPERTIES = ["author", "comments", "identifier", "language", "subject", "title"]
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _has_jinja(text: Optional[str]) -> bool:
+    return bool(text) and ("{{" in text or "{%" in text)
+
+
+class CompiledTemplate(DocxTemplate):
+    """预编译好的 docx 模板，渲染过程只读，可在多线程间共享"""
+
+    def __init__(self, name: str, path: str, digest: str, stat_key: Tuple[int, int]):
+        with open(path, "rb") as f:
+            blob = f.read()
+        super().__init__(io.BytesIO(blob))
+        self.name = name
+        self.path = path
+        self.digest = digest
+        self.stat_key = stat_key
+        self.blob = blob
+        self.jinja_env = Environment()
+        # zip 内文件名 -> (ZipInfo, 原始内容)
+        self._zip_items: List[Tuple[zipfile.ZipInfo, bytes]] = []
+        # 需要渲染的部件：zip 内文件名 -> (前缀, 编译后的模板, 后缀, 编码)
+        self._parts: Dict[str, Any] = {}
+        self._document_name = ""
+        # 正文、页眉页脚的原始 XML（供分段渲染拆分和字段分析）
+        self.body_xml = ""
+        self.part_sources: Dict[str, str] = {}
+        self.fast_path = True
+        self._compile()
+        # 编译完成后不再需要 python-docx 对象，释放内存
+        self.docx = None
+
+    def _compile(self):
+        self.init_docx()
+        document = self.docx
+
+        with zipfile.ZipFile(io.BytesIO(self.blob)) as zin:
+            self._zip_items = [(item, zin.read(item.filename)) for item in zin.infolist()]
+
+        if any(_has_jinja(getattr(document.core_properties, p)) for p in CORE_PROPERTIES):
+            self.fast_path = False
+            return
+
+        # 正文：document.xml 拆成 body 前后缀 + body 模板
+        root = copy.deepcopy(document._element)
+        body = root.find(docx.oxml.ns.qn("w:body"))
+        root.replace(body, etree.Element(docx.oxml.ns.qn("w:body")))
+        root_xml = etree.tostring(root, encoding="unicode")
+        prefix, suffix = re.split(r"<w:body\s*/>", root_xml, maxsplit=1)
+        self._document_name = document.part.partname.lstrip("/")
+        self.body_xml = self.get_xml()
+        self._parts[self._document_name] = (
+            XML_DECLARATION + prefix,
+            self._compile_xml(self.patch_xml(self.body_xml)),
+            suffix,
+            "utf-8",
+        )
+
+        # 页眉/页脚
+        for uri in (self.HEADER_URI, self.FOOTER_URI):
+            for _, part in self.get_headers_footers(uri):
+                xml = self.get_part_xml(part)
+                encoding = self.get_headers_footers_encoding(xml)
+                self.part_sources[part.partname.lstrip("/")] = xml
+                self._parts[part.partname.lstrip("/")] = (
+                    XML_DECLARATION,
+                    self._compile_xml(self.patch_xml(xml)),
+                    "",
+                    encoding,
+                )
+
+    def _compile_xml(self, src_xml: str):
+        src_xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
+        return self.jinja_env.from_string(src_xml)
+
+    def _render_part(self, compiled, context: Dict[str, Any]) -> str:
+        # 与 DocxTemplate.render_xml_part 的后处理保持一致
+        dst_xml = compiled.render(context)
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (dst_xml
+                   .replace("{_{", "{{")
+                   .replace("}_}", "}}")
+                   .replace("{_%", "{%")
+                   .replace("%_}", "%}"))
+        return self.resolve_listing(dst_xml)
+
+    def _render_body(self, compiled, context: Dict[str, Any]) -> str:
+        tree = self.fix_tables(self._render_part(compiled, context))
+        # 与 DocxTemplate.fix_docpr_ids 相同的编号规则，但使用局部计数器保证线程安全
+        for i, elt in enumerate(tree.xpath("//wp:docPr", namespaces=docx.oxml.ns.nsmap)):
+            elt.attrib["id"] = str(1001 + i)
+        return etree.tostring(tree, encoding="unicode")
+
+    def compile_body(self, body_xml: str):
+        """编译一段正文（<w:body> 元素），用于只渲染文档的一部分"""
+        return self._compile_xml(self.patch_xml(body_xml))
+
+    def render_to(self, context: Dict[str, Any], target: Union[str, IO[bytes]], body=None):
+        """渲染并写出 docx 到文件路径或文件对象；body 为 compile_body 的结果时以它代替完整正文"""
+        if not self.fast_path:
+            tpl = DocxTemplate(io.BytesIO(self.blob))
+            tpl.render(context)
+            tpl.save(target)
+            return
+
+        rendered: Dict[str, bytes] = {}
+        for zip_name, (prefix, compiled, suffix, encoding) in self._parts.items():
+            if zip_name == self._document_name:
+                xml = self._render_body(body if body is not None else compiled, context)
+            else:
+                xml = self._render_part(compiled, context)
+            rendered[zip_name] = (prefix + xml + suffix).encode(encoding)
+
+        with zipfile.ZipFile(target, "w") as zout:
+            for item, data in self._zip_items:
+                zout.writestr(item, rendered.get(item.filename, data))
+
+
+class TemplateRegistry:
+    """按名称管理多个报告模板，文件变化时热加载"""
+
+    def __init__(self):
+        self._paths: Dict[str, str] = {}
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, path: str):
+        with self._lock:
+            self._paths[name] = path
+            self._templates.pop(name, None)
+
+    def register_dir(self, directory: str):
+        """将目录下的每个 .docx 以文件名（不含扩展名）注册为模板"""
+        if not os.path.isdir(directory):
+            return
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".docx") and not filename.startswith("~"):
+                self.register(os.path.splitext(filename)[0], os.path.join(directory, filename))
+
+    def names(self) -> List[str]:
+        return list(self._paths)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._paths
+
+    def get(self, name: str) -> CompiledTemplate:
+        path = self._paths.get(name)
+        if path is None:
+            raise KeyError(f"Unknown template: {name}")
+        if not os.path.exists(path):
+            raise FileNotFoundError("Template file not found")
+
+        st = os.stat(path)
+        stat_key = (st.st_mtime_ns, st.st_size)
+        tpl = self._templates.get(name)
+        if tpl is not None and tpl.stat_key == stat_key:
+            return tpl
+
+        with self._lock:
+            tpl = self._templates.get(name)
+            if tpl is not None and tpl.stat_key == stat_key:
+                return tpl
+            digest = file_digest(path)
+            if tpl is not None and tpl.digest == digest:
+                # 只是被 touch 过，内容没变
+                tpl.stat_key = stat_key
+                return tpl
+            print(f"TemplateRegistry: 加载模板 {name} ({path})")
+            tpl = CompiledTemplate(name, path, digest, stat_key)
+            self._templates[name] = tpl
+            return tpl
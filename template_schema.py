@@ -0,0 +1,269 @@
+"""
+模板字段分析：模板实际用到了哪些变量
+
+每个模板（按内容哈希）分析一次：
+- 由 Jinja 语法树得出顶层变量、循环（如 {%tr for item in adjustments %} 及循环体里用到的 item.content）、
+  对象属性（如 project.name）和过滤器
+- 扫描正文和页眉页脚的 XML，记录每个标签所在的段落（XPath），方便定位和维护模板
+
+服务端据此：
+- 提供字段清单接口（/api/templates/{name}/schema）
+- 渲染前去掉模板用不到的字段，预览缓存键只由用到的字段决定，
+  表单里改了与报告无关的字段不会让预览缓存失效
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from jinja2 import Environment, TemplateSyntaxError, nodes
+from lxml import etree
+
+from template_registry import CompiledTemplate
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_TAG_RE = re.compile(r"\{\{.*?\}\}|\{%.*?%\}", re.DOTALL)
+# docxtpl 的 {%tr ...%} {{r ...}} 等扩展前缀
+_DOCXTPL_PREFIX_RE = re.compile(r"^(tr|tc|p|r)\s+")
+_FOR_RE = re.compile(r"^for\s+(.+?)\s+in\s+(.+?)(?:\s+if\s+.+)?$", re.DOTALL)
+_EXPR_STATEMENT_RE = re.compile(r"^(if|elif|set\s+\w+\s*=|colspan|cellbg)\s+(.+)$", re.DOTALL)
+
+# 记住分析结果的模板版本数
+_SCHEMA_CACHE_SIZE = 32
+
+
+@dataclass
+class VariableInfo:
+    name: str
+    kind: str = "scalar" # scalar / loop / object
+    # 循环变量或对象上访问的属性
+    fields: Set[str] = field(default_factory=set)
+    filters: Set[str] = field(default_factory=set)
+    locations: List[Dict[str, str]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "fields": sorted(self.fields),
+            "filters": sorted(self.filters),
+            "locations": self.locations,
+        }
+
+
+@dataclass
+class TemplateSchema:
+    name: str
+    digest: str
+    # 模板走 DocxTemplate 完整流程时文档属性里也可能有变量，分析结果不完整，不能据此裁剪数据
+    complete: bool = True
+    variables: Dict[str, VariableInfo] = field(default_factory=dict)
+    errors: List[str] = field(default_factory=list)
+
+    def _variable(self, name: str) -> VariableInfo:
+        info = self.variables.get(name)
+        if info is None:
+            info = self.variables[name] = VariableInfo(name=name)
+        return info
+
+    def filters(self) -> Dict[str, List[str]]:
+        result: Dict[str, Set[str]] = {}
+        for info in self.variables.values():
+            for name in info.filters:
+                result.setdefault(name, set()).add(info.name)
+        return {name: sorted(names) for name, names in sorted(result.items())}
+
+    def payload_keys(self, derived: Optional[Mapping[str, Iterable[str]]] = None) -> Set[str]:
+        """数据中需要保留的键：模板用到的变量，以及派生字段（如金额大写）的来源字段"""
+        keys = set(self.variables)
+        for name, sources in (derived or {}).items():
+            if name in keys:
+                keys.update(sources)
+        return keys
+
+    def trim(self, data: Dict[str, Any],
+             derived: Optional[Mapping[str, Iterable[str]]] = None) -> Tuple[Dict[str, Any], List[str]]:
+        """返回 (只含用到的字段的数据, 被去掉的键)；分析不完整时原样返回"""
+        if not self.complete:
+            return data, []
+        keys = self.payload_keys(derived)
+        unused = sorted(k for k in data if k not in keys)
+        if not unused:
+            return data, []
+        return {k: v for k, v in data.items() if k in keys}, unused
+
+    def missing(self, data: Dict[str, Any], derived: Optional[Mapping[str, Iterable[str]]] = None) -> List[str]:
+        derived = derived or {}
+        return sorted(name for name in self.variables if name not in data and name not in derived)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "template": self.name,
+            "digest": self.digest,
+            "complete": self.complete,
+            "variables": [info.to_dict() for _, info in sorted(self.variables.items())],
+            "loops": sorted(name for name, info in self.variables.items() if info.kind == "loop"),
+            "filters": self.filters(),
+            "errors": self.errors,
+        }
+
+
+def _target_names(target) -> List[str]:
+    """for/set 的目标（单个名称或元组）里的变量名"""
+    if isinstance(target, nodes.Name):
+        return [target.name]
+    return [n.name for n in target.find_all(nodes.Name)]
+
+
+class _Analyzer:
+    """遍历 Jinja 语法树，区分顶层变量、循环变量和模板内部定义的变量"""
+
+    def __init__(self, schema: TemplateSchema):
+        self.schema = schema
+        # 循环变量名 -> 循环来源的顶层变量（用于把标签位置归到来源变量上）
+        self.loop_targets: Dict[str, str] = {}
+
+    def _root(self, node, scope: Dict[str, Optional[str]]) -> Tuple[Optional[str], bool]:
+        """表达式的根变量：(名称, 是否为循环变量)；模板内部定义的变量返回 (None, False)"""
+        while isinstance(node, (nodes.Getattr, nodes.Getitem)):
+            node = node.node
+        if not isinstance(node, nodes.Name):
+            return None, False
+        if node.name in scope:
+            source = scope[node.name]
+            return (source, True) if source else (None, False)
+        if node.name == "loop":
+            return None, False
+        return node.name, False
+
+    def visit(self, node, scope: Dict[str, Optional[str]]):
+        if isinstance(node, nodes.For):
+            self.visit(node.iter, scope)
+            source, _ = self._root(node.iter, scope)
+            inner = dict(scope)
+            for target in _target_names(node.target):
+                inner[target] = source
+                if source:
+                    self.loop_targets[target] = source
+            if source:
+                self.schema._variable(source).kind = "loop"
+            for child in node.body + node.else_:
+                self.visit(child, inner)
+            if node.test is not None:
+                self.visit(node.test, inner)
+            return
+        if isinstance(node, (nodes.Assign, nodes.AssignBlock)):
+            for child in ([node.node] if isinstance(node, nodes.Assign) else node.body):
+                self.visit(child, scope)
+            for target in _target_names(node.target):
+                scope[target] = None
+            return
+        if isinstance(node, (nodes.Macro, nodes.CallBlock)):
+            inner = dict(scope)
+            for arg in getattr(node, "args", []):
+                inner[arg.name] = None
+            if isinstance(node, nodes.Macro):
+                inner[node.name] = None
+                scope[node.name] = None
+            for child in node.iter_child_nodes():
+                self.visit(child, inner)
+            return
+        if isinstance(node, nodes.Filter):
+            name, _ = self._root(node.node, scope) if node.node is not None else (None, False)
+            if name:
+                self.schema._variable(name).filters.add(node.name)
+        if isinstance(node, (nodes.Getattr, nodes.Getitem)) and isinstance(node.node, nodes.Name):
+            name, is_loop = self._root(node.node, scope)
+            attr = node.attr if isinstance(node, nodes.Getattr) else getattr(node.arg, "value", None)
+            if name and isinstance(attr, str):
+                info = self.schema._variable(name)
+                info.fields.add(attr)
+                if not is_loop and info.kind == "scalar":
+                    info.kind = "object"
+        if isinstance(node, nodes.Name) and node.ctx == "load":
+            name, _ = self._root(node, scope)
+            if name:
+                self.schema._variable(name)
+        for child in node.iter_child_nodes():
+            self.visit(child, scope)
+
+
+def _tag_expression(tag: str) -> Optional[str]:
+    """从单个标签里取出可以单独解析的表达式"""
+    inner = tag[2:-2].strip().strip("-").strip()
+    if tag.startswith("{{"):
+        return _DOCXTPL_PREFIX_RE.sub("", inner)
+    inner = _DOCXTPL_PREFIX_RE.sub("", inner)
+    match = _FOR_RE.match(inner)
+    if match:
+        return match.group(2)
+    match = _EXPR_STATEMENT_RE.match(inner)
+    if match:
+        return match.group(2)
+    return None
+
+
+def _locate(schema: TemplateSchema, part: str, xml: str, env: Environment, loop_targets: Dict[str, str]):
+    root = etree.fromstring(xml.encode("utf-8") if isinstance(xml, str) else xml)
+    tree = etree.ElementTree(root)
+    for paragraph in root.iter(_W + "p"):
+        text = "".join(t.text or "" for t in paragraph.iter(_W + "t"))
+        if "{" not in text:
+            continue
+        for match in _TAG_RE.finditer(text):
+            tag = match.group()
+            expression = _tag_expression(tag)
+            if not expression:
+                continue
+            try:
+                parsed = env.parse("{{ " + expression + " }}")
+            except TemplateSyntaxError:
+                continue
+            names = {n.name for n in parsed.find_all(nodes.Name) if n.ctx == "load"}
+            for name in sorted(names):
+                name = loop_targets.get(name, name)
+                if name in schema.variables:
+                    schema.variables[name].locations.append(
+                        {"part": part, "path": tree.getpath(paragraph), "tag": tag}
+                    )
+
+
+def analyze_template(tpl: CompiledTemplate) -> TemplateSchema:
+    schema = TemplateSchema(name=tpl.name, digest=tpl.digest, complete=tpl.fast_path)
+    env = Environment()
+    analyzer = _Analyzer(schema)
+    parts = [("word/document.xml", tpl.body_xml)] + list(tpl.part_sources.items())
+    for part, xml in parts:
+        if not xml:
+            continue
+        try:
+            analyzer.visit(env.parse(tpl.patch_xml(xml)), {})
+        except TemplateSyntaxError as e:
+            schema.complete = False
+            schema.errors.append(f"{part}: {e}")
+    for part, xml in parts:
+        if xml:
+            _locate(schema, part, xml, env, analyzer.loop_targets)
+    return schema
+
+
+_schemas: Dict[Tuple[str, str], TemplateSchema] = {}
+_schemas_lock = threading.Lock()
+
+
+def template_schema(tpl: CompiledTemplate) -> TemplateSchema:
+    """按模板内容哈希缓存分析结果，每个模板版本只分析一次"""
+    key = (tpl.name, tpl.digest)
+    with _schemas_lock:
+        schema = _schemas.get(key)
+    if schema is not None:
+        return schema
+    schema = analyze_template(tpl)
+    with _schemas_lock:
+        for old in [k for k in _schemas if k[0] == tpl.name]:
+            del _schemas[old]
+        _schemas[key] = schema
+        while len(_schemas) > _SCHEMA_CACHE_SIZE:
+            del _schemas[next(iter(_schemas))]
+    return schema
@@ -0,0 +1,114 @@
+"""
+chinese_amount 的正确性测试：把大写结果解析回数字与输入比较，并检查零的写法
+
+覆盖 0-99999 元全部整数、万/亿/兆 边界、随机金额，以及随机置零制造的连续零和全零的组。
+计时见 bench_amount.py。
+
+用法: python -m pytest -q test_chinese_amount.py
+"""
+
+import random
+
+import pytest
+
+from chinese_amount import (
+    DIGITS, GROUP_UNITS, MAX_YUAN, WAN, amount_to_chinese, amounts_to_chinese, fen_to_chinese, to_fen,
+)
+
+_PLACE_VALUES = {"拾": 10, "佰": 100, "仟": 1000}
+_GROUP_VALUES = {unit: 10 ** (4 * i) for i, unit in enumerate(GROUP_UNITS) if unit}
+# 任何金额中都不应出现的写法（"零元" 只出现在不足一元的金额里）
+_BAD_ZEROS = ("零零", "零万", "零亿", "零兆", "零元", "零角", "零分")
+SAMPLES = 20000
+
+
+def parse_chinese(text: str) -> int:
+    """把大写金额解析回分（独立于被测实现，只用于检查）"""
+    sign = 1
+    if text.startswith("负"):
+        sign, text = -1, text[1:]
+    yuan_text, _, rest = text.partition("元")
+    total = group = digit = 0
+    for ch in yuan_text:
+        if ch in _PLACE_VALUES:
+            group += digit * _PLACE_VALUES[ch]
+            digit = 0
+        elif ch in _GROUP_VALUES:
+            total += (group + digit) * _GROUP_VALUES[ch]
+            group = digit = 0
+        else:
+            digit = DIGITS.index(ch)
+    fen = (total + group + digit) * 100
+    if rest != "整":
+        for value, unit in zip(rest[::2], rest[1::2]):
+            fen += DIGITS.index(value) * (10 if unit == "角" else 1)
+    return sign * fen
+
+
+def check(fen: int):
+    text = fen_to_chinese(fen)
+    assert parse_chinese(text) == fen, (fen, text)
+    for bad in _BAD_ZEROS:
+        assert bad not in text or (bad == "零元" and abs(fen) < 100), (fen, text)
+
+
+def test_every_yuan_below_100000():
+    # 覆盖组内各种零的位置和第一个万位边界
+    for yuan in range(100000):
+        check(yuan * 100)
+
+
+def test_group_boundaries():
+    # 10^k 附近、只有首尾非零、中间整组为零
+    for k in range(1, 4 * len(GROUP_UNITS)):
+        for base in (10 ** k, 10 ** k + 1, 10 ** k - 1, 10 ** k + 10 ** (k // 2)):
+            check(base * 100)
+            check(base * 100 + 5)
+            check(-base * 100)
+    check(MAX_YUAN * 100 + 99)
+
+
+def test_random_amounts():
+    rng = random.Random(0)
+    for _ in range(SAMPLES):
+        fen = rng.randrange(0, (MAX_YUAN + 1) * 100)
+        check(fen)
+        check(-fen)
+
+
+def test_zero_runs():
+    # 随机挑几位置零，制造连续的零和全零的组
+    rng = random.Random(1)
+    for _ in range(SAMPLES):
+        digits = list(str(rng.randrange(10 ** 15, 10 ** 16)))
+        for i in rng.sample(range(1, 16), rng.randrange(1, 15)):
+            digits[i] = "0"
+        check(int("".join(digits)) * 100 + rng.randrange(100))
+
+
+@pytest.mark.parametrize("amount, text", [
+    (0, "零元整"),
+    (0.05, "零元伍分"),
+    (10, "壹拾元整"),
+    (100100, "壹拾万零壹佰元整"),
+    (100000001, "壹亿零壹元整"),
+    (14800000.00, "壹仟肆佰捌拾万元整"),
+    (-3.2, "负叁元贰角"),
+    ("1,234.56", "壹仟贰佰叁拾肆元伍角陆分"),
+])
+def test_known_amounts(amount, text):
+    assert amount_to_chinese(amount) == text
+
+
+def test_to_fen_rounds_decimally():
+    assert to_fen(0.285) == 29
+    assert to_fen("¥1,000.005") == 100001
+    assert to_fen(1.5, WAN) == 1500000
+
+
+def test_too_large_and_invalid():
+    with pytest.raises(ValueError):
+        fen_to_chinese((MAX_YUAN + 1) * 100)
+    with pytest.raises(ValueError):
+        amount_to_chinese("abc")
+    assert amounts_to_chinese(["abc", 1], invalid="") == ["", "壹元整"]
@@ -0,0 +1,22 @@
+"""
+数据库并发回归测试：多个进程 × 多个线程同时保存项目数据和上传文件（见 bench_db_concurrency.py），
+出现 "database is locked"、其他请求错误或引用计数不一致时失败。
+
+用法: python -m pytest -q test_db_concurrency.py
+"""
+
+import bench_db_concurrency
+
+# 模拟 3 个 uvicorn worker，每个 4 个线程
+PROCS = 3
+THREADS = 4
+ROUNDS = 5
+
+
+def test_concurrent_save_and_upload_are_not_locked():
+    result = bench_db_concurrency.run(PROCS, THREADS, ROUNDS, verbose=False)
+    locked = [e for e in result["errors"] if "database is locked" in e]
+    assert not locked, f"{len(locked)} 个请求遇到 database is locked，例如: {locked[:3]}"
+    assert not result["errors"], f"{len(result['errors'])} 个请求失败，例如: {result['errors'][:3]}"
+    assert result["consistent"], "文件记录数或引用计数与成功上传数不一致"
+    assert len(result["latencies"]["save"]) == PROCS * THREADS * ROUNDS
@@ -0,0 +1,50 @@
+"""
+json_patch 的回归测试：格式错误的补丁应抛出 PatchError（接口返回 422），而不是其他异常（接口返回 500）
+
+用法: python -m pytest -q test_json_patch.py
+"""
+
+import json
+
+import pytest
+
+from json_patch import JSON_PATCH, MERGE_PATCH, PatchError, patch_document, touched_keys
+
+DATA = json.dumps({"x": 0, "y": {"a": 1}}, ensure_ascii=False)
+
+
+def test_from_on_add_is_ignored():
+    # 只有 move/copy 读取 from，其他操作带一个非字符串的 from 不影响结果
+    new_json, changed, removed = patch_document(
+        DATA, JSON_PATCH, [{"op": "add", "path": "/x", "value": 1, "from": 5}]
+    )
+    assert json.loads(new_json) == {"x": 1, "y": {"a": 1}}
+    assert changed == {"x": 1}
+    assert removed == []
+
+
+def test_touched_keys_ignores_from_on_other_ops():
+    assert touched_keys(JSON_PATCH, [{"op": "replace", "path": "/x", "value": 1, "from": "/y"}]) == {"x"}
+    assert touched_keys(JSON_PATCH, [{"op": "move", "path": "/x", "from": "/y"}]) == {"x", "y"}
+
+
+@pytest.mark.parametrize("patch", [
+    [{"op": "move", "path": "/x", "from": 5}],
+    [{"op": "copy", "path": "/x"}],
+    [{"op": "add", "path": 5, "value": 1}],
+    [{"op": "add", "path": "x", "value": 1}],
+    [{"op": "frobnicate", "path": "/x"}],
+    [{"path": "/x"}],
+    ["add"],
+    {"op": "add", "path": "/x", "value": 1},
+])
+def test_malformed_json_patch_raises_patch_error(patch):
+    with pytest.raises(PatchError):
+        patch_document(DATA, JSON_PATCH, patch)
+
+
+def test_merge_patch_keeps_other_fields():
+    new_json, changed, removed = patch_document(DATA, MERGE_PATCH, {"y": None, "z": "新"})
+    assert json.loads(new_json) == {"x": 0, "z": "新"}
+    assert changed == {"z": "新"}
+    assert removed == ["y"]
@@ -0,0 +1,343 @@
+"""
+上传文件的文本提取
+
+文件登记到项目后在后台提取逐页文本，供后续的字段提取、搜索使用：
+- PDF 用 pdfplumber 逐页读取，读完一页释放一页，几十 MB 的扫描件也不会整份载入内存
+- DOCX 流式解析 word/document.xml，按分页符切分页面
+- 没有文字层的扫描页（只有图片）标记为 needs_ocr，交给 OCR 阶段处理
+提取在进程池中执行，不占用 Web 进程的 CPU。
+结果按内容哈希 (sha256) 存放在 pagetext 表中，同样内容的文件（重复上传、多个项目共用）只提取一次。
+多个进程共用数据库时，提取记录带有持有进程和心跳（见 task_lease.py），
+启动时只重新排队持有者已经退出的提取，不重复执行其他进程正在进行的提取。
+"""
+
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, select
+
+from blob_store import BlobStore, FileBlob
+from task_lease import TaskLease
+
+try:
+    import pdfplumber
+except ImportError:
+    pdfplumber = None
+
+# 提取进程数
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "2"))
+# 单个文件的提取超时（秒）
+EXTRACT_TIMEOUT = float(os.environ.get("EXTRACT_TIMEOUT", "300"))
+
+EXTRACT_PENDING = "pending"
+EXTRACT_RUNNING = "running"
+EXTRACT_DONE = "done"
+EXTRACT_FAILED = "failed"
+EXTRACT_UNSUPPORTED = "unsupported"
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class TextExtraction(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    kind: str = "" # pdf / docx / image / other
+    status: str = EXTRACT_PENDING
+    pages: int = 0
+    # 有文字层的页数、需要 OCR 的页数
+    text_pages: int = 0
+    ocr_pages: int = 0
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+    # 执行提取的进程和心跳时间，见 task_lease.py
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+
+
+class PageText(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    page: int = Field(primary_key=True) # 从 1 开始
+    text: str = ""
+    source: str = "text" # text 为文字层，ocr 为识别结果
+    needs_ocr: bool = False
+
+
+def detect_kind(path: str) -> str:
+    """按文件内容判断类型，不依赖文件名"""
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    if b"%PDF-" in head:
+        return "pdf"
+    if head.startswith(b"PK"):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                if "word/document.xml" in zf.namelist():
+                    return "docx"
+        except zipfile.BadZipFile:
+            pass
+        return "other"
+    if head.startswith(b"\x89PNG") or head.startswith(b"\xff\xd8\xff") or head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "image"
+    return "other"
+
+
+def _extract_pdf(path: str) -> List[Tuple[str, bool]]:
+    if pdfplumber is None:
+        raise RuntimeError("pdfplumber 未安装，无法提取 PDF 文本")
+    pages = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            text = page.extract_text() or ""
+            needs_ocr = not text.strip() and bool(page.images)
+            pages.append((text, needs_ocr))
+            # 释放这一页解析出的对象
+            page.close()
+    return pages
+
+
+def _extract_docx(path: str) -> List[Tuple[str, bool]]:
+    pages: List[Tuple[str, bool]] = []
+    lines: List[str] = []
+    paragraph: List[str] = []
+
+    def break_page():
+        if paragraph:
+            lines.append("".join(paragraph))
+            paragraph.clear()
+        pages.append(("\n".join(lines), False))
+        lines.clear()
+
+    with zipfile.ZipFile(path) as zf, zf.open("word/document.xml") as f:
+        for _, elem in ElementTree.iterparse(f, events=("end",)):
+            tag = elem.tag
+            if tag == _W + "t":
+                paragraph.append(elem.text or "")
+            elif tag == _W + "tab":
+                paragraph.append("\t")
+            elif tag == _W + "lastRenderedPageBreak" or (tag == _W + "br" and elem.get(_W + "type") == "page"):
+                break_page()
+            elif tag == _W + "p":
+                lines.append("".join(paragraph))
+                paragraph.clear()
+                # 段落处理完即释放，整份文档不会驻留在内存里
+                elem.clear()
+    if lines or paragraph or not pages:
+        break_page()
+    return pages
+
+
+def extract_document(path: str, kind: str) -> List[Tuple[str, bool]]:
+    """在子进程中执行：返回每页的 (文本, 是否需要 OCR)"""
+    if kind == "pdf":
+        return _extract_pdf(path)
+    if kind == "docx":
+        return _extract_docx(path)
+    if kind == "image":
+        return [("", True)]
+    raise ValueError(f"Unsupported file type: {kind}")
+
+
+class TextExtractor:
+    """
+    调度文本提取：协调线程负责数据库读写，实际解析交给进程池。
+    文件从内容寻址存储中按哈希读取。
+    """
+
+    def __init__(self, engine, store: BlobStore, max_workers: int = EXTRACT_WORKERS, timeout: float = EXTRACT_TIMEOUT):
+        self.engine = engine
+        self.store = store
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extract")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        # 提取完成后的回调（如 OCR、搜索索引），参数为内容哈希
+        self.listeners = []
+        self.lease = TaskLease(
+            engine, TextExtraction, TextExtraction.sha256, (EXTRACT_PENDING, EXTRACT_RUNNING), name="文本提取",
+        )
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # 用 spawn 启动子进程，避免 fork 带上 Web 进程里的线程和数据库连接
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _terminate_pool(self, pool: Optional[ProcessPoolExecutor] = None):
+        """
+        结束进程池的全部子进程（超时的任务不能单独取消），下次使用时重建。
+        指定 pool 时只处理这个进程池，不动其他任务已经重建的新进程池
+        """
+        with self._pool_lock:
+            if pool is None:
+                pool = self._pool
+            if self._pool is pool:
+                self._pool = None
+        if pool is None:
+            return
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _extract(self, path: str, kind: str) -> List[Tuple[str, bool]]:
+        """
+        在进程池中提取。协调线程数与子进程数相同，任务提交后立即开始执行，超时从提交时算起即可。
+        超时的任务连同进程池一起结束；同一进程池里的其他任务因此失败时，在新的进程池中重试一次
+        """
+        for attempt in range(2):
+            pool = self._process_pool()
+            future = pool.submit(extract_document, path, kind)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                self._terminate_pool(pool)
+                raise RuntimeError(f"提取超过 {self.timeout:g} 秒")
+            except BrokenProcessPool:
+                # 子进程崩溃（如内存不足被杀），或其他任务超时时进程池被结束
+                self._terminate_pool(pool)
+                if attempt:
+                    raise RuntimeError("提取进程异常退出")
+
+    def _update(self, sha256: str, **fields):
+        with Session(self.engine) as session:
+            record = session.get(TextExtraction, sha256)
+            if record is None:
+                return
+            for key, value in fields.items():
+                setattr(record, key, value)
+            record.updated_at = datetime.now()
+            session.add(record)
+            session.commit()
+
+    def submit(self, sha256: str, force: bool = False) -> str:
+        """登记并排队提取；同样内容已经提取过（或正在提取）时直接返回现有状态"""
+        with Session(self.engine) as session:
+            record = session.get(TextExtraction, sha256)
+            if record is not None and not force:
+                return record.status
+            if record is None:
+                session.add(TextExtraction(sha256=sha256, **self.lease.stamp()))
+            else:
+                record.status = EXTRACT_PENDING
+                record.error = None
+                record.updated_at = datetime.now()
+                for key, value in self.lease.stamp().items():
+                    setattr(record, key, value)
+                session.add(record)
+            try:
+                session.commit()
+            except IntegrityError:
+                # 并发上传了同样的内容，另一个请求已经登记
+                return EXTRACT_PENDING
+        self._queue(sha256)
+        return EXTRACT_PENDING
+
+    def _queue(self, sha256: str):
+        self.lease.hold(sha256)
+        self._threads.submit(self._run, sha256)
+
+    def _run(self, sha256: str):
+        try:
+            self._extract_file(sha256)
+        finally:
+            self.lease.drop(sha256)
+
+    def _extract_file(self, sha256: str):
+        path = self.store.path_for(sha256)
+        try:
+            kind = detect_kind(path)
+            if kind == "other":
+                self._update(sha256, kind=kind, status=EXTRACT_UNSUPPORTED)
+                return
+            self._update(sha256, kind=kind, status=EXTRACT_RUNNING)
+
+            pages = self._extract(path, kind)
+
+            with Session(self.engine) as session:
+                session.execute(delete(PageText).where(PageText.sha256 == sha256))
+                for index, (text, needs_ocr) in enumerate(pages, start=1):
+                    session.add(PageText(sha256=sha256, page=index, text=text, needs_ocr=needs_ocr))
+                record = session.get(TextExtraction, sha256)
+                if record is None:
+                    # 提取期间文件已被删除
+                    session.rollback()
+                    return
+                record.status = EXTRACT_DONE
+                record.pages = len(pages)
+                record.text_pages = sum(1 for text, _ in pages if text.strip())
+                record.ocr_pages = sum(1 for _, needs_ocr in pages if needs_ocr)
+                record.error = None
+                record.updated_at = datetime.now()
+                session.add(record)
+                session.commit()
+        except Exception as e:
+            print(f"TextExtractor Error ({sha256[:12]}): {e}")
+            self._update(sha256, status=EXTRACT_FAILED, error=str(e) or type(e).__name__)
+            return
+        for listener in self.listeners:
+            try:
+                listener(sha256)
+            except Exception as e:
+                print(f"TextExtractor listener error: {e}")
+
+    def _requeue_orphans(self):
+        """重新排队持有者已经退出的提取（其他进程正在进行的不动）"""
+        for sha256 in self.lease.claim_stale(status=EXTRACT_PENDING, error=None, updated_at=datetime.now()):
+            self._queue(sha256)
+
+    def recover(self):
+        """
+        服务启动时：重新排队中断的提取，并补上还没有提取记录的文件（如升级前上传的）；
+        之后随心跳定期检查中断的提取
+        """
+        self._requeue_orphans()
+        with Session(self.engine) as session:
+            missing = list(session.exec(
+                select(FileBlob.sha256).where(FileBlob.sha256.not_in(select(TextExtraction.sha256)))
+            ).all())
+        for sha256 in missing:
+            self.submit(sha256)
+        self.lease.start(self._requeue_orphans)
+
+    def statuses(self, session: Session, sha256s: Iterable[str]) -> Dict[str, str]:
+        sha256s = list({sha for sha in sha256s if sha})
+        if not sha256s:
+            return {}
+        rows = session.exec(
+            select(TextExtraction.sha256, TextExtraction.status).where(TextExtraction.sha256.in_(sha256s))
+        ).all()
+        return dict(rows)
+
+    def pages(self, session: Session, sha256: str, page: Optional[int] = None) -> List[PageText]:
+        query = select(PageText).where(PageText.sha256 == sha256)
+        if page is not None:
+            query = query.where(PageText.page == page)
+        return list(session.exec(query.order_by(PageText.page)).all())
+
+    def forget(self, sha256s: Iterable[str]):
+        """文件内容被删除后清除其文本"""
+        sha256s = list(sha256s)
+        if not sha256s:
+            return
+        with Session(self.engine) as session:
+            session.execute(delete(PageText).where(PageText.sha256.in_(sha256s)))
+            session.execute(delete(TextExtraction).where(TextExtraction.sha256.in_(sha256s)))
+            session.commit()
+
+    def shutdown(self):
+        self.lease.stop()
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        self._terminate_pool()